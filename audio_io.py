@@ -0,0 +1,331 @@
+"""
+Audio loading shared by every stage.
+
+Analysis (feature detection, segmentation, clustering, fingerprints) runs on a mono
+signal resampled to one configurable analysis rate, using a fast resampler.
+Export and playback instead cut sample-accurate ranges straight from the file at its
+native rate and channel count. Segment boundaries are kept in seconds; a time t maps
+to sample round(t * sr) at either rate.
+
+Native audio is read through an AudioSource: a seekable reader that serves
+sample-accurate ranges from fixed-size blocks, with a small block cache and
+read-ahead of the next block, so export, playback and streamed analysis never hold
+more than a few blocks of the file whatever its size.
+
+With a memory budget set (configure(memory_budget=...), batch.py --max-memory),
+whole-file analysis signals are decoded block by block straight into int16 (see
+load_signal; kept on disk when even that would not fit the budget) and the
+frame-level analysis runs over bounded blocks (frame_blocks), so no full-length
+float32 copy or spectrogram is held.
+"""
+
+import importlib.util
+import logging
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import librosa
+import numpy as np
+import soundfile as sf
+
+DEFAULT_ANALYSIS_SR = 22050
+# soxr is much faster than librosa's older default resamplers; polyphase (scipy) is the fallback
+DEFAULT_RESAMPLER = "soxr_hq" if importlib.util.find_spec("soxr") else "polyphase"
+RESAMPLERS = ["soxr_vhq", "soxr_hq", "soxr_mq", "soxr_lq", "soxr_qq", "polyphase", "kaiser_fast", "kaiser_best"]
+
+SOURCE_BLOCK_SECONDS = 5.0  # native audio decoded at a time by an AudioSource
+SOURCE_CACHE_BYTES = 64 * 2 ** 20  # decoded blocks an AudioSource keeps (at least two)
+SIGNAL_BUDGET_FRACTION = 0.25  # low-memory analysis signals larger than this share of the budget live on disk
+INT16_SCALE = 32768.0
+SIZE_UNITS = {"": 1, "k": 2 ** 10, "m": 2 ** 20, "g": 2 ** 30, "t": 2 ** 40}
+
+logger = logging.getLogger(__name__)
+
+_analysis_sr = DEFAULT_ANALYSIS_SR
+_resampler = DEFAULT_RESAMPLER
+_memory_budget = None
+
+
+def parse_size(text):
+    """Parse a size such as '1G', '512M' or '2000000' into bytes."""
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([kmgt]?)i?b?\s*", str(text), re.IGNORECASE)
+    if not match:
+        raise ValueError(f"Invalid size '{text}', expected e.g. 512M or 1G")
+    number, unit = match.groups()
+    return int(float(number) * SIZE_UNITS[unit.lower()])
+
+
+def configure(analysis_sr=None, resampler=None, memory_budget=None):
+    """
+    Set the analysis sample rate and/or resampler used by load(), and optionally a
+    memory budget in bytes (or a size string like '1G') that enables low-memory mode.
+    """
+    global _analysis_sr, _resampler, _memory_budget
+    if analysis_sr is not None:
+        _analysis_sr = int(analysis_sr)
+    if resampler is not None:
+        if resampler not in RESAMPLERS:
+            raise ValueError(f"Unknown resampler '{resampler}', expected one of {RESAMPLERS}")
+        _resampler = resampler
+    if memory_budget is not None:
+        _memory_budget = parse_size(memory_budget)
+
+
+def analysis_rate():
+    return _analysis_sr
+
+
+def settings():
+    """The current configuration as configure() keyword arguments, e.g. to set up worker processes."""
+    return {"analysis_sr": _analysis_sr, "resampler": _resampler, "memory_budget": _memory_budget}
+
+
+def memory_budget():
+    """The configured memory budget in bytes, or None."""
+    return _memory_budget
+
+
+def low_memory():
+    return _memory_budget is not None
+
+
+def load(audio_file, offset=0.0, duration=None):
+    """Load (part of) a file as mono float32 at the analysis rate. Returns (y, sr)."""
+    return librosa.load(audio_file, sr=_analysis_sr, res_type=_resampler, offset=offset, duration=duration)
+
+
+def load_channels(audio_file):
+    """
+    Load a whole file with its channels kept, in one decode, at the analysis rate.
+    Returns (y, sr) with y of shape (channels, samples), float32 (also for mono files).
+    """
+    y, sr = librosa.load(audio_file, sr=_analysis_sr, res_type=_resampler, mono=False)
+    return np.atleast_2d(y), sr
+
+
+def load_signal(audio_file):
+    """
+    Load a whole file for analysis. Normally the same as load(); in low-memory mode the
+    file is decoded, downmixed and resampled block by block into an int16 array, half
+    the size of float32 and never held twice. If even that would take more than
+    SIGNAL_BUDGET_FRACTION of the budget, the array is a memory map over an unlinked
+    temporary file, paged in by the OS as slices are used. Callers pass slices through
+    as_float().
+    """
+    if not low_memory():
+        return load(audio_file)
+    try:
+        source = AudioSource(audio_file)
+    except RuntimeError:  # not readable by soundfile (e.g. mp3): decode in one go
+        y, sr = load(audio_file)
+        return to_int16(y), sr
+
+    with source:
+        if not source.can_stream():
+            y, sr = load(audio_file)
+            return to_int16(y), sr
+        y = _signal_buffer(int(np.ceil(source.frames * _analysis_sr / source.samplerate)) + 1)
+        n = 0
+        for mono in source.analysis_blocks():
+            y[n:n + len(mono)] = to_int16(mono)
+            n += len(mono)
+    return y[:n], _analysis_sr
+
+
+def _signal_buffer(n_samples):
+    if n_samples * 2 > _memory_budget * SIGNAL_BUDGET_FRACTION:
+        logger.info(f"Analysis signal ({n_samples * 2 / 2 ** 20:.0f} MB) exceeds its memory share, keeping it on disk")
+        return np.memmap(tempfile.TemporaryFile(), dtype=np.int16, mode="w+", shape=(n_samples,))
+    return np.empty(n_samples, dtype=np.int16)
+
+
+def to_int16(y):
+    """Quantise a float signal in [-1, 1] to int16 (clipping anything outside)."""
+    return np.clip(np.round(y * INT16_SCALE), -INT16_SCALE, INT16_SCALE - 1).astype(np.int16)
+
+
+def as_float(y):
+    """float32 view of a signal or slice stored as float32 or int16."""
+    if y.dtype == np.int16:
+        return y.astype(np.float32) / INT16_SCALE
+    return y
+
+
+def frame_blocks(n_samples, sr, hop_length, block_duration, overlap_duration):
+    """
+    Split a signal of n_samples on the frame grid into blocks that each own a contiguous
+    range of frames plus overlap_duration of extra context on both sides.
+    Yields (own_start, own_end, sample_start, sample_end): frames [own_start:own_end] of the
+    block's analysis (relative to its first frame) belong to it, the rest are overlap.
+    """
+    n_frames = 1 + n_samples // hop_length
+    block_frames = max(1, int(block_duration * sr) // hop_length)
+    overlap_frames = int(np.ceil(overlap_duration * sr / hop_length))
+    for own_start in range(0, n_frames, block_frames):
+        own_end = min(own_start + block_frames, n_frames)
+        read_start = max(own_start - overlap_frames, 0)
+        read_end = min(own_end + overlap_frames, n_frames)
+        yield (own_start - read_start, own_end - read_start,
+               read_start * hop_length, min(read_end * hop_length, n_samples))
+
+
+def time_to_sample(t, sr):
+    """Sample index of time t (seconds) at rate sr."""
+    return int(round(t * sr))
+
+
+def native_info(audio_file):
+    """soundfile info (samplerate, channels, frames, subtype) of the file as stored."""
+    return sf.info(audio_file)
+
+
+def read_native(audio_file, start, end):
+    """
+    Read the samples between start and end seconds at the file's native rate,
+    keeping all channels. Returns (data, native_sr); data is (frames, channels).
+    """
+    info = sf.info(audio_file)
+    first = min(time_to_sample(start, info.samplerate), info.frames)
+    last = min(max(time_to_sample(end, info.samplerate), first), info.frames)
+    data, sr = sf.read(audio_file, start=first, stop=last, dtype="float32", always_2d=True)
+    return data, sr
+
+
+class AudioSource:
+    """
+    Seekable, block-cached reader over a soundfile-readable file.
+
+    The file is decoded in blocks of block_duration seconds (float32, all channels at the
+    native rate). Recently used blocks stay in an LRU cache of about cache_size bytes,
+    and whenever a block is used the next one is decoded on a background thread, so
+    sequential reads (streamed analysis, exporting segments in order) overlap decoding
+    with the caller's work. Memory use is bounded by the cache, not the file.
+    A source is meant to be used from one thread at a time; close it (or use it as a
+    context manager) when done.
+    """
+
+    def __init__(self, audio_file, block_duration=SOURCE_BLOCK_SECONDS, cache_size=None, read_ahead=True):
+        self.audio_file = audio_file
+        self._file = sf.SoundFile(audio_file)
+        self.samplerate = self._file.samplerate
+        self.channels = self._file.channels
+        self.frames = self._file.frames
+        self.subtype = self._file.subtype
+        self.block_frames = max(1, int(block_duration * self.samplerate))
+        if cache_size is None:
+            cache_size = SOURCE_CACHE_BYTES if _memory_budget is None else min(SOURCE_CACHE_BYTES, _memory_budget // 16)
+        self.cache_blocks = max(2, int(cache_size) // (self.block_frames * self.channels * 4))
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()  # block index -> (frames, channels) array
+        self._pending = {}  # block index -> future of a read-ahead
+        self._lock = threading.Lock()  # the SoundFile is shared with the read-ahead thread
+        self._executor = ThreadPoolExecutor(max_workers=1) if read_ahead else None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+        self._cache.clear()
+        self._pending.clear()
+        self._file.close()
+
+    @property
+    def duration(self):
+        return self.frames / self.samplerate
+
+    def _decode(self, index):
+        with self._lock:
+            self._file.seek(index * self.block_frames)
+            return self._file.read(self.block_frames, dtype="float32", always_2d=True)
+
+    def _block(self, index):
+        block = self._cache.get(index)
+        if block is not None:
+            self._cache.move_to_end(index)
+            self.hits += 1
+        else:
+            future = self._pending.pop(index, None)
+            if future is not None:
+                block = future.result()
+                self.hits += 1
+            else:
+                block = self._decode(index)
+                self.misses += 1
+            self._cache[index] = block
+            while len(self._cache) > self.cache_blocks:
+                self._cache.popitem(last=False)
+
+        following = index + 1
+        if self._executor is not None and following * self.block_frames < self.frames \
+                and following not in self._cache and following not in self._pending:
+            for stale in self._pending.values():  # the reader moved elsewhere
+                stale.cancel()
+            self._pending = {following: self._executor.submit(self._decode, following)}
+        return block
+
+    def read(self, start, stop):
+        """Frames [start:stop) (clipped to the file) as a (frames, channels) float32 array."""
+        start = min(max(int(start), 0), self.frames)
+        stop = min(max(int(stop), start), self.frames)
+        data = np.empty((stop - start, self.channels), dtype=np.float32)
+        position = start
+        while position < stop:
+            index = position // self.block_frames
+            block = self._block(index)
+            offset = position - index * self.block_frames
+            n = min(stop - position, len(block) - offset)
+            if n <= 0:  # the header overstated the length
+                return data[:position - start]
+            data[position - start:position - start + n] = block[offset:offset + n]
+            position += n
+        return data
+
+    def read_time(self, start, end):
+        """The samples between start and end seconds, like read_native(). Returns (data, native_sr)."""
+        return self.read(time_to_sample(start, self.samplerate), time_to_sample(end, self.samplerate)), self.samplerate
+
+    def blocks(self, start=0, stop=None):
+        """Yield (first_frame, data) for consecutive blocks covering frames [start:stop)."""
+        stop = self.frames if stop is None else min(stop, self.frames)
+        for first in range(start, stop, self.block_frames):
+            data = self.read(first, min(first + self.block_frames, stop))
+            if not len(data):
+                return
+            yield first, data
+
+    def can_stream(self):
+        """Whether analysis_blocks() can resample this file (same rate, or a soxr resampler)."""
+        return self.samplerate == _analysis_sr or (
+            _resampler.startswith("soxr") and importlib.util.find_spec("soxr") is not None)
+
+    def analysis_blocks(self):
+        """
+        Yield the whole file as consecutive mono float32 blocks at the analysis rate.
+        Resampling is streamed (soxr), so the concatenated blocks equal resampling the
+        whole signal at once. Requires can_stream().
+        """
+        stream = None
+        if self.samplerate != _analysis_sr:
+            import soxr
+            stream = soxr.ResampleStream(self.samplerate, _analysis_sr, 1, dtype="float32",
+                                         quality=_resampler.split("_")[1].upper())
+        for first, data in self.blocks():
+            mono = to_mono(data)
+            if stream is not None:
+                mono = stream.resample_chunk(mono, last=first + len(data) >= self.frames)
+            yield mono
+
+
+def to_mono(data):
+    """Average the channels of a (frames, channels) block."""
+    return np.mean(data, axis=1) if data.ndim == 2 else data
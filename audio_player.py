@@ -1,14 +1,27 @@
-import pygame
 import numpy as np
-import librosa
 from threading import Thread
 import io
+import logging
 import soundfile as sf
+import audio_io
+
+logger = logging.getLogger(__name__)
 
 class AudioPlayer:
     def __init__(self):
-        pygame.mixer.init(frequency=44100)
+        # pygame is imported and the mixer started on first playback, not at startup
+        self.mixer = None
         self.currently_playing = None
+        # Kept open between plays: segments of the same file are served from its block cache
+        self.source = None
+
+    def _music(self):
+        """Return pygame's music player, initialising the mixer on first use"""
+        if self.mixer is None:
+            import pygame
+            pygame.mixer.init(frequency=44100)
+            self.mixer = pygame.mixer
+        return self.mixer.music
         
     def play_segment(self, audio_file, start_time, end_time):
         """
@@ -18,28 +31,36 @@ class AudioPlayer:
             self.stop()
             
         try:
-            # Load just the segment we need
-            y, sr = librosa.load(audio_file, offset=start_time, duration=(end_time - start_time))
+            # Read just the segment we need, at the file's native rate and channels
+            y, sr = self._source(audio_file).read_time(start_time, end_time)
             
             # Convert to 16-bit PCM WAV
             buffer = io.BytesIO()
-            sf.write(buffer, y, sr, format='WAV')
+            sf.write(buffer, y, sr, format='WAV', subtype='PCM_16')
             buffer.seek(0)
             
             # Play using pygame
-            pygame.mixer.music.load(buffer)
-            pygame.mixer.music.play()
+            music = self._music()
+            music.load(buffer)
+            music.play()
             self.currently_playing = (start_time, end_time)
             
         except Exception as e:
-            print(f"Error playing segment: {e}")
+            logger.error(f"Error playing segment: {e}")
     
+    def _source(self, audio_file):
+        if self.source is None or self.source.audio_file != audio_file:
+            if self.source is not None:
+                self.source.close()
+            self.source = audio_io.AudioSource(audio_file)
+        return self.source
+
     def stop(self):
         """Stop current playback"""
-        if pygame.mixer.music.get_busy():
-            pygame.mixer.music.stop()
+        if self.mixer is not None and self.mixer.music.get_busy():
+            self.mixer.music.stop()
         self.currently_playing = None
     
     def is_playing(self):
         """Check if audio is currently playing"""
-        return pygame.mixer.music.get_busy() 
\ No newline at end of file
+        return self.mixer is not None and self.mixer.music.get_busy()
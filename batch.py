@@ -0,0 +1,347 @@
+"""
+Command-line batch processing.
+
+    python batch.py process FILE [FILE ...] [--method onsets] [--clusters 10] [--library DIR]
+    python batch.py cluster-corpus --library DIR --clusters 50 --model-out library_model.npz
+    python batch.py library-approximate --library DIR [--lists 1000] [--above 0] [--probes 8]
+    python batch.py serve --port 8765 --workers 4
+    python batch.py watch DIR [DIR ...] --workers 4 --manifest watch_manifest.json
+    python batch.py dataset FILE [FILE ...] --out train_set --window 1.0 --clusters 16
+    python batch.py pack FILE [FILE ...] --out pack.npz --clusters 16
+    python batch.py queue-init QUEUE_DIR FILE [FILE ...] --clusters 8
+    python batch.py queue-work QUEUE_DIR --workers 4
+    python batch.py queue-merge QUEUE_DIR --out merged_manifest.json
+
+`process` runs the detect -> segment -> cluster -> export pipeline on each file.
+With --library, segments already present in the library index are skipped and the
+exported ones are added to it. `cluster-corpus` clusters every segment in a library
+index out-of-core and saves a cluster model that `process --model` (or the GUI's
+"Load cluster model") can assign new files to. `library-approximate` trains the
+coarse quantiser of a library index, so that its duplicate lookups scan a few
+inverted lists instead of the whole library. `serve` runs the pipeline behind a
+local HTTP job server (see server.py), `watch` ingests files dropped into folders
+(see watch.py), and `dataset` writes the segments of many files as memory-mappable
+training arrays (see dataset.py). `pack` analyses a sample pack of many short files in
+stacks and dedups and clusters it as a whole (see sample_pack.py). The queue-* commands spread a batch over several
+hosts through a work queue on a shared filesystem (see work_queue.py).
+"""
+
+import argparse
+import logging
+import os
+import sys
+
+import audio_io
+from instrumentation import add_sink, stage, peak_rss_mb, LoggingSink, JsonLinesSink
+from manifest import BatchManifest
+
+CHANNEL_MODES = ["mix", "union", "intersection", "per-channel"]  # as segmentation.CHANNEL_MODES
+
+METHODS = {
+    "beats": "By Beats",
+    "transients": "By Transients",
+    "frequency": "By Frequency Range",
+    "onsets": "By Onsets",
+}
+
+
+# process options that change a file's results; a manifest entry recorded with other values is redone
+RESULT_SETTINGS = ["method", "min_time", "max_time", "similarity", "min_freq", "max_freq", "clusters", "model",
+                   "output_dir", "beat_window", "coarse_onsets", "channels", "analysis_rate", "resampler"]
+
+
+def pipeline_options(args):
+    """process_file keyword arguments from the shared pipeline flags."""
+    return dict(
+        method=METHODS[args.method],
+        min_time=args.min_time,
+        max_time=args.max_time,
+        similarity_threshold=args.similarity,
+        min_freq=args.min_freq,
+        max_freq=args.max_freq,
+        n_clusters=args.clusters,
+        output_root=args.output_dir,
+        n_jobs=args.jobs,
+        beat_window=args.beat_window,
+        coarse_onsets=args.coarse_onsets,
+        channel_mode=args.channels,
+    )
+
+
+def process_command(args):
+    from pipeline import process_file, process_file_checkpointed
+    from clustering import ClusterModel
+    from similarity_index import SimilarityIndex
+
+    cluster_model = ClusterModel.load(args.model) if args.model else None
+    library_index = SimilarityIndex(args.library) if args.library else None
+    manifest = BatchManifest(args.manifest, max_attempts=args.max_attempts) if args.manifest else None
+    settings = {name: getattr(args, name) for name in RESULT_SETTINGS}
+    options = dict(pipeline_options(args), cluster_model=cluster_model, library_index=library_index)
+    failed = []
+    for audio_file in args.files:
+        print(f"\n=== {audio_file} ===")
+        with stage("process_file", audio_file=audio_file):
+            if manifest is None:
+                process_file(audio_file, **options)
+                continue
+            try:
+                process_file_checkpointed(audio_file, manifest, settings, **options)
+            except Exception as e:
+                # Recorded in the manifest; carry on with the other files
+                logging.error(f"Failed to process {audio_file}: {type(e).__name__}: {e}")
+                failed.append(audio_file)
+
+    if manifest is not None:
+        manifest.save()  # fold the journal into the manifest file
+        counts = ", ".join(f"{count} {status}" for status, count in sorted(manifest.summary().items()))
+        print(f"\nManifest {args.manifest}: {counts}")
+
+    peak = peak_rss_mb()
+    budget = audio_io.memory_budget()
+    if peak is not None:
+        print(f"\nPeak RSS: {peak:.0f} MB")
+        if budget is not None and peak * 2 ** 20 > budget:
+            logging.warning(f"Peak RSS exceeded the memory budget of {budget / 2 ** 20:.0f} MB")
+    if failed:
+        sys.exit(1)
+
+
+def cluster_corpus_command(args):
+    from clustering import cluster_corpus
+    from similarity_index import SimilarityIndex
+
+    index = SimilarityIndex(args.library)
+    model, _ = cluster_corpus(index, n_clusters=args.clusters, batch_size=args.batch_size, n_epochs=args.epochs)
+    model.save(args.model_out)
+    print(f"Saved cluster model to {args.model_out}")
+
+
+def library_approximate_command(args):
+    from similarity_index import SimilarityIndex
+
+    index = SimilarityIndex(args.library)
+    if len(index) == 0:
+        sys.exit(f"The library index at {args.library} is empty")
+    index.build_approximate(n_lists=args.lists, above=args.above, n_probe=args.probes)
+    print(f"Built {index.meta['ivf_lists']} inverted lists over {len(index)} segments; queries are approximate "
+          f"above {args.above} segments, scanning {args.probes} lists")
+
+
+def serve_command(args):
+    from server import serve
+
+    serve(host=args.host, port=args.port, workers=args.workers, max_queue=args.max_queue)
+
+
+def watch_command(args):
+    from watch import FolderWatcher
+
+    for directory in args.directories:
+        if not os.path.isdir(directory):
+            sys.exit(f"Not a directory: {directory}")
+    manifest = BatchManifest(args.manifest, max_attempts=args.max_attempts)
+    settings = {name: getattr(args, name) for name in RESULT_SETTINGS}
+    watcher = FolderWatcher(args.directories, manifest, settings, pipeline_options(args), model_path=args.model,
+                            workers=args.workers, settle=args.settle, poll_interval=args.poll_interval,
+                            recursive=args.recursive, stats_path=args.stats, stats_interval=args.stats_interval)
+    watcher.run(until_idle=args.once)
+
+
+def dataset_command(args):
+    from clustering import ClusterModel
+    from dataset import export_dataset
+
+    options = pipeline_options(args)
+    for name in ("n_clusters", "output_root"):
+        del options[name]
+    cluster_model = ClusterModel.load(args.model) if args.model else None
+    schema = export_dataset(args.files, args.out, window=args.window, window_dtype=args.window_dtype,
+                            n_clusters=args.clusters, cluster_model=cluster_model, **options)
+    print(f"Wrote {schema['n_segments']} segments to {args.out}")
+
+
+def pack_command(args):
+    from clustering import ClusterModel
+    from sample_pack import analyse_pack, save_pack
+
+    cluster_model = ClusterModel.load(args.model) if args.model else None
+    result = analyse_pack(args.files, similarity_threshold=args.similarity, n_clusters=args.clusters,
+                          cluster_model=cluster_model, n_jobs=args.jobs)
+    save_pack(args.out, result)
+    n_unique = int((result["duplicate_of"] < 0).sum())
+    print(f"Wrote {len(result['files'])} files ({n_unique} unique) to {args.out}")
+
+
+def queue_init_command(args):
+    from work_queue import init_queue
+
+    options = pipeline_options(args)
+    del options["n_jobs"]
+    settings = {name: getattr(args, name) for name in RESULT_SETTINGS}
+    added = init_queue(args.queue, args.files, settings, options, model_path=args.model,
+                       lease_seconds=args.lease, max_attempts=args.max_attempts)
+    print(f"Added {added} files to {args.queue}")
+
+
+def queue_work_command(args):
+    from work_queue import run_workers, WorkQueue
+
+    exit_codes = run_workers(args.queue, workers=args.workers, worker_id=args.worker_id, n_jobs=args.jobs,
+                             poll_interval=args.poll_interval)
+    counts = ", ".join(f"{count} {status}" for status, count in WorkQueue(args.queue).status().items())
+    print(f"Queue {args.queue}: {counts}")
+    if any(exit_codes):
+        sys.exit(1)
+
+
+def queue_merge_command(args):
+    from work_queue import merge_manifests
+
+    merged = merge_manifests(args.queue, args.out)
+    counts = ", ".join(f"{count} {status}" for status, count in sorted(merged.summary().items()))
+    print(f"Merged manifest {args.out}: {counts}")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Batch audio segmentation")
+    parser.add_argument("--verbose", "-v", action="store_true", help="Log per-segment details")
+    parser.add_argument("--timings", action="store_true", help="Log wall/CPU time, peak RSS and counts per stage")
+    parser.add_argument("--metrics", default=None, help="Append per-stage records to this JSON lines file")
+    parser.add_argument("--analysis-rate", type=int, default=None,
+                        help="Sample rate analysis runs at (default 22050; exports keep the native rate)")
+    parser.add_argument("--resampler", default=None, help="Resampler for analysis loading (default soxr_hq)")
+    parser.add_argument("--max-memory", default=None,
+                        help="Memory budget such as 1G: holds audio as int16 and analyses it in bounded blocks")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    # Pipeline flags shared by process and watch
+    pipeline_flags = argparse.ArgumentParser(add_help=False)
+    pipeline_flags.add_argument("--method", choices=sorted(METHODS), default="onsets")
+    pipeline_flags.add_argument("--min-time", type=float, default=0.1, help="Minimum segment duration (s)")
+    pipeline_flags.add_argument("--max-time", type=float, default=30.0, help="Maximum segment duration (s)")
+    pipeline_flags.add_argument("--similarity", type=float, default=0.85, help="Similarity threshold")
+    pipeline_flags.add_argument("--min-freq", type=float, default=100, help="Lower band edge for --method frequency")
+    pipeline_flags.add_argument("--max-freq", type=float, default=5000, help="Upper band edge for --method frequency")
+    pipeline_flags.add_argument("--clusters", type=int, default=None, help="Cluster each file into this many groups")
+    pipeline_flags.add_argument("--model", default=None, help="Assign segments to the clusters of a saved model")
+    pipeline_flags.add_argument("--output-dir", default=None, help="Where to create the <name>_segmented folders")
+    pipeline_flags.add_argument("--jobs", type=int, default=1,
+                                help="Worker processes for feature detection (-1: all cores)")
+    pipeline_flags.add_argument("--beat-window", type=float, default=None,
+                                help="Track beats in windows of this many seconds with a local tempo "
+                                     "(long/drifting sets)")
+    pipeline_flags.add_argument("--coarse-onsets", action="store_true",
+                                help="Compute the onset envelope only around candidates from a cheap coarse pass "
+                                     "(faster on sparse material)")
+    pipeline_flags.add_argument("--channels", choices=CHANNEL_MODES, default="mix",
+                                help="mix: analyse a mono mixdown; union/intersection/per-channel: analyse every "
+                                     "channel (one decode) and combine their segment boundaries")
+    pipeline_flags.add_argument("--max-attempts", type=int, default=3,
+                                help="With a manifest: quarantine a file after this many unfinished attempts")
+
+    process = subparsers.add_parser("process", parents=[pipeline_flags], help="Segment, cluster and export audio files")
+    process.add_argument("files", nargs="+", help="WAV files to process")
+    process.add_argument("--library", default=None, help="Library index directory for cross-file dedup")
+    process.add_argument("--manifest", default=None,
+                         help="Progress manifest (JSON); re-running with it skips finished files and stages")
+    process.set_defaults(func=process_command)
+
+    watch = subparsers.add_parser("watch", parents=[pipeline_flags], help="Process audio files dropped into folders")
+    watch.add_argument("directories", nargs="+", help="Folders to watch")
+    watch.add_argument("--manifest", default="watch_manifest.json", help="Progress manifest (JSON)")
+    watch.add_argument("--workers", type=int, default=2, help="Pipeline worker processes")
+    watch.add_argument("--settle", type=float, default=2.0,
+                       help="Seconds a file's size and mtime must stay unchanged before it is processed")
+    watch.add_argument("--poll-interval", type=float, default=1.0, help="Seconds between folder scans")
+    watch.add_argument("--recursive", action="store_true", help="Also watch subfolders")
+    watch.add_argument("--stats", default=None, help="Keep throughput and queue metrics in this JSON file")
+    watch.add_argument("--stats-interval", type=float, default=30.0, help="Seconds between metric reports")
+    watch.add_argument("--once", action="store_true", help="Exit when everything found has been processed")
+    watch.set_defaults(func=watch_command)
+
+    dataset = subparsers.add_parser("dataset", parents=[pipeline_flags],
+                                    help="Write segments of audio files as memory-mappable training arrays")
+    dataset.add_argument("files", nargs="+", help="Audio files to include")
+    dataset.add_argument("--out", required=True, help="Dataset directory")
+    dataset.add_argument("--window", type=float, default=None,
+                         help="Also store each segment's first N seconds of audio, zero-padded to N")
+    dataset.add_argument("--window-dtype", choices=["float32", "int16"], default="float32")
+    dataset.set_defaults(func=dataset_command)
+
+    pack = subparsers.add_parser("pack", help="Analyse, dedup and cluster a pack of short files in stacks")
+    pack.add_argument("files", nargs="+", help="Audio files (one-shots, loops)")
+    pack.add_argument("--out", required=True, help="Result file (.npz)")
+    pack.add_argument("--similarity", type=float, default=0.85, help="Files more similar than this are duplicates")
+    pack.add_argument("--clusters", type=int, default=None, help="Cluster the unique files into this many groups")
+    pack.add_argument("--model", default=None, help="Assign files to the clusters of a saved model")
+    pack.add_argument("--jobs", type=int, default=None, help="Decoding threads")
+    pack.set_defaults(func=pack_command)
+
+    queue_init = subparsers.add_parser("queue-init", parents=[pipeline_flags],
+                                       help="Create a shared work queue of files for queue-work on several hosts")
+    queue_init.add_argument("queue", help="Queue directory on a filesystem every host can reach")
+    queue_init.add_argument("files", nargs="+", help="Audio files to process (paths valid on every host)")
+    queue_init.add_argument("--lease", type=float, default=300.0,
+                            help="Seconds before a task held by an unresponsive worker is taken over")
+    queue_init.set_defaults(func=queue_init_command)
+
+    queue_work = subparsers.add_parser("queue-work", help="Process files from a shared work queue until it is drained")
+    queue_work.add_argument("queue", help="Queue directory")
+    queue_work.add_argument("--workers", type=int, default=1, help="Worker processes on this host")
+    queue_work.add_argument("--worker-id", default=None, help="Shard name prefix (default: host-pid)")
+    queue_work.add_argument("--jobs", type=int, default=1, help="Feature detection processes per worker")
+    queue_work.add_argument("--poll-interval", type=float, default=5.0,
+                            help="Seconds between looks at the queue while other workers hold the remaining tasks")
+    queue_work.set_defaults(func=queue_work_command)
+
+    queue_merge = subparsers.add_parser("queue-merge", help="Combine the per-worker manifests of a queue")
+    queue_merge.add_argument("queue", help="Queue directory")
+    queue_merge.add_argument("--out", required=True, help="Merged manifest (JSON)")
+    queue_merge.set_defaults(func=queue_merge_command)
+
+    corpus = subparsers.add_parser("cluster-corpus", help="Cluster every segment of a library index")
+    corpus.add_argument("--library", required=True, help="Library index directory")
+    corpus.add_argument("--clusters", type=int, default=10)
+    corpus.add_argument("--batch-size", type=int, default=10000)
+    corpus.add_argument("--epochs", type=int, default=3, help="Streaming passes over the library")
+    corpus.add_argument("--model-out", default="library_model.npz")
+    corpus.set_defaults(func=cluster_corpus_command)
+
+    approximate = subparsers.add_parser("library-approximate",
+                                        help="Train approximate (IVF) duplicate lookups for a library index")
+    approximate.add_argument("--library", required=True, help="Library index directory")
+    approximate.add_argument("--lists", type=int, default=None, help="Inverted lists (default sqrt(segments))")
+    approximate.add_argument("--above", type=int, default=0,
+                             help="Use approximate lookups while the library has more than this many segments")
+    approximate.add_argument("--probes", type=int, default=8, help="Lists scanned per lookup (more: better recall)")
+    approximate.set_defaults(func=library_approximate_command)
+
+    server = subparsers.add_parser("serve", help="Run a local HTTP job server for the pipeline")
+    server.add_argument("--host", default="127.0.0.1")
+    server.add_argument("--port", type=int, default=8765)
+    server.add_argument("--workers", type=int, default=2, help="Pipeline worker processes")
+    server.add_argument("--max-queue", type=int, default=16, help="Queued + running jobs before new ones get 503")
+    server.set_defaults(func=serve_command)
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO, format="%(message)s")
+
+    try:
+        audio_io.configure(analysis_sr=args.analysis_rate, resampler=args.resampler, memory_budget=args.max_memory)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.timings:
+        add_sink(LoggingSink())
+    if args.metrics:
+        add_sink(JsonLinesSink(args.metrics))
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
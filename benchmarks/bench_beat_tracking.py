@@ -0,0 +1,88 @@
+"""
+Windowed vs global beat tracking on a click track whose tempo drifts.
+
+    python benchmarks/bench_beat_tracking.py --duration 3600 --window 60 --jobs 4
+
+The synthetic clicks accelerate linearly from --start-bpm to --end-bpm, so the true
+beat times are known. Both trackers run on the same onset envelope; the script
+reports run time and the precision/recall of their beats (within 50 ms of a click)
+and exits non-zero if the windowed tracker scores below --min-f1.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import librosa
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from feature_detection import track_beats_windowed  # noqa: E402
+from synthetic import SR  # noqa: E402
+
+HIT_TOLERANCE = 0.05
+
+
+def drifting_clicks(duration, start_bpm, end_bpm, sr=SR, seed=0):
+    """Decaying noise clicks on beats whose tempo moves linearly from start_bpm to end_bpm."""
+    beat_times = []
+    t = 0.0
+    while t < duration:
+        beat_times.append(t)
+        t += 60.0 / (start_bpm + (end_bpm - start_bpm) * t / duration)
+    click = np.exp(-np.linspace(0, 10, 400)) * np.random.default_rng(seed).standard_normal(400)
+    y = np.zeros(int(duration * sr), dtype=np.float32)
+    for beat in beat_times:
+        i = int(beat * sr)
+        y[i:i + len(click)] += click[:len(y) - i]
+    return y, np.array(beat_times)
+
+
+def score(beat_frames, truth, sr=SR):
+    """(precision, recall) of tracked beats against the true beat times."""
+    beats = librosa.frames_to_time(beat_frames, sr=sr)
+    if len(beats) == 0:
+        return 0.0, 0.0
+    precision = np.mean(np.abs(beats[:, None] - truth[None, :]).min(axis=1) < HIT_TOLERANCE)
+    recall = np.mean(np.abs(truth[:, None] - beats[None, :]).min(axis=1) < HIT_TOLERANCE)
+    return precision, recall
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Windowed beat tracking benchmark")
+    parser.add_argument("--duration", type=float, default=1200)
+    parser.add_argument("--start-bpm", type=float, default=100)
+    parser.add_argument("--end-bpm", type=float, default=140)
+    parser.add_argument("--window", type=float, default=60, help="Beat window length in seconds")
+    parser.add_argument("--jobs", type=int, default=1)
+    parser.add_argument("--min-f1", type=float, default=0.95)
+    args = parser.parse_args(argv)
+
+    y, truth = drifting_clicks(args.duration, args.start_bpm, args.end_bpm)
+    onset_env = librosa.onset.onset_strength(y=y, sr=SR)
+
+    start = time.perf_counter()
+    _, global_beats = librosa.beat.beat_track(onset_envelope=onset_env, sr=SR)
+    global_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    (_, bpm), windowed_beats = track_beats_windowed(onset_env, SR, args.window, n_jobs=args.jobs)
+    windowed_seconds = time.perf_counter() - start
+
+    f1 = 0.0
+    for label, beats, seconds in (("global", global_beats, global_seconds),
+                                  ("windowed", windowed_beats, windowed_seconds)):
+        precision, recall = score(beats, truth)
+        f1 = 2 * precision * recall / max(precision + recall, 1e-9)
+        print(f"{label:9s} {seconds:7.2f}s  precision {precision:.3f}  recall {recall:.3f}  F1 {f1:.3f}")
+    print(f"Tempo curve: {bpm[0]:.1f} -> {bpm[-1]:.1f} BPM over {len(bpm)} windows")
+
+    if f1 < args.min_f1:
+        print(f"Windowed tracker F1 below {args.min_f1}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
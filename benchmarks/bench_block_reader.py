@@ -0,0 +1,100 @@
+"""
+Block reader check: peak RSS of the full pipeline on long multichannel files.
+
+    python benchmarks/bench_block_reader.py --durations 300 1200 --channels 6 --max-memory 256M
+
+Writes synthetic 48 kHz 24-bit multichannel files of each duration (in a child
+process, a minute at a time), then runs detection, segmentation, dedup, export and
+the waveform overview on each in a fresh interpreter under the memory budget, and
+reports peak RSS next to the file size. Every exported segment is compared with the
+same range read directly with soundfile. The script exits non-zero if a segment
+differs or if peak RSS grows by more than --max-growth between the shortest and the
+longest file.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+REPO = os.path.join(BENCHMARKS, "..")
+NATIVE_SR = 48000
+
+WRITE_SNIPPET = """
+import sys
+import numpy as np
+import soundfile as sf
+from synthetic import SIGNALS
+path, signal, duration, sr, channels = sys.argv[1], sys.argv[2], float(sys.argv[3]), int(sys.argv[4]), int(sys.argv[5])
+with sf.SoundFile(path, "w", samplerate=sr, channels=channels, subtype="PCM_24") as f:
+    for i, start in enumerate(np.arange(0, duration, 60.0)):
+        mono = 0.5 * SIGNALS[signal](min(60.0, duration - start), sr=sr, seed=i)
+        f.write(np.stack([np.roll(mono, 7 * c) for c in range(channels)], axis=1))
+"""
+
+SNIPPET = """
+import json, os, sys
+import numpy as np
+import soundfile as sf
+import audio_io
+from instrumentation import peak_rss_mb
+from pipeline import segment_file
+from utils import chop_audio_with_metadata, EXPORTED_SEGMENT
+from visualization import waveform_overview
+audio_file, budget, output_root = sys.argv[1], sys.argv[2], sys.argv[3]
+audio_io.configure(memory_budget=budget)
+segments, _ = segment_file(audio_file, similarity_threshold=1.01)  # keep near-repeats: more to export
+output_dir = chop_audio_with_metadata(audio_file, segments, output_root=output_root)
+waveform_overview(audio_file)
+mismatched = 0
+for name in os.listdir(output_dir):
+    start, end = segments[int(EXPORTED_SEGMENT.match(name).group(1)) - 1]
+    exported, sr = sf.read(os.path.join(output_dir, name), dtype="float32", always_2d=True)
+    direct, _ = sf.read(audio_file, start=round(start * sr), stop=round(end * sr), dtype="float32", always_2d=True)
+    mismatched += not np.array_equal(exported, direct)
+print(json.dumps({"segments": len(segments), "mismatched": mismatched, "peak_rss_mb": peak_rss_mb()}))
+"""
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Block reader benchmark")
+    parser.add_argument("--durations", type=float, nargs="+", default=[300, 1200], help="File lengths in seconds")
+    parser.add_argument("--channels", type=int, default=6)
+    parser.add_argument("--signal", default="mixed")
+    parser.add_argument("--max-memory", default="256M", help="Memory budget for the pipeline runs")
+    parser.add_argument("--max-growth", type=float, default=1.5,
+                        help="Allowed ratio of peak RSS between the longest and the shortest file")
+    args = parser.parse_args(argv)
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for duration in sorted(args.durations):
+            audio_file = os.path.join(tmp, f"long_{int(duration)}.wav")
+            subprocess.run([sys.executable, "-c", WRITE_SNIPPET, audio_file, args.signal, str(duration),
+                            str(NATIVE_SR), str(args.channels)], cwd=BENCHMARKS, check=True)
+            output = subprocess.run([sys.executable, "-c", SNIPPET, audio_file, args.max_memory, tmp], cwd=REPO,
+                                    capture_output=True, text=True, check=True)
+            result = json.loads(output.stdout.strip().splitlines()[-1])
+            result["file_mb"] = os.path.getsize(audio_file) / 2 ** 20
+            print(f"{duration:7.0f} s, {args.channels} ch: file {result['file_mb']:7.0f} MB, "
+                  f"{result['segments']:5d} segments, peak RSS {result['peak_rss_mb']:.0f} MB")
+            results.append(result)
+            os.remove(audio_file)
+
+    growth = results[-1]["peak_rss_mb"] / results[0]["peak_rss_mb"]
+    print(f"Budget: {args.max_memory}, peak RSS growth {growth:.2f}x "
+          f"for {results[-1]['file_mb'] / results[0]['file_mb']:.1f}x the file size")
+    if any(result["mismatched"] for result in results):
+        print("Exported segments differ from the source file")
+        return 1
+    if growth > args.max_growth:
+        print(f"Peak RSS grew more than {args.max_growth:g}x")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,89 @@
+"""
+Coarse-to-fine onset detection against the exhaustive onset envelope.
+
+    python benchmarks/bench_coarse_onsets.py --duration 600
+
+For each synthetic signal, runs detect_features with the onset detectors twice:
+exhaustively and with coarse_onsets=True. Reports both run times, the share of frames
+the fine pass analysed, and how the coarse-to-fine onsets compare with the exhaustive
+ones: recall and precision within 50 ms, the share at exactly the same frame, and the
+mean/max time error of matched onsets. Exits non-zero if any F1 is below --min-f1.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import audio_io  # noqa: E402
+from feature_detection import detect_features, coarse_onset_regions, ONSET_ENV_DETECTORS, HOP_LENGTH  # noqa: E402
+from synthetic import SIGNALS, write_wav  # noqa: E402
+
+HIT_TOLERANCE = 0.05
+
+
+def compare(reference, found):
+    """(recall, precision, exact share, mean error, max error) of found onsets against reference ones."""
+    if not len(reference) or not len(found):
+        same = float(len(reference) == len(found))
+        return same, same, same, 0.0, 0.0
+    distances = np.abs(reference[:, None] - found[None, :])
+    nearest = distances.min(axis=1)
+    matched = nearest[nearest < HIT_TOLERANCE]
+    return (np.mean(nearest < HIT_TOLERANCE), np.mean(distances.min(axis=0) < HIT_TOLERANCE),
+            np.mean(nearest < 1e-6), matched.mean() if len(matched) else 0.0, matched.max() if len(matched) else 0.0)
+
+
+def best_of(repeats, function, *args, **kwargs):
+    seconds = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        seconds.append(time.perf_counter() - start)
+    return result, min(seconds)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Coarse-to-fine onset benchmark")
+    parser.add_argument("--duration", type=float, default=600, help="Signal length in seconds")
+    parser.add_argument("--signals", nargs="+", default=sorted(SIGNALS), choices=sorted(SIGNALS))
+    parser.add_argument("--repeats", type=int, default=3, help="Runs per mode; the fastest is reported")
+    parser.add_argument("--min-f1", type=float, default=0.95)
+    args = parser.parse_args(argv)
+
+    failed = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in args.signals:
+            audio_file = write_wav(os.path.join(tmp, f"{name}.wav"), SIGNALS[name](args.duration))
+            detect_features(audio_file, detectors=ONSET_ENV_DETECTORS, coarse_onsets=True)  # imports, numba, caches
+            exhaustive, exhaustive_s = best_of(args.repeats, detect_features, audio_file, detectors=ONSET_ENV_DETECTORS)
+            coarse, coarse_s = best_of(args.repeats, detect_features, audio_file, detectors=ONSET_ENV_DETECTORS,
+                                       coarse_onsets=True)
+            y, sr = audio_io.load(audio_file)
+            regions = coarse_onset_regions(y, sr)
+            coverage = np.sum(regions[:, 1] - regions[:, 0]) / (1 + len(y) // HOP_LENGTH) if len(regions) else 0.0
+
+            print(f"{name:7s} exhaustive {exhaustive_s:6.2f}s  coarse-to-fine {coarse_s:6.2f}s "
+                  f"({exhaustive_s / coarse_s:4.1f}x), fine pass on {coverage:4.0%} of frames")
+            for detector in ONSET_ENV_DETECTORS:
+                recall, precision, exact, mean_error, max_error = compare(exhaustive[detector], coarse[detector])
+                f1 = 2 * recall * precision / max(recall + precision, 1e-9)
+                print(f"  {detector:10s} {len(exhaustive[detector]):5d} -> {len(coarse[detector]):5d}  "
+                      f"recall {recall:.3f}  precision {precision:.3f}  same frame {exact:.3f}  "
+                      f"error mean {mean_error * 1000:5.1f} ms, max {max_error * 1000:5.1f} ms")
+                if f1 < args.min_f1:
+                    failed.append(f"{name}/{detector}")
+
+    if failed:
+        print(f"F1 below {args.min_f1}: {failed}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,107 @@
+"""
+Dataset export check: random training batches from the .npy arrays vs exported WAVs.
+
+    python benchmarks/bench_dataset.py --files 4 --duration 120 --batches 20 --batch-size 64
+
+Writes synthetic files, exports them once as segment WAVs (chop_audio_with_metadata)
+and once as a dataset with 1 s windows. Then reads the same random batches both ways:
+the old training loop (decode each exported WAV, resample it, recompute its feature
+vector) and SegmentDataset.batches (memory-mapped rows). Dataset features and windows
+must match a recomputation from the analysis signal; otherwise the script exits non-zero.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import audio_io  # noqa: E402
+from dataset import SegmentDataset, export_dataset  # noqa: E402
+from pipeline import segment_file  # noqa: E402
+from synthetic import SIGNALS, write_wav  # noqa: E402
+from utils import chop_audio_with_metadata, segment_similarity_features, EXPORTED_SEGMENT  # noqa: E402
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Dataset export benchmark")
+    parser.add_argument("--files", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=120, help="Length of each file in seconds")
+    parser.add_argument("--signal", default="mixed", choices=sorted(SIGNALS))
+    parser.add_argument("--window", type=float, default=1.0)
+    parser.add_argument("--batches", type=int, default=20)
+    parser.add_argument("--batch-size", type=int, default=64)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        files = [write_wav(os.path.join(tmp, f"take{i}.wav"), SIGNALS[args.signal](args.duration, seed=i))
+                 for i in range(args.files)]
+        options = dict(similarity_threshold=1.01)  # keep near-repeats: more rows
+
+        start = time.perf_counter()
+        wavs = []
+        for audio_file in files:
+            segments, _ = segment_file(audio_file, **options)
+            output_dir = chop_audio_with_metadata(audio_file, segments, output_root=tmp)
+            names = sorted(os.listdir(output_dir), key=lambda name: int(EXPORTED_SEGMENT.match(name).group(1)))
+            wavs.extend(os.path.join(output_dir, name) for name in names)
+        wav_export_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        export_dataset(files, os.path.join(tmp, "dataset"), window=args.window, n_clusters=8, **options)
+        dataset_export_s = time.perf_counter() - start
+        dataset = SegmentDataset(os.path.join(tmp, "dataset"))
+        print(f"{len(dataset)} segments from {args.files} x {args.duration:g} s "
+              f"(export: WAVs {wav_export_s:.1f}s, dataset {dataset_export_s:.1f}s)")
+
+        rng = np.random.default_rng(0)
+        picks = [rng.choice(len(dataset), min(args.batch_size, len(dataset)), replace=False)
+                 for _ in range(args.batches)]
+        n_window = dataset.schema["window"]["samples"]
+
+        start = time.perf_counter()
+        for batch in picks:
+            features, windows = [], np.zeros((len(batch), n_window), dtype=np.float32)
+            for i, row in enumerate(batch):
+                y, sr = audio_io.load(wavs[row])
+                features.append(segment_similarity_features(y, sr))
+                windows[i, :min(len(y), n_window)] = y[:n_window]
+        wav_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for batch in picks:
+            dataset.batch(batch)
+        dataset_s = time.perf_counter() - start
+
+        per_batch = 1000 / args.batches
+        print(f"{args.batches} batches of {args.batch_size}:")
+        print(f"  decode WAVs + features: {wav_s * per_batch:9.1f} ms/batch")
+        print(f"  dataset memory maps:    {dataset_s * per_batch:9.2f} ms/batch  ({wav_s / dataset_s:.0f}x)")
+
+        mismatched = 0
+        signals = {}
+        for row in rng.choice(len(dataset), min(20, len(dataset)), replace=False):
+            segment = dataset["segments"][row]
+            if segment["source"] not in signals:
+                signals[segment["source"]] = audio_io.load_signal(dataset.sources[segment["source"]])
+            y, sr = signals[segment["source"]]
+            y = y[int(segment["start"] * sr):int(segment["end"] * sr)]
+            first = audio_io.time_to_sample(segment["start"], sr)
+            window = signals[segment["source"]][0][first:first + segment["valid"]]
+            mismatched += not np.allclose(dataset["features"][row], segment_similarity_features(y, sr), rtol=1e-5,
+                                          atol=1e-4)
+            mismatched += not np.array_equal(dataset["audio"][row, :segment["valid"]], window)
+            mismatched += bool(np.any(dataset["audio"][row, segment["valid"]:]))
+
+    if mismatched:
+        print(f"{mismatched} dataset rows differ from a recomputation")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
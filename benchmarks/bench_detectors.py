@@ -0,0 +1,90 @@
+"""
+Detector registry check: shared intermediates vs one detector at a time.
+
+    python benchmarks/bench_detectors.py --duration 600
+
+Runs every registered detector on a synthetic signal twice: all together, so each
+intermediate (STFT, mel, onset envelopes) is computed once, and one detector per run,
+so each recomputes what it needs (the cost of hand-written per-feature code). The
+outputs must be identical. Also times detect_features with just the detectors each
+segmentation method reads, against DEFAULT_DETECTORS. Every registered detector is
+warmed up first (imports, numba compilation) and each timing is the fastest of
+--repeats runs.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import audio_io  # noqa: E402
+from detectors import Context, available, run_detectors  # noqa: E402
+from feature_detection import detect_features, DEFAULT_DETECTORS  # noqa: E402
+from segmentation import METHOD_DETECTORS  # noqa: E402
+from synthetic import SIGNALS, write_wav  # noqa: E402
+
+
+def same(a, b):
+    if isinstance(a, tuple):
+        return all(same(x, y) for x, y in zip(a, b))
+    return np.array_equal(a, b)
+
+
+def best_of(repeats, function, *args, **kwargs):
+    seconds = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        seconds.append(time.perf_counter() - start)
+    return result, min(seconds)
+
+
+def one_at_a_time(ctx, names):
+    features = {}
+    for name in names:
+        features.update(run_detectors(ctx, [name])[0])
+    return features
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Detector registry benchmark")
+    parser.add_argument("--duration", type=float, default=600, help="Signal length in seconds")
+    parser.add_argument("--signal", default="mixed", choices=sorted(SIGNALS))
+    parser.add_argument("--repeats", type=int, default=3, help="Runs per mode; the fastest is reported")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        audio_file = write_wav(os.path.join(tmp, "signal.wav"), SIGNALS[args.signal](args.duration))
+        y, sr = audio_io.load(audio_file)
+        names = available()
+        # Imports and numba compilation of every registered detector
+        run_detectors(Context(y[:10 * sr], sr), names)
+        detect_features(write_wav(os.path.join(tmp, "warmup.wav"), SIGNALS[args.signal](10)))
+
+        ctx = Context(y, sr)
+        shared, shared_s = best_of(args.repeats, run_detectors, ctx, names)
+        separate, separate_s = best_of(args.repeats, one_at_a_time, ctx, names)
+        print(f"{len(names)} detectors, {args.duration:g} s of audio")
+        print(f"  shared intermediates: {shared_s:6.2f}s")
+        print(f"  one at a time:        {separate_s:6.2f}s  ({separate_s / shared_s:.1f}x)")
+        mismatched = [name for name in shared[0] if not same(shared[0][name], separate[name])]
+
+        _, default_s = best_of(args.repeats, detect_features, audio_file)
+        print(f"detect_features, default detectors {DEFAULT_DETECTORS}: {default_s:.2f}s")
+        for method, detectors in METHOD_DETECTORS.items():
+            _, seconds = best_of(args.repeats, detect_features, audio_file, detectors=detectors)
+            print(f"  {method:20s} {detectors}: {seconds:.2f}s")
+
+    if mismatched:
+        print(f"Shared and separate outputs differ: {mismatched}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
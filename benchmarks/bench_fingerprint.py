@@ -0,0 +1,92 @@
+"""
+Fingerprint dedup check: distinct pitched notes must survive, repeats must not.
+
+    python benchmarks/bench_fingerprint.py --duration 600
+
+Builds 24 harmonic notes a semitone apart (110-415 Hz, 0.5 s each, same envelope),
+followed by repeats of some of them: an exact copy, a copy at another gain and one
+cut 3 ms late. remove_duplicate_segments must keep all 24 notes and drop the three
+repeats, and on the notes alone it must not change what filter_similar_segments
+keeps. Reports how many notes the 64-bit hash alone puts into candidate groups, and
+the dedup time on --duration seconds of the mixed synthetic signal cut every 0.5 s.
+Exits non-zero if a check fails.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from fingerprint import compute_fingerprints, find_duplicate_groups, remove_duplicate_segments  # noqa: E402
+from segmentation import filter_similar_segments  # noqa: E402
+from synthetic import SIGNALS, SR  # noqa: E402
+
+NOTE_SECONDS = 0.5
+N_NOTES = 24
+REPEATED = {3: 1.0, 10: 0.7, 17: 1.0}  # note -> gain of its repeat
+LATE_CUT = 0.003  # the repeat of note 17 is cut this much late
+
+
+def harmonic_note(frequency, sr=SR, duration=NOTE_SECONDS):
+    t = np.arange(int(duration * sr)) / sr
+    envelope = np.exp(-6 * t) * np.minimum(1, t / 0.005)
+    return envelope * sum(np.sin(2 * np.pi * frequency * k * t) / k for k in range(1, 8))
+
+
+def notes_with_repeats():
+    """Signal of the notes followed by their repeats, and the (start, end) of every segment."""
+    notes = [harmonic_note(110 * 2 ** (k / 12)) for k in range(N_NOTES)]
+    parts = notes + [notes[k] * gain for k, gain in REPEATED.items()]
+    y = np.concatenate(parts).astype(np.float32)
+    segments = [(i * NOTE_SECONDS, (i + 1) * NOTE_SECONDS) for i in range(len(parts))]
+    segments[-1] = (segments[-1][0] + LATE_CUT, segments[-1][1])
+    return y, segments
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fingerprint dedup benchmark")
+    parser.add_argument("--duration", type=float, default=600)
+    parser.add_argument("--similarity", type=float, default=0.99)
+    args = parser.parse_args(argv)
+
+    failed = []
+    y, segments = notes_with_repeats()
+    notes = segments[:N_NOTES]
+    durations = [end - start for start, end in notes]
+    candidates = find_duplicate_groups(compute_fingerprints(y, SR, notes), durations)
+    kept, groups = remove_duplicate_segments(y, SR, segments)
+    print(f"{N_NOTES} notes a semitone apart + {len(REPEATED)} repeats")
+    print(f"  notes in hash candidate groups: {sum(len(group) for group in candidates)}")
+    print(f"  kept after dedup: {len(kept)}, groups: {groups}")
+    if kept != notes:
+        failed.append(f"dedup kept {len(kept)} segments instead of the {N_NOTES} notes")
+    expected = sorted([k, N_NOTES + n] for n, k in enumerate(REPEATED))
+    if sorted(groups) != expected:
+        failed.append(f"duplicate groups {groups}, expected {expected}")
+
+    filtered, _ = filter_similar_segments(y, SR, notes, args.similarity)
+    deduped, _ = remove_duplicate_segments(y, SR, notes)
+    both, _ = filter_similar_segments(y, SR, deduped, args.similarity)
+    print(f"  similarity filter at {args.similarity}: {len(filtered)} kept alone, {len(both)} after dedup")
+    if both != filtered:
+        failed.append("dedup changed what the similarity filter keeps")
+
+    long_y = SIGNALS["mixed"](args.duration)
+    long_segments = [(start, start + NOTE_SECONDS) for start in np.arange(0, args.duration - NOTE_SECONDS, NOTE_SECONDS)]
+    start = time.perf_counter()
+    long_kept, _ = remove_duplicate_segments(long_y, SR, long_segments)
+    seconds = time.perf_counter() - start
+    print(f"  {args.duration:g} s mixed signal, {len(long_segments)} segments: {len(long_kept)} kept in {seconds:.2f}s")
+
+    if failed:
+        print("\n".join(failed))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,99 @@
+"""
+Interval index check: queries against linear scans over the segment list.
+
+    python benchmarks/bench_interval_index.py --segments 100000 --queries 2000
+
+Builds random segments (short ones plus a few long, overlapping ones) and times point
+hit-tests, view-range queries, overlap merging and bulk insert/delete on an
+IntervalIndex against the list scans the UI used before. Every query result must
+match the scan; otherwise the script exits non-zero.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from interval_index import IntervalIndex  # noqa: E402
+
+
+def scan_overlapping(segments, lo, hi):
+    return [i for i, (start, end) in enumerate(segments) if start <= hi and end >= lo]
+
+
+def scan_merge(segments):
+    merged = []
+    for start, end in sorted(segments):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Interval index benchmark")
+    parser.add_argument("--segments", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--duration", type=float, default=36000.0, help="Timeline length in seconds")
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(0)
+    starts = rng.uniform(0, args.duration, args.segments)
+    ends = starts + rng.exponential(2.0, args.segments)
+    ends[::1000] += 300  # a few long segments overlapping many others
+    segments = list(zip(starts.tolist(), ends.tolist()))
+    points = rng.uniform(0, args.duration, args.queries)
+    widths = rng.exponential(30.0, args.queries)
+
+    start = time.perf_counter()
+    index = IntervalIndex.from_segments(segments)
+    build_s = time.perf_counter() - start
+
+    failures = 0
+    timings = {}
+    for name, indexed, scanned in (
+        ("point", lambda t, w: sorted(index.at(t)), lambda t, w: scan_overlapping(segments, t, t)),
+        ("range", lambda t, w: sorted(index.overlapping(t, t + w)), lambda t, w: scan_overlapping(segments, t, t + w)),
+    ):
+        start = time.perf_counter()
+        results = [indexed(t, w) for t, w in zip(points, widths)]
+        index_s = time.perf_counter() - start
+        start = time.perf_counter()
+        expected = [scanned(t, w) for t, w in zip(points[:50], widths[:50])]
+        scan_s = (time.perf_counter() - start) * len(points) / 50
+        failures += sum(list(map(int, r)) != e for r, e in zip(results, expected))
+        timings[name] = (index_s, scan_s)
+
+    start = time.perf_counter()
+    merged = index.merged()
+    index_s = time.perf_counter() - start
+    start = time.perf_counter()
+    expected = scan_merge(segments)
+    timings["merge"] = (index_s, time.perf_counter() - start)
+    failures += not np.allclose(merged, expected)
+
+    batch = rng.uniform(0, args.duration, args.segments // 10)
+    start = time.perf_counter()
+    ids = index.add(batch, batch + 1.0)
+    index.remove(ids)
+    bulk_s = time.perf_counter() - start
+    failures += len(index) != args.segments
+
+    print(f"{args.segments} segments, {args.queries} queries (build {build_s * 1000:.1f} ms)")
+    for name, (index_s, scan_s) in timings.items():
+        print(f"  {name:6s} index {index_s * 1000:9.2f} ms   list scan {scan_s * 1000:10.1f} ms   "
+              f"{scan_s / index_s:8.0f}x")
+    print(f"  bulk insert + delete of {len(batch)} segments: {bulk_s * 1000:.1f} ms")
+    if failures:
+        print(f"{failures} results differ from the list scan")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,109 @@
+"""
+Low-memory mode check: peak RSS and result drift under a memory budget.
+
+    python benchmarks/bench_low_memory.py --duration 1800 --max-memory 1G
+
+Writes a synthetic 44.1 kHz stereo file, then runs detection, segmentation and
+fingerprint dedup on it in two fresh interpreters, once normally and once with the
+memory budget, and reports each run's peak RSS. The segment boundaries of the
+budgeted run must match the normal run's within --tolerance-ms for at least
+--min-match of the segments (in both directions), otherwise the script exits non-zero.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from synthetic import SIGNALS  # noqa: E402
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+REPO = os.path.join(BENCHMARKS, "..")
+NATIVE_SR = 44100
+
+# Peak RSS survives exec on Linux, so even the test file is written in a child process:
+# this process stays small and each measured run starts from a clean slate.
+WRITE_SNIPPET = """
+import sys
+import numpy as np
+from synthetic import SIGNALS, write_wav
+path, signal, duration, sr = sys.argv[1], sys.argv[2], float(sys.argv[3]), int(sys.argv[4])
+mono = SIGNALS[signal](duration, sr=sr)
+write_wav(path, np.stack([mono, np.roll(mono, 7)], axis=1), sr)
+"""
+
+SNIPPET = """
+import json, sys
+import audio_io
+from instrumentation import peak_rss_mb
+from feature_detection import detect_features
+from segmentation import segment_by_onsets
+from fingerprint import remove_duplicate_segments
+audio_file, budget = sys.argv[1], sys.argv[2]
+if budget:
+    audio_io.configure(memory_budget=budget)
+segments = segment_by_onsets(detect_features(audio_file))
+y, sr = audio_io.load_signal(audio_file)
+kept, _ = remove_duplicate_segments(y, sr, segments)
+print(json.dumps({"segments": segments, "kept": len(kept), "peak_rss_mb": peak_rss_mb()}))
+"""
+
+
+def run(audio_file, budget):
+    output = subprocess.run([sys.executable, "-c", SNIPPET, audio_file, budget or ""], cwd=REPO,
+                            capture_output=True, text=True, check=True)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def match_fraction(reference, other, tolerance):
+    """Fraction of reference segments with a segment in other whose both boundaries are within tolerance."""
+    if not reference:
+        return 1.0
+    other = np.asarray(other, dtype=float).reshape(-1, 2)
+    matched = sum(
+        bool(len(other)) and bool(np.any(np.all(np.abs(other - np.asarray(segment)) <= tolerance, axis=1)))
+        for segment in reference
+    )
+    return matched / len(reference)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Low-memory mode benchmark")
+    parser.add_argument("--duration", type=float, default=600, help="Signal length in seconds")
+    parser.add_argument("--signal", default="mixed", choices=sorted(SIGNALS))
+    parser.add_argument("--max-memory", default="1G", help="Budget for the low-memory run")
+    parser.add_argument("--tolerance-ms", type=float, default=25.0, help="Allowed boundary shift")
+    parser.add_argument("--min-match", type=float, default=0.95, help="Required fraction of matching segments")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        audio_file = os.path.join(tmp, "long.wav")
+        subprocess.run([sys.executable, "-c", WRITE_SNIPPET, audio_file, args.signal, str(args.duration), str(NATIVE_SR)],
+                       cwd=BENCHMARKS, check=True)
+
+        normal = run(audio_file, None)
+        budgeted = run(audio_file, args.max_memory)
+
+    tolerance = args.tolerance_ms / 1000
+    forward = match_fraction(normal["segments"], budgeted["segments"], tolerance)
+    backward = match_fraction(budgeted["segments"], normal["segments"], tolerance)
+    for label, result in (("Normal:    ", normal), ("Low memory:", budgeted)):
+        print(f"{label} {len(result['segments']):6d} segments, {result['kept']:6d} after dedup, "
+              f"peak RSS {result['peak_rss_mb']:.0f} MB")
+    print(f"Budget: {args.max_memory}")
+    print(f"Matching segments: {forward:.1%} of normal, {backward:.1%} of low-memory")
+
+    if min(forward, backward) < args.min_match:
+        print(f"Results differ beyond tolerance ({args.min_match:.0%} within {args.tolerance_ms:g} ms)")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,102 @@
+"""
+Correctness check and worker-scaling benchmark for chunk-parallel detect_features.
+
+    python benchmarks/bench_parallel_features.py --duration 600 --max-workers 8
+
+Every configuration runs after a warm-up call (imports, numba compilation) and the
+fastest of --repeats runs is reported, so the speedups compare warm runs.
+The chunked result is compared against the single-process result: spectral features
+must match up to float rounding, and onset/transient/beat times must agree to within
+one frame. Exits non-zero on a mismatch.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from feature_detection import detect_features, HOP_LENGTH  # noqa: E402
+from synthetic import click_track, write_wav, SR  # noqa: E402
+
+FRAME = HOP_LENGTH / SR
+
+
+def match_fraction(reference, candidate, tolerance=FRAME + 1e-6):
+    """Fraction of reference events with a candidate event within `tolerance` seconds, and vice versa."""
+    if len(reference) == 0 and len(candidate) == 0:
+        return 1.0
+    if len(reference) == 0 or len(candidate) == 0:
+        return 0.0
+
+    def covered(a, b):
+        idx = np.clip(np.searchsorted(b, a), 1, len(b) - 1)
+        nearest = np.minimum(np.abs(a - b[idx - 1]), np.abs(a - b[idx]))
+        return np.mean(nearest <= tolerance)
+
+    return min(covered(reference, candidate), covered(candidate, reference))
+
+
+def best_of(repeats, function, *args, **kwargs):
+    seconds = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        seconds.append(time.perf_counter() - start)
+    return result, min(seconds)
+
+
+def compare(reference, chunked):
+    """Return a list of problems found between the two feature dicts."""
+    problems = []
+    for key in ("spectral_centroid", "spectral_rolloff", "spectral_bandwidth"):
+        ref_times, ref_values = reference[key]
+        times, values = chunked[key]
+        if len(values) != len(ref_values):
+            problems.append(f"{key}: {len(values)} frames, expected {len(ref_values)}")
+        elif not np.allclose(values, ref_values, rtol=1e-3, atol=1e-2):
+            problems.append(f"{key}: max abs difference {np.max(np.abs(values - ref_values)):.4f}")
+    for key in ("onsets", "transients", "beats"):
+        fraction = match_fraction(reference[key], chunked[key])
+        if fraction < 0.99:
+            problems.append(f"{key}: only {fraction:.1%} of events match within one frame")
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--duration", type=float, default=600.0, help="Synthetic signal length (s)")
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-duration", type=float, default=60.0)
+    parser.add_argument("--repeats", type=int, default=3, help="Runs per configuration; the fastest is reported")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        audio_file = write_wav(os.path.join(tmp, "clicks.wav"), click_track(args.duration))
+        detect_features(write_wav(os.path.join(tmp, "warmup.wav"), click_track(5)))  # imports and numba compilation
+
+        reference, baseline = best_of(args.repeats, detect_features, audio_file)
+        print(f"workers=1 (single process): {baseline:.2f}s")
+
+        failed = False
+        workers = 2
+        while workers <= max(args.max_workers, 2):
+            chunked, elapsed = best_of(args.repeats, detect_features, audio_file, n_jobs=workers,
+                                       chunk_duration=args.chunk_duration)
+            problems = compare(reference, chunked)
+            status = "OK" if not problems else "MISMATCH"
+            print(f"workers={workers}: {elapsed:.2f}s  speedup {baseline / elapsed:.2f}x  {status}")
+            for problem in problems:
+                print(f"  - {problem}")
+            failed |= bool(problems)
+            workers *= 2
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,127 @@
+"""
+Sample pack ingestion: one file at a time vs stacked batch analysis.
+
+    python benchmarks/bench_sample_pack.py --files 1000
+
+Writes a pack of synthetic one-shots (0.5-3 s decaying tones and noise bursts at mixed
+native rates, every tenth one a copy of an earlier one at another gain) and ingests it
+twice:
+  - per file: audio_io.load + segment_similarity_features for each file, each vector
+    compared with the kept ones as filter_similar_segments does, then one k-means fit
+  - analyse_pack: bulk decode, stacked STFT features, blockwise dedup, one k-means fit
+Reports the time of each stage. The pack features must match the per-file ones and both
+must flag the same duplicates (up to one file in 1000, for pairs right at the threshold);
+otherwise the script exits non-zero.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import soundfile as sf
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import audio_io  # noqa: E402
+from clustering import ClusterModel  # noqa: E402
+from sample_pack import analyse_pack  # noqa: E402
+from utils import segment_similarity_features  # noqa: E402
+
+NATIVE_RATES = [22050, 44100, 48000]
+
+
+def write_pack(directory, n_files, seed=0):
+    """Write n_files one-shots, every tenth a rescaled copy of an earlier one. Returns the paths."""
+    rng = np.random.default_rng(seed)
+    paths, signals = [], []
+    for i in range(n_files):
+        if i % 10 == 9:
+            source = rng.integers(len(signals))
+            y, sr = signals[source]
+            y = y * rng.uniform(0.5, 1.0)
+        else:
+            sr = int(rng.choice(NATIVE_RATES))
+            t = np.arange(int(rng.uniform(0.5, 3.0) * sr)) / sr
+            decay = np.exp(-t * rng.uniform(2, 12))
+            tone = np.sin(2 * np.pi * rng.uniform(40, 2000) * t + 0.3 * np.sin(2 * np.pi * rng.uniform(1, 8) * t))
+            burst = rng.standard_normal(len(t)) * np.exp(-t * rng.uniform(10, 60))
+            y = (decay * tone * rng.uniform(0, 1) + burst * rng.uniform(0, 0.5)).astype(np.float32)
+        signals.append((y, sr))
+        paths.append(os.path.join(directory, f"shot{i:05d}.wav"))
+        sf.write(paths[-1], y, sr)
+    return paths
+
+
+def per_file(files, similarity_threshold, n_clusters):
+    """The one-file-at-a-time loop. Returns (features, duplicate_of, stage seconds)."""
+    seconds = {}
+    start = time.perf_counter()
+    features = []
+    for audio_file in files:
+        y, sr = audio_io.load(audio_file)
+        features.append(segment_similarity_features(y, sr))
+    seconds["features"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    kept, duplicate_of = [], np.full(len(files), -1)
+    for i, current in enumerate(features):
+        for j in kept:
+            similarity = np.dot(current, features[j]) / (np.linalg.norm(current) * np.linalg.norm(features[j]))
+            if similarity > similarity_threshold:
+                duplicate_of[i] = j
+                break
+        else:
+            kept.append(i)
+    seconds["dedup"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    ClusterModel.fit(np.asarray(features)[kept], n_clusters, feature_set="similarity", standardize=False)
+    seconds["cluster"] = time.perf_counter() - start
+    return np.asarray(features), duplicate_of, seconds
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sample pack ingestion benchmark")
+    parser.add_argument("--files", type=int, default=1000)
+    parser.add_argument("--similarity", type=float, default=0.9999,
+                        help="Dedup threshold (raw similarity vectors of one-shots are all close)")
+    parser.add_argument("--clusters", type=int, default=16)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        files = write_pack(tmp, args.files)
+        analyse_pack(files[:20], n_clusters=2)  # imports, numba compilation, filterbank caches
+        segment_similarity_features(*audio_io.load(files[0]))
+
+        features, duplicate_of, seconds = per_file(files, args.similarity, args.clusters)
+        per_file_s = sum(seconds.values())
+
+        start = time.perf_counter()
+        pack = analyse_pack(files, similarity_threshold=args.similarity, n_clusters=args.clusters)
+        pack_s = time.perf_counter() - start
+
+    n_unique = int(np.sum(pack["duplicate_of"] < 0))
+    print(f"{args.files} one-shots, {n_unique} unique at similarity {args.similarity}")
+    print(f"  per file:     {per_file_s:6.2f}s  ({1000 * per_file_s / args.files:.1f} ms/file; "
+          + ", ".join(f"{name} {value:.2f}s" for name, value in seconds.items()) + ")")
+    print(f"  analyse_pack: {pack_s:6.2f}s  ({1000 * pack_s / args.files:.1f} ms/file)  {per_file_s / pack_s:.1f}x")
+
+    failed = []
+    if not np.allclose(pack["features"], features, rtol=1e-4, atol=1e-3):
+        failed.append(f"features differ (max {np.max(np.abs(pack['features'] - features)):.3g})")
+    # Features agree to float32 precision, so a pair right at the threshold may fall either side
+    differing = int(np.sum(pack["duplicate_of"] != duplicate_of))
+    print(f"  dedup decisions that differ: {differing}")
+    if differing > args.files // 1000:
+        failed.append(f"{differing} dedup decisions differ")
+    if failed:
+        print("; ".join(failed))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,129 @@
+"""
+End-to-end check of the HTTP job server on localhost.
+
+    python benchmarks/bench_server.py --files 8 --workers 2
+
+Starts a JobServer on a free port, submits synthetic files over HTTP, polls
+until every job finishes and reports per-job queue wait and run time and the
+overall throughput. It also checks that results match an in-process
+process_file run, that bad requests get 400 and that a full queue gets 503. Then it
+kills a worker: the next job must restart the pool and finish, no job may stay
+pending, and finished jobs beyond the cap must be forgotten.
+Exits non-zero on any mismatch.
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from server import JobServer  # noqa: E402
+from synthetic import SIGNALS, write_wav  # noqa: E402
+
+
+def request(base, method, path, payload=None):
+    """Send a JSON request; returns (status, decoded body)."""
+    data = None if payload is None else json.dumps(payload).encode()
+    req = urllib.request.Request(base + path, data=data, method=method, headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(req) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="HTTP job server benchmark")
+    parser.add_argument("--files", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=20, help="Seconds of audio per file")
+    parser.add_argument("--workers", type=int, default=2)
+    args = parser.parse_args(argv)
+
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp:
+        signals = sorted(SIGNALS)
+        files = [write_wav(os.path.join(tmp, f"job{i}.wav"), SIGNALS[signals[i % len(signals)]](args.duration, seed=i))
+                 for i in range(args.files)]
+
+        start = time.perf_counter()
+        server = JobServer(("127.0.0.1", 0), workers=args.workers, max_queue=args.files)
+        print(f"Server with {args.workers} warm workers ready in {time.perf_counter() - start:.2f}s")
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base = f"http://127.0.0.1:{server.server_address[1]}"
+        try:
+            status, _ = request(base, "POST", "/jobs", {"audio_file": files[0], "method": "nope"})
+            if status != 400:
+                failures.append(f"unknown method got {status}, expected 400")
+
+            start = time.perf_counter()
+            ids = []
+            for audio_file in files:
+                status, body = request(base, "POST", "/jobs", {"audio_file": audio_file,
+                                                                "output_dir": os.path.join(tmp, "out")})
+                ids.append(body["id"])
+            status, _ = request(base, "POST", "/jobs", {"audio_file": files[0]})
+            if status != 503:
+                failures.append(f"submit to a full queue got {status}, expected 503")
+
+            results = {}
+            while len(results) < len(ids):
+                time.sleep(0.1)
+                for job_id in ids:
+                    if job_id not in results:
+                        status, body = request(base, "GET", f"/jobs/{job_id}/result")
+                        if status != 409:
+                            results[job_id] = (status, body)
+            elapsed = time.perf_counter() - start
+
+            # A worker that dies breaks the pool; the next submission must start a new one
+            server.max_finished = 2
+            next(iter(server.pool._processes.values())).kill()
+            while not server.pool._broken:
+                time.sleep(0.05)
+            start = time.perf_counter()
+            status, body = request(base, "POST", "/jobs", {"audio_file": files[0],
+                                                            "output_dir": os.path.join(tmp, "out")})
+            if status != 202:
+                failures.append(f"submit after a worker died got {status}, expected 202")
+            else:
+                while request(base, "GET", f"/jobs/{body['id']}")[1]["status"] in ("queued", "running"):
+                    time.sleep(0.1)
+                status, body = request(base, "GET", f"/jobs/{body['id']}/result")
+                print(f"Job after a worker died: {status} in {time.perf_counter() - start:.2f}s (pool restarted)")
+                if status != 200:
+                    failures.append(f"job after a worker died got {status}: {body.get('error')}")
+            _, health = request(base, "GET", "/health")
+            print(f"Health: {health}")
+            if health["pending"] != 0 or health["jobs"] > 2:
+                failures.append(f"jobs left pending or not evicted: {health}")
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        from pipeline import process_file
+        for job_id, audio_file in zip(ids, files):
+            status, body = results[job_id]
+            if status != 200:
+                failures.append(f"{audio_file}: {body.get('error')}")
+                continue
+            print(f"{os.path.basename(audio_file):10s} queue {body['queue_s']:6.2f}s  run {body['run_s']:6.2f}s  "
+                  f"{len(body['result']['segments']):4d} segments  {len(body['stages'])} stage records")
+            expected = process_file(audio_file, output_root=os.path.join(tmp, "local"))["segments"]
+            if body["result"]["segments"] != [[float(s), float(e)] for s, e in expected]:
+                failures.append(f"{audio_file}: server segments differ from process_file")
+        print(f"{len(files)} jobs in {elapsed:.2f}s ({len(files) / elapsed:.2f} jobs/s)")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
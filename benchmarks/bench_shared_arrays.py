@@ -0,0 +1,140 @@
+"""
+Shared-memory signal for the per-segment feature loops: copies, time and cleanup.
+
+    python benchmarks/bench_shared_arrays.py --duration 600 --jobs 4
+
+Computes the similarity feature vector of every 0.5 s segment of a synthetic signal
+three ways: in this process, in a process pool that is passed the signal with every
+batch (pickled), and with map_segments (one shared memory copy that workers attach;
+its pool is kept between calls and is warmed up first). Reports time and the bytes of signal sent to the workers. Then checks cleanup:
+  - a worker that dies mid-run (BrokenProcessPool) must leave no segment behind
+  - a process killed with SIGKILL while owning a segment: its segment must be gone
+    once the resource tracker has run, or be removed by remove_stale_segments
+The vectors of the three runs must be equal and no segment may be left; otherwise the
+script exits non-zero.
+"""
+
+import argparse
+import os
+import pickle
+import signal
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import shared_arrays  # noqa: E402
+from segmentation import segment_feature_vectors  # noqa: E402
+from shared_arrays import map_segments, SharedArrayStore, SEGMENT_PREFIX, SHM_DIRECTORY  # noqa: E402
+from synthetic import SIGNALS, SR  # noqa: E402
+
+SEGMENT_SECONDS = 0.5
+
+KILLED_OWNER = """
+import os, signal, sys
+sys.path.insert(0, {root!r})
+import numpy as np
+from shared_arrays import SharedArrayStore
+store = SharedArrayStore()
+handle = store.put(np.ones(1000, dtype=np.float32))
+print(handle.name, flush=True)
+os.kill(os.getpid(), signal.SIGKILL)
+"""
+
+
+def our_segments():
+    if not os.path.isdir(SHM_DIRECTORY):
+        return []
+    return sorted(name for name in os.listdir(SHM_DIRECTORY) if name.startswith(SEGMENT_PREFIX))
+
+
+def _die(y, sr, segments):
+    os._exit(1)
+
+
+def pickled_pool(y, sr, segments, n_jobs):
+    """The naive parallel loop: the signal goes to the workers with every batch."""
+    size = -(-len(segments) // (n_jobs * shared_arrays.BATCHES_PER_JOB))
+    batches = [segments[first:first + size] for first in range(0, len(segments), size)]
+    with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+        results = pool.map(segment_feature_vectors, [y] * len(batches), [sr] * len(batches), batches)
+        return [vector for batch in results for vector in batch], len(batches) * len(pickle.dumps(y, protocol=5))
+
+
+def timed_run(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Shared-memory per-segment loop benchmark")
+    parser.add_argument("--duration", type=float, default=600)
+    parser.add_argument("--signal", default="mixed", choices=sorted(SIGNALS))
+    parser.add_argument("--jobs", type=int, default=4)
+    args = parser.parse_args(argv)
+
+    y = SIGNALS[args.signal](args.duration)
+    edges = np.arange(0, args.duration, SEGMENT_SECONDS)
+    segments = [(start, min(start + SEGMENT_SECONDS, args.duration)) for start in edges]
+    before = our_segments()
+    segment_feature_vectors(y, SR, segments[:2])  # imports and numba compilation
+    map_segments(segment_feature_vectors, y, SR, segments[:4 * args.jobs * shared_arrays.BATCHES_PER_JOB],
+                 args.jobs)  # starts the kept worker pool and warms its workers
+
+    serial, serial_s = timed_run(segment_feature_vectors, y, SR, segments)
+    (pickled, sent), pickled_s = timed_run(pickled_pool, y, SR, segments, args.jobs)
+    shared, shared_s = timed_run(map_segments, segment_feature_vectors, y, SR, segments, args.jobs)
+
+    print(f"{len(segments)} segments of a {args.duration:g} s signal ({y.nbytes / 2 ** 20:.1f} MiB), "
+          f"{args.jobs} workers, {os.cpu_count()} CPUs")
+    print(f"  in process:         {serial_s:6.2f}s")
+    print(f"  pool, pickled:      {pickled_s:6.2f}s  {sent / 2 ** 20:7.1f} MiB of signal sent to workers")
+    print(f"  pool, shared array: {shared_s:6.2f}s  {y.nbytes / 2 ** 20:7.1f} MiB copied once into shared memory")
+
+    failed = []
+    for name, result in (("pickled", pickled), ("shared", shared)):
+        if not all(np.array_equal(a, b) for a, b in zip(serial, result)) or len(result) != len(serial):
+            failed.append(f"{name} vectors differ from the in-process ones")
+
+    try:
+        map_segments(_die, y, SR, segments, args.jobs)
+        failed.append("a dying worker did not raise")
+    except BrokenProcessPool:
+        pass
+    left = sorted(set(our_segments()) - set(before))
+    print(f"  worker died mid-run: {len(left)} segments left")
+    if left:
+        failed.append(f"segments left after a worker died: {left}")
+
+    root = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+    owner = subprocess.run([sys.executable, "-c", KILLED_OWNER.format(root=root)], capture_output=True, text=True)
+    name = owner.stdout.strip()
+    if owner.returncode != -signal.SIGKILL or not name:
+        failed.append(f"owner process did not run as expected: {owner.returncode} {owner.stderr[-300:]}")
+    else:
+        deadline = time.monotonic() + 5
+        while name in our_segments() and time.monotonic() < deadline:
+            time.sleep(0.1)  # the resource tracker notices its owner is gone
+        by_tracker = name not in our_segments()
+        swept = SharedArrayStore() if not by_tracker else None
+        if swept is not None:
+            swept.close()
+        print(f"  owner killed with SIGKILL: segment removed by "
+              f"{'the resource tracker' if by_tracker else 'remove_stale_segments'}")
+        if name in our_segments():
+            failed.append(f"segment {name} of a killed process was not removed")
+
+    if failed:
+        print("\n".join(failed))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,126 @@
+"""
+Similarity index check: opening and clustering the index in memory independent of its size.
+
+    python benchmarks/bench_similarity_index.py --rows 200000
+
+Builds a small index (--rows / 4 segments) and a large one (--rows segments) of
+random vectors, one source per --rows-per-source segments, then (after one untimed
+warm-up run) opens each and runs cluster_corpus on it with the same batch size,
+tracing Python heap allocations (memory-mapped data is not counted). The large index's peak must stay within
+--max-growth times the small one's.
+
+Then trains the approximate (IVF) mode on the large index with build_approximate,
+reopens it and looks up --queries perturbed copies of indexed segments with the
+default search (which must now pick the approximate mode) and with an exact scan.
+Reports the time of each and the recall@1 of the approximate lookups, which must
+reach --min-recall. Exits non-zero if a check fails.
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from clustering import cluster_corpus  # noqa: E402
+from similarity_index import SimilarityIndex  # noqa: E402
+
+
+def build(path, rows, rows_per_source, dim, seed=0):
+    rng = np.random.default_rng(seed)
+    index = SimilarityIndex(path, dim=dim)
+    for first in range(0, rows, rows_per_source):
+        n = min(rows_per_source, rows - first)
+        segments = [(0.5 * i, 0.5 * (i + 1)) for i in range(n)]
+        index.add(f"source_{first // rows_per_source:06d}.wav", segments,
+                  rng.normal(size=(n, dim)).astype(np.float32))
+
+
+def open_and_cluster(path, batch_size, n_clusters):
+    """Peak traced heap (MB) and seconds for opening the index and clustering it."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    index = SimilarityIndex(path)
+    cluster_corpus(index, n_clusters=n_clusters, batch_size=batch_size, n_epochs=1)
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / 2 ** 20, seconds
+
+
+def approximate_recall(path, n_queries, noise, seed=1):
+    """Build the IVF mode, then (recall@1, approximate seconds, exact seconds, whether search chose it)."""
+    SimilarityIndex(path).build_approximate(above=0)
+    index = SimilarityIndex(path)
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(len(index), size=n_queries, replace=False)
+    queries = np.asarray(index._vectors()[np.sort(rows)])
+    queries += noise * rng.normal(size=queries.shape).astype(np.float32) / np.sqrt(queries.shape[1])
+
+    start = time.perf_counter()
+    _, default_rows = index.search(queries)
+    approximate_seconds = time.perf_counter() - start
+    _, approximate_rows = index.search(queries, approximate=True)
+    start = time.perf_counter()
+    _, exact_rows = index.search(queries, approximate=False)
+    exact_seconds = time.perf_counter() - start
+    recall = float(np.mean(approximate_rows[:, 0] == exact_rows[:, 0]))
+    return recall, approximate_seconds, exact_seconds, np.array_equal(default_rows, approximate_rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Similarity index memory benchmark")
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--rows-per-source", type=int, default=1000)
+    parser.add_argument("--dim", type=int, default=32)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--clusters", type=int, default=8)
+    parser.add_argument("--max-growth", type=float, default=1.5)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--noise", type=float, default=0.1, help="Query perturbation, relative to the vector norm")
+    parser.add_argument("--min-recall", type=float, default=0.9)
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="bench_similarity_index_")
+    try:
+        paths = {}
+        for rows in (args.rows // 4, args.rows):
+            paths[rows] = os.path.join(workdir, f"index_{rows}")
+            build(paths[rows], rows, args.rows_per_source, args.dim)
+        open_and_cluster(paths[args.rows // 4], args.batch_size, args.clusters)  # warm-up: imports, sklearn setup
+        peaks = []
+        for rows, path in paths.items():
+            peak, seconds = open_and_cluster(path, args.batch_size, args.clusters)
+            peaks.append(peak)
+            print(f"{rows:>9} segments: peak heap {peak:.1f} MB, open + cluster_corpus {seconds:.2f}s")
+        recall, approximate_seconds, exact_seconds, chosen = approximate_recall(paths[args.rows], args.queries,
+                                                                                args.noise)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    failed = []
+    growth = peaks[1] / peaks[0]
+    print(f"peak heap grows {growth:.2f}x for 4x the segments")
+    if growth > args.max_growth:
+        failed.append(f"memory grows with the index size (over {args.max_growth}x)")
+    print(f"{args.queries} lookups in {args.rows} segments: approximate {approximate_seconds:.2f}s, "
+          f"exact {exact_seconds:.2f}s, recall@1 {recall:.3f}")
+    if not chosen:
+        failed.append("search did not use the approximate mode after build_approximate")
+    if recall < args.min_recall:
+        failed.append(f"approximate recall@1 {recall:.3f} below {args.min_recall}")
+
+    if failed:
+        print("\n".join(failed))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
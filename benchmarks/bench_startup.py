@@ -0,0 +1,79 @@
+"""
+Startup-time benchmark for the GUI and the batch CLI.
+
+    python benchmarks/bench_startup.py --max-gui-seconds 0.5
+
+Each measurement runs in a fresh interpreter so nothing is cached in-process.
+GUI: time until the main window is shown (Qt's offscreen platform is used when
+there is no display), and until the deferred waveform view is ready. CLI: time to
+import the batch pipeline. For both, the heavy libraries that got imported are
+listed; sklearn, matplotlib and pygame should not appear before first use.
+Exits non-zero if the GUI takes longer than --max-gui-seconds.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+REPO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+HEAVY_MODULES = ["sklearn", "matplotlib", "pygame", "numba", "scipy.signal", "pydub"]
+
+GUI_SNIPPET = """
+import json, sys, time
+start = time.perf_counter()
+from PyQt5.QtWidgets import QApplication
+app = QApplication(sys.argv)
+from ui import AudioSegmentationApp
+window = AudioSegmentationApp()
+window.show()
+shown = time.perf_counter() - start
+modules = [m for m in HEAVY if m in sys.modules]
+app.processEvents()  # runs the deferred waveform view setup
+ready = time.perf_counter() - start
+print(json.dumps({"seconds": shown, "ready": ready, "modules": modules}))
+"""
+
+CLI_SNIPPET = """
+import json, sys, time
+start = time.perf_counter()
+import batch, pipeline
+print(json.dumps({"seconds": time.perf_counter() - start, "modules": [m for m in HEAVY if m in sys.modules]}))
+"""
+
+
+def run_snippet(snippet, repeat):
+    """Run snippet in fresh interpreters; return the best result and the heavy modules it loaded."""
+    env = dict(os.environ)
+    if not env.get("DISPLAY") and sys.platform.startswith("linux"):
+        env.setdefault("QT_QPA_PLATFORM", "offscreen")
+    code = f"HEAVY = {HEAVY_MODULES!r}\n{snippet}"
+    results = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, "-c", code], cwd=REPO, env=env, capture_output=True, text=True, check=True)
+        results.append(json.loads(output.stdout.strip().splitlines()[-1]))
+    return min(results, key=lambda r: r["seconds"]), results[-1]["modules"]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Startup-time benchmark")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--max-gui-seconds", type=float, default=0.5)
+    args = parser.parse_args(argv)
+
+    gui, gui_modules = run_snippet(GUI_SNIPPET, args.repeat)
+    gui_seconds = gui["seconds"]
+    print(f"GUI window shown:    {gui_seconds:.3f}s  heavy modules: {', '.join(gui_modules) or 'none'}")
+    print(f"GUI waveform ready:  {gui['ready']:.3f}s")
+    cli, cli_modules = run_snippet(CLI_SNIPPET, args.repeat)
+    print(f"Batch CLI imported:  {cli['seconds']:.3f}s  heavy modules: {', '.join(cli_modules) or 'none'}")
+
+    if gui_seconds > args.max_gui_seconds:
+        print(f"GUI startup exceeds {args.max_gui_seconds:.2f}s")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,85 @@
+"""
+Shared work queue check: several local workers draining one queue directory.
+
+    python benchmarks/bench_work_queue.py --files 8 --duration 20 --workers 3
+
+Writes synthetic files, creates a queue with a short lease and plants a lease from a
+"crashed" worker on one task (it expired and was never completed). Then starts
+`batch.py queue-work` with --workers processes, merges the shard manifests and checks
+that every file is done exactly once in the merged manifest, that the abandoned task
+was taken over, and that each file's exports exist. Exits non-zero otherwise.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+REPO = os.path.join(BENCHMARKS, "..")
+sys.path.insert(0, REPO)
+
+from synthetic import SIGNALS, write_wav  # noqa: E402
+from work_queue import WorkQueue, task_id  # noqa: E402
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Shared work queue benchmark")
+    parser.add_argument("--files", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=20, help="Length of each file in seconds")
+    parser.add_argument("--workers", type=int, default=3)
+    parser.add_argument("--lease", type=float, default=5.0)
+    args = parser.parse_args(argv)
+
+    batch = [sys.executable, os.path.join(REPO, "batch.py")]
+    with tempfile.TemporaryDirectory() as tmp:
+        files = [write_wav(os.path.join(tmp, f"take{i}.wav"), SIGNALS["mixed"](args.duration, seed=i))
+                 for i in range(args.files)]
+        queue_dir = os.path.join(tmp, "queue")
+        subprocess.run(batch + ["queue-init", queue_dir, *files, "--clusters", "4", "--lease", str(args.lease)],
+                       check=True, capture_output=True)
+
+        # A worker that claimed a task and died: its lease has already run out
+        abandoned = task_id(files[0])
+        with open(os.path.join(queue_dir, "leases", abandoned + ".lease"), "w") as f:
+            json.dump({"worker": "crashed-0", "host": "elsewhere", "pid": 0, "expires": time.time() - 1}, f)
+
+        start = time.perf_counter()
+        subprocess.run(batch + ["queue-work", queue_dir, "--workers", str(args.workers), "--poll-interval", "0.5"],
+                       check=True, capture_output=True)
+        seconds = time.perf_counter() - start
+        merged_path = os.path.join(tmp, "merged.json")
+        subprocess.run(batch + ["queue-merge", queue_dir, "--out", merged_path], check=True, capture_output=True)
+
+        with open(merged_path) as f:
+            merged = json.load(f)["files"]
+        shards = sorted(name for name in os.listdir(os.path.join(queue_dir, "manifests")) if name.endswith(".json"))
+        queue = WorkQueue(queue_dir)
+        problems = []
+        for audio_file in files:
+            entry = merged.get(os.path.abspath(audio_file))
+            if entry is None or entry["status"] != "done":
+                problems.append(f"{audio_file}: {entry and entry['status']}")
+            elif entry["segments"] and not os.listdir(entry["output_dir"]):
+                problems.append(f"{audio_file}: no exports in {entry['output_dir']}")
+        if queue.task(abandoned)["claims"] < 1 or queue.lease(abandoned) is not None:
+            problems.append("abandoned task was not taken over")
+
+        per_shard = {}
+        for entry in merged.values():
+            per_shard[entry["shard"]] = per_shard.get(entry["shard"], 0) + 1
+        print(f"{args.files} files x {args.duration:g} s, {args.workers} workers: {seconds:.1f}s "
+              f"({60 * args.files / seconds:.1f} files/min), queue {queue.status()}")
+        print(f"  files per shard: {per_shard} ({len(shards)} shard manifests)")
+
+    if problems:
+        print("\n".join(problems))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
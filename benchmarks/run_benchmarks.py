@@ -0,0 +1,162 @@
+"""
+Per-stage benchmark suite on deterministic synthetic audio.
+
+    python benchmarks/run_benchmarks.py                       # compare against baselines.json
+    python benchmarks/run_benchmarks.py --save-baseline       # record new baselines
+    python benchmarks/run_benchmarks.py --lengths 10,60,600,7200 --signals mixed,clicks
+
+For every signal type and length, each pipeline stage is timed (best of --repeat
+runs) and its peak traced memory is measured in a separate run, so the memory
+tracer does not distort the timings. Results are compared with the stored
+baselines and the script exits non-zero if any stage got slower or bigger than
+the baseline by more than --tolerance. Baselines are machine specific: record
+them on the machine that runs the comparison.
+"""
+
+import argparse
+import contextlib
+import gc
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from feature_detection import detect_features  # noqa: E402
+from segmentation import (  # noqa: E402
+    segment_by_beats, segment_by_transients, segment_by_frequency, segment_by_frequency_bands, segment_by_onsets,
+)
+from clustering import cluster_segments_kmeans  # noqa: E402
+from utils import chop_audio_with_metadata  # noqa: E402
+from synthetic import SIGNALS, write_wav  # noqa: E402
+
+DEFAULT_BASELINES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+OCTAVE_BANDS = [(low, 2 * low) for low in (62.5, 125, 250, 500, 1000, 2000, 4000, 8000)]
+
+# Stage name -> function of the shared context. Later stages use earlier stages' results.
+STAGES = {
+    "detect_features": lambda ctx: detect_features(ctx["audio_file"]),
+    "segment_by_beats": lambda ctx: segment_by_beats(ctx["features"]),
+    "segment_by_transients": lambda ctx: segment_by_transients(ctx["features"]),
+    "segment_by_frequency": lambda ctx: segment_by_frequency(ctx["features"]),
+    "segment_by_frequency_bands": lambda ctx: segment_by_frequency_bands(ctx["features"], OCTAVE_BANDS),
+    "segment_by_onsets": lambda ctx: segment_by_onsets(ctx["features"]),
+    "cluster_segments_kmeans": lambda ctx: cluster_segments_kmeans(ctx["audio_file"], ctx["segments"]),
+    "chop_audio_with_metadata": lambda ctx: chop_audio_with_metadata(ctx["audio_file"], ctx["segments"],
+                                                                      output_root=ctx["output_root"]),
+}
+
+
+def measure(fn, ctx, repeat):
+    """Return (result, best wall time in seconds, peak traced memory in MB)."""
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        result = fn(ctx)
+        best = min(best, time.perf_counter() - start)
+
+    gc.collect()
+    tracemalloc.start()
+    fn(ctx)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, best, peak / 2 ** 20
+
+
+def run_suite(signals, lengths, stages, repeat, max_segments, quiet=True):
+    """Run the selected stages on every signal/length pair. Returns {key: {"seconds", "peak_mb"}}."""
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp, open(os.devnull, "w") as devnull:
+        stage_output = devnull if quiet else sys.stdout
+        for signal in signals:
+            for length in lengths:
+                audio_file = write_wav(os.path.join(tmp, f"{signal}_{length}.wav"), SIGNALS[signal](length))
+                ctx = {"audio_file": audio_file, "output_root": os.path.join(tmp, "out")}
+                with contextlib.redirect_stdout(stage_output):
+                    ctx["features"] = detect_features(audio_file)
+                    ctx["segments"] = segment_by_transients(ctx["features"])[:max_segments]
+                for stage in stages:
+                    key = f"{signal}/{length}s/{stage}"
+                    with contextlib.redirect_stdout(stage_output):
+                        _, seconds, peak_mb = measure(STAGES[stage], ctx, repeat)
+                    results[key] = {"seconds": round(seconds, 4), "peak_mb": round(peak_mb, 2)}
+                    print(f"{key:60s} {seconds:9.3f}s {peak_mb:9.1f} MB")
+    return results
+
+
+def compare(results, baselines, tolerance, memory_tolerance):
+    """Return a list of regressions of results against baselines."""
+    regressions = []
+    for key, result in results.items():
+        baseline = baselines.get(key)
+        if baseline is None:
+            continue
+        if result["seconds"] > baseline["seconds"] * (1 + tolerance) and result["seconds"] - baseline["seconds"] > 0.01:
+            regressions.append(f"{key}: {result['seconds']:.3f}s vs baseline {baseline['seconds']:.3f}s")
+        if result["peak_mb"] > baseline["peak_mb"] * (1 + memory_tolerance) and result["peak_mb"] - baseline["peak_mb"] > 1:
+            regressions.append(f"{key}: {result['peak_mb']:.1f} MB vs baseline {baseline['peak_mb']:.1f} MB")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Per-stage benchmarks on synthetic audio")
+    parser.add_argument("--signals", default="mixed", help=f"Comma-separated, from: {', '.join(SIGNALS)}")
+    parser.add_argument("--lengths", default="10,60", help="Comma-separated signal lengths in seconds (e.g. 10,60,600,7200)")
+    parser.add_argument("--stages", default=",".join(STAGES), help="Comma-separated stage names")
+    parser.add_argument("--repeat", type=int, default=3, help="Timing runs per stage (best is kept)")
+    parser.add_argument("--max-segments", type=int, default=200, help="Segments fed to the clustering/export stages")
+    parser.add_argument("--baselines", default=DEFAULT_BASELINES, help="Baseline JSON file")
+    parser.add_argument("--save-baseline", action="store_true", help="Store these results as the new baselines")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative slowdown (0.25 = 25%%)")
+    parser.add_argument("--memory-tolerance", type=float, default=0.25, help="Allowed relative peak memory growth")
+    parser.add_argument("--output", default=None, help="Also write the results to this JSON file")
+    parser.add_argument("--verbose", action="store_true", help="Show the stages' own output")
+    args = parser.parse_args(argv)
+
+    signals = args.signals.split(",")
+    lengths = [int(float(length)) for length in args.lengths.split(",")]
+    stages = args.stages.split(",")
+    for name in signals:
+        if name not in SIGNALS:
+            parser.error(f"Unknown signal: {name}")
+    for name in stages:
+        if name not in STAGES:
+            parser.error(f"Unknown stage: {name}")
+
+    results = run_suite(signals, lengths, stages, args.repeat, args.max_segments, quiet=not args.verbose)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    baselines = {}
+    if os.path.exists(args.baselines):
+        with open(args.baselines) as f:
+            baselines = json.load(f)
+
+    if args.save_baseline:
+        baselines.update(results)
+        with open(args.baselines, "w") as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+        print(f"\nSaved {len(results)} baselines to {args.baselines}")
+        return 0
+
+    if not baselines:
+        print("\nNo baselines found; run with --save-baseline first")
+        return 0
+    regressions = compare(results, baselines, args.tolerance, args.memory_tolerance)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) beyond tolerance:")
+        for regression in regressions:
+            print(f"  - {regression}")
+        return 1
+    print("\nNo regressions beyond tolerance")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
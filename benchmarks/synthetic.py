@@ -0,0 +1,78 @@
+"""
+Deterministic synthetic test signals for benchmarks.
+
+Every generator takes a duration in seconds and a seed and always returns the
+same float32 signal for the same arguments.
+"""
+
+import numpy as np
+import soundfile as sf
+from scipy.signal import lfilter
+
+SR = 22050
+
+
+def click_track(duration, sr=SR, interval=0.5, seed=0):
+    """Decaying noise bursts every `interval` seconds over a quiet noise floor, with a few tonal hits."""
+    rng = np.random.default_rng(seed)
+    n = int(duration * sr)
+    y = 0.002 * rng.standard_normal(n)
+    burst_len = int(0.08 * sr)
+    envelope = np.exp(-np.linspace(0, 8, burst_len))
+    tone_t = np.arange(burst_len) / sr
+    for k, start in enumerate(np.arange(0.25, duration - 0.1, interval)):
+        i = int(start * sr)
+        burst = rng.standard_normal(burst_len) if k % 3 else np.sin(2 * np.pi * 440 * (1 + k % 5) * tone_t)
+        y[i:i + burst_len] += 0.5 * envelope[:n - i] * burst[:n - i]
+    return y.astype(np.float32)
+
+
+def tonal_sweep(duration, sr=SR, f_min=80.0, f_max=8000.0, period=10.0, seed=0):
+    """Exponential sine sweeps from f_min to f_max, restarting every `period` seconds."""
+    t = np.arange(int(duration * sr)) / sr
+    phase_t = t % period
+    k = np.log(f_max / f_min) / period
+    phase = 2 * np.pi * f_min * (np.exp(k * phase_t) - 1) / k
+    return (0.4 * np.sin(phase)).astype(np.float32)
+
+
+def noise(duration, sr=SR, seed=0):
+    """Pink-ish noise (white noise through a one-pole lowpass) with slow amplitude modulation."""
+    rng = np.random.default_rng(seed)
+    n = int(duration * sr)
+    white = rng.standard_normal(n)
+    pink = lfilter([0.1], [1, -0.9], white)
+    modulation = 0.5 + 0.5 * np.sin(2 * np.pi * 0.1 * np.arange(n) / sr)
+    return (0.2 * pink * modulation).astype(np.float32)
+
+
+def with_silence_gaps(y, sr=SR, gap=2.0, every=8.0):
+    """Zero out `gap` seconds of the signal every `every` seconds."""
+    y = y.copy()
+    for start in np.arange(every - gap, len(y) / sr, every):
+        y[int(start * sr):int((start + gap) * sr)] = 0
+    return y
+
+
+def mixed_signal(duration, sr=SR, seed=0):
+    """Alternating 10 s blocks of clicks, sweeps and noise, with silence gaps."""
+    parts = [click_track(duration, sr, seed=seed), tonal_sweep(duration, sr, seed=seed), noise(duration, sr, seed=seed)]
+    block = int(10 * sr)
+    y = np.empty(int(duration * sr), dtype=np.float32)
+    for k, start in enumerate(range(0, len(y), block)):
+        y[start:start + block] = parts[k % len(parts)][start:start + block]
+    return with_silence_gaps(y, sr)
+
+
+SIGNALS = {
+    "clicks": click_track,
+    "sweep": tonal_sweep,
+    "noise": noise,
+    "gaps": lambda duration, sr=SR, seed=0: with_silence_gaps(click_track(duration, sr, seed=seed), sr),
+    "mixed": mixed_signal,
+}
+
+
+def write_wav(path, y, sr=SR):
+    sf.write(path, y, sr)
+    return path
@@ -1,24 +1,55 @@
+import os
+import logging
 import librosa
+import audio_io
 import numpy as np
-from sklearn.cluster import DBSCAN
-from sklearn.preprocessing import StandardScaler
-from sklearn.cluster import KMeans
+from functools import partial
+from shared_arrays import map_segments
 from utils import is_silent_segment
+from fingerprint import remove_duplicate_segments
+from instrumentation import timed, count
 
-def cluster_segments(audio_file, segments, eps=0.5, min_samples=1):
+logger = logging.getLogger(__name__)
+
+def _clustering_features(y, sr, segments, detailed=False):
+    """
+    Per segment: mean spectral centroid + MFCC, and with detailed=True also the
+    similarity vector (MFCC, chroma, spectral contrast), as a (features, similarity
+    features) pair. None for empty segments when detailed.
+    """
+    results = []
+    for start, end in segments:
+        segment = audio_io.as_float(y[int(start * sr):int(end * sr)])
+        if detailed and len(segment) == 0:
+            results.append(None)
+            continue
+        # Basic features for clustering
+        spectral_centroid = librosa.feature.spectral_centroid(y=segment, sr=sr).mean()
+        mfcc = librosa.feature.mfcc(y=segment, sr=sr).mean(axis=1)
+        features = np.concatenate(([spectral_centroid], mfcc))
+        if not detailed:
+            results.append(features)
+            continue
+        # Detailed features for similarity comparison
+        chroma = librosa.feature.chroma_stft(y=segment, sr=sr).mean(axis=1)
+        spectral_contrast = librosa.feature.spectral_contrast(y=segment, sr=sr).mean(axis=1)
+        results.append((features, np.concatenate([mfcc, chroma, spectral_contrast])))
+    return results
+
+def cluster_segments(audio_file, segments, eps=0.5, min_samples=1, n_jobs=1):
     """
     Cluster segments based on similarity using spectral features.
+    With n_jobs > 1 the features are extracted in worker processes reading the signal
+    from shared memory.
     Returns representative segments only.
     """
-    y, sr = librosa.load(audio_file)
+    from sklearn.cluster import DBSCAN
+    from sklearn.preprocessing import StandardScaler
+
+    y, sr = audio_io.load_signal(audio_file)
     
     # Extract features for each segment
-    features = []
-    for start, end in segments:
-        segment = y[int(start * sr):int(end * sr)]
-        spectral_centroid = librosa.feature.spectral_centroid(y=segment, sr=sr).mean()
-        mfcc = librosa.feature.mfcc(y=segment, sr=sr).mean(axis=1)
-        features.append(np.concatenate(([spectral_centroid], mfcc)))
+    features = map_segments(_clustering_features, y, sr, segments, n_jobs)
     
     # Standardize features
     features = StandardScaler().fit_transform(features)
@@ -40,13 +71,92 @@ def cluster_segments(audio_file, segments, eps=0.5, min_samples=1):
     
     return unique_segments
 
-def cluster_segments_kmeans(audio_file, segments, n_clusters=10, similarity_threshold=0.85):
+class ClusterModel:
+    """
+    Frozen feature scaler + k-means centroids.
+    A model fitted on one file (or a whole library) can be saved and reused to assign
+    the segments of any new file to the same clusters with a nearest-centroid step,
+    so cluster numbers mean the same thing across files.
+    """
+    def __init__(self, centroids, mean=None, scale=None, feature_set="kmeans", normalize=False):
+        self.centroids = np.asarray(centroids, dtype=np.float64)
+        n_dims = self.centroids.shape[1]
+        self.mean = np.zeros(n_dims) if mean is None else np.asarray(mean, dtype=np.float64)
+        self.scale = np.ones(n_dims) if scale is None else np.asarray(scale, dtype=np.float64)
+        self.feature_set = feature_set
+        self.normalize = normalize  # L2-normalise rows before scaling (models fitted on a library index)
+
+    @property
+    def n_clusters(self):
+        return len(self.centroids)
+
+    @classmethod
+    def fit(cls, features, n_clusters, feature_set="kmeans", standardize=True, random_state=42):
+        """Fit scaler and k-means on a (n_segments, n_features) matrix."""
+        from sklearn.cluster import KMeans
+        from sklearn.preprocessing import StandardScaler
+
+        features = np.asarray(features, dtype=np.float64)
+        mean, scale = None, None
+        if standardize:
+            scaler = StandardScaler().fit(features)
+            mean, scale = scaler.mean_, scaler.scale_
+            features = scaler.transform(features)
+        kmeans = KMeans(n_clusters=min(n_clusters, len(features)), random_state=random_state).fit(features)
+        return cls(kmeans.cluster_centers_, mean, scale, feature_set)
+
+    def transform(self, features):
+        """Apply the frozen scaler."""
+        features = np.asarray(features, dtype=np.float64)
+        if features.shape[-1] != self.centroids.shape[1]:
+            raise ValueError(f"Model expects {self.centroids.shape[1]} features per segment, got {features.shape[-1]}")
+        if self.normalize:
+            norms = np.linalg.norm(features, axis=-1, keepdims=True)
+            features = features / np.where(norms == 0, 1.0, norms)
+        return (features - self.mean) / self.scale
+
+    def predict(self, features, return_distances=False, scaled=False):
+        """
+        Assign each feature row to its nearest centroid (vectorised).
+        Pass scaled=True if the features have already been through transform().
+        """
+        x = features if scaled else self.transform(features)
+        distances = (
+            np.sum(x ** 2, axis=1)[:, None]
+            - 2 * x @ self.centroids.T
+            + np.sum(self.centroids ** 2, axis=1)[None, :]
+        )
+        labels = np.argmin(distances, axis=1)
+        if return_distances:
+            return labels, np.sqrt(np.maximum(distances[np.arange(len(x)), labels], 0))
+        return labels
+
+    def save(self, path):
+        """Save the model as a .npz file."""
+        np.savez(path, centroids=self.centroids, mean=self.mean, scale=self.scale,
+                 feature_set=np.array(self.feature_set), normalize=np.array(self.normalize))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            normalize = bool(data["normalize"]) if "normalize" in data else False
+            return cls(data["centroids"], data["mean"], data["scale"], str(data["feature_set"]), normalize)
+
+@timed()
+def cluster_segments_kmeans(audio_file, segments, n_clusters=10, similarity_threshold=0.85, model=None, save_model_path=None,
+                            n_jobs=1):
     """
     Cluster segments into a specific number of clusters using k-means and remove similar segments.
+    If a fitted ClusterModel is given, segments are assigned to its clusters instead of fitting
+    a new one. If save_model_path is given, the fitted model is saved there.
+    With n_jobs > 1 the per-segment features are extracted in worker processes reading the
+    signal from shared memory.
     Returns representative segments and cluster labels.
     """
+    from sklearn.preprocessing import StandardScaler
+
     if not segments:
-        print("No segments provided for clustering")
+        logger.info("No segments provided for clustering")
         return [], []
 
     # Filter out silent segments first
@@ -55,58 +165,64 @@ def cluster_segments_kmeans(audio_file, segments, n_clusters=10, similarity_thre
         if not is_silent_segment(audio_file, start, end):
             non_silent_segments.append((start, end))
         else:
-            print(f"Skipping silent segment: {start:.2f}s - {end:.2f}s")
+            logger.debug(f"Skipping silent segment: {start:.2f}s - {end:.2f}s")
+            count("silent_segments")
 
     if not non_silent_segments:
-        print("No non-silent segments found!")
+        logger.info("No non-silent segments found!")
         return [], []
 
     segments = non_silent_segments
-    y, sr = librosa.load(audio_file)
+    y, sr = audio_io.load_signal(audio_file)
+
+    # Drop sample-exact repeats cheaply before the feature-based similarity check
+    segments, duplicate_groups = remove_duplicate_segments(y, sr, segments)
+    if duplicate_groups:
+        logger.info(f"Removed {sum(len(g) - 1 for g in duplicate_groups)} repeated segments by fingerprint")
     features = []
     segment_features = []
 
     # Extract features for each segment
-    for start, end in segments:
-        segment = y[int(start * sr):int(end * sr)]
-        if len(segment) > 0:
-            # Basic features for clustering
-            spectral_centroid = librosa.feature.spectral_centroid(y=segment, sr=sr).mean()
-            mfcc = librosa.feature.mfcc(y=segment, sr=sr).mean(axis=1)
-            features.append(np.concatenate(([spectral_centroid], mfcc)))
-            
-            # Detailed features for similarity comparison
-            chroma = librosa.feature.chroma_stft(y=segment, sr=sr).mean(axis=1)
-            spectral_contrast = librosa.feature.spectral_contrast(y=segment, sr=sr).mean(axis=1)
-            segment_features.append(np.concatenate([mfcc, chroma, spectral_contrast]))
+    for result in map_segments(partial(_clustering_features, detailed=True), y, sr, segments, n_jobs):
+        if result is not None:
+            features.append(result[0])
+            segment_features.append(result[1])
 
     if not features:
-        print("No features could be extracted from segments")
+        logger.info("No features could be extracted from segments")
         return [], []
 
     # Convert to numpy array and reshape if necessary
-    features = np.array(features)
+    features = np.array(features, dtype=np.float32)
     if features.ndim == 1:
         features = features.reshape(-1, 1)
 
+    # Fit a new model or reuse a frozen one
+    if model is None:
+        model = ClusterModel.fit(features, n_clusters)
+        if save_model_path:
+            model.save(save_model_path)
+            logger.info(f"Saved cluster model to {save_model_path}")
+    elif model.feature_set != "kmeans":
+        raise ValueError(f"Cluster model was fitted on '{model.feature_set}' features, not 'kmeans'")
+
     # Scale features
-    features = StandardScaler().fit_transform(features)
-    segment_features = StandardScaler().fit_transform(np.array(segment_features))
+    features = model.transform(features)
+    segment_features = StandardScaler().fit_transform(np.array(segment_features, dtype=np.float32))
 
     # Perform clustering
-    kmeans = KMeans(n_clusters=min(n_clusters, len(features)), random_state=42)
-    cluster_labels = kmeans.fit_predict(features)
+    cluster_labels = model.predict(features, scaled=True)
 
     # Find representative segments and remove similar ones
     representative_segments = []
     final_labels = []
     used_indices = set()
 
-    for cluster in range(kmeans.n_clusters):
+    for cluster in range(model.n_clusters):
         cluster_indices = np.where(cluster_labels == cluster)[0]
         if len(cluster_indices) > 0:
             # Find the segment closest to cluster center
-            cluster_center = kmeans.cluster_centers_[cluster]
+            cluster_center = model.centroids[cluster]
             distances = [np.linalg.norm(features[idx] - cluster_center) for idx in cluster_indices]
             closest_idx = cluster_indices[np.argmin(distances)]
             
@@ -117,7 +233,7 @@ def cluster_segments_kmeans(audio_file, segments, n_clusters=10, similarity_thre
                            (np.linalg.norm(segment_features[closest_idx]) * np.linalg.norm(segment_features[used_idx]))
                 if similarity > similarity_threshold:
                     is_unique = False
-                    print(f"Skipping similar segment {closest_idx} (similarity: {similarity:.2f})")
+                    logger.debug(f"Skipping similar segment {closest_idx} (similarity: {similarity:.2f})")
                     break
             
             if is_unique:
@@ -125,5 +241,59 @@ def cluster_segments_kmeans(audio_file, segments, n_clusters=10, similarity_thre
                 final_labels.append(cluster)
                 used_indices.add(closest_idx)
 
-    print(f"Selected {len(representative_segments)} unique segments from {len(segments)} original segments")
-    return representative_segments, final_labels
\ No newline at end of file
+    count("segments", len(segments))
+    count("representatives", len(representative_segments))
+    logger.info(f"Selected {len(representative_segments)} unique segments from {len(segments)} original segments")
+    return representative_segments, final_labels
+
+@timed()
+def cluster_corpus(index, n_clusters=10, batch_size=10000, n_epochs=3, labels_path=None):
+    """
+    Out-of-core clustering of every segment in a SimilarityIndex.
+    Feature batches are streamed from the index three times: once to fit the scaler
+    incrementally, n_epochs times through MiniBatchKMeans.partial_fit, and once to
+    assign labels into a memory-mapped int32 array (row-aligned with the index, -1
+    for replaced rows). Memory use depends on batch_size, not on the corpus size.
+    Returns the fitted ClusterModel and the labels array.
+    """
+    from sklearn.cluster import MiniBatchKMeans
+    from sklearn.preprocessing import StandardScaler
+
+    if len(index) == 0:
+        raise ValueError("The library index is empty")
+    batch_size = max(batch_size, n_clusters)
+
+    logger.info(f"Clustering {len(index)} library segments into {n_clusters} clusters")
+    scaler = StandardScaler()
+    for _, vectors in index.iter_batches(batch_size):
+        scaler.partial_fit(vectors)
+        count("vectors", len(vectors))
+
+    kmeans = MiniBatchKMeans(n_clusters=n_clusters, random_state=42, batch_size=batch_size, n_init=3)
+    pending = None
+    for epoch in range(n_epochs):
+        for _, vectors in index.iter_batches(batch_size):
+            vectors = scaler.transform(vectors)
+            # The first partial_fit call needs at least n_clusters samples
+            if pending is not None:
+                vectors = np.vstack([pending, vectors])
+                pending = None
+            if not hasattr(kmeans, "cluster_centers_") and len(vectors) < n_clusters:
+                pending = vectors
+                continue
+            kmeans.partial_fit(vectors)
+        logger.info(f"Finished pass {epoch + 1}/{n_epochs}")
+    if not hasattr(kmeans, "cluster_centers_"):
+        raise ValueError(f"Need at least {n_clusters} segments to form {n_clusters} clusters")
+
+    model = ClusterModel(kmeans.cluster_centers_, scaler.mean_, scaler.scale_, feature_set="similarity", normalize=True)
+
+    if labels_path is None:
+        labels_path = os.path.join(index.path, "corpus_labels.i32")
+    labels = np.memmap(labels_path, dtype=np.int32, mode="w+", shape=(len(index),))
+    labels[:] = -1
+    for rows, vectors in index.iter_batches(batch_size):
+        labels[rows] = model.predict(scaler.transform(vectors), scaled=True)
+    labels.flush()
+    logger.info(f"Wrote corpus labels to {labels_path}")
+    return model, labels
\ No newline at end of file
@@ -0,0 +1,202 @@
+"""
+Fixed-shape training datasets of segments, stored as memory-mappable .npy arrays.
+
+export_dataset runs the analysis on a list of files and writes one row per segment,
+so a data loader can read random batches straight from the arrays (np.load with
+mmap_mode="r") instead of re-decoding exported WAVs and recomputing features.
+
+Layout of a dataset directory:
+    features.npy      (n, d) float32 similarity feature vectors (mean MFCC, chroma, spectral contrast)
+    labels.npy        (n,) int32 cluster labels, -1 when the dataset was not clustered
+    segments.npy      (n,) records: source (index into schema["sources"]), start, end (s), and
+                      with windows, valid (samples of the window that hold audio)
+    audio.npy         (n, window samples) mono windows at the analysis rate, cropped to the window
+                      length from the segment start and zero-padded (only with window=...)
+    cluster_model.npz the model labels were assigned with (when clustered)
+    schema.json       shapes, dtypes, feature layout, sample rate and analysis settings
+
+schema.json is written last: a directory without it is an unfinished export.
+"""
+
+import json
+import logging
+import os
+import numpy as np
+import audio_io
+from clustering import ClusterModel
+from pipeline import segment_file
+from instrumentation import timed, stage, count
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_VERSION = 1
+# Blocks of segment_similarity_features, in order
+FEATURE_LAYOUT = [("mfcc", 20), ("chroma", 12), ("spectral_contrast", 7)]
+WINDOW_DTYPES = {"float32": np.float32, "int16": np.int16}
+
+
+def feature_names(dim):
+    """Column names of the feature matrix (generic names if the layout does not match dim)."""
+    names = [f"{block}_{i}" for block, size in FEATURE_LAYOUT for i in range(size)]
+    return names if len(names) == dim else [f"feature_{i}" for i in range(dim)]
+
+
+def segment_dtype(windows):
+    fields = [("source", np.int32), ("start", np.float64), ("end", np.float64)]
+    if windows:
+        fields.append(("valid", np.int32))
+    return np.dtype(fields)
+
+
+def _write_json_atomic(path, data):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+@timed()
+def export_dataset(audio_files, path, window=None, window_dtype="float32", n_clusters=None, cluster_model=None,
+                   **analysis_options):
+    """
+    Segment every file and write the dataset arrays to directory `path`.
+    window (seconds) adds fixed-length audio windows; window_dtype "int16" halves their size.
+    Labels come from cluster_model, or from one model with n_clusters fitted on the whole
+    dataset, so label numbers mean the same thing in every file. analysis_options are
+    passed to segment_file (method, min_time, similarity_threshold, ...).
+    Files that yield no segments are listed in the schema but have no rows.
+    Returns the schema dict.
+    """
+    if window_dtype not in WINDOW_DTYPES:
+        raise ValueError(f"Unknown window dtype '{window_dtype}', expected one of {sorted(WINDOW_DTYPES)}")
+    os.makedirs(path, exist_ok=True)
+    schema_path = os.path.join(path, "schema.json")
+    if os.path.exists(schema_path):
+        os.remove(schema_path)  # the directory is being rewritten
+
+    # Pass 1: analysis. Segment times and feature vectors are small enough to hold for the whole dataset.
+    sources, rows, vectors = [], [], []
+    for audio_file in audio_files:
+        with stage("dataset_analysis", audio_file=audio_file):
+            segments, file_vectors = segment_file(audio_file, **analysis_options)
+        source = len(sources)
+        sources.append(os.path.abspath(audio_file))
+        rows.extend((source, start, end) for start, end in segments)
+        vectors.extend(file_vectors)
+        logger.info(f"{audio_file}: {len(segments)} segments")
+    if not rows:
+        raise ValueError("No segments found in any of the files")
+    features = np.asarray(vectors, dtype=np.float32)
+    count("segments", len(rows))
+
+    if cluster_model is None and n_clusters:
+        cluster_model = ClusterModel.fit(features, n_clusters, feature_set="similarity", standardize=False)
+    labels = np.full(len(rows), -1, dtype=np.int32)
+    if cluster_model is not None:
+        labels[:] = cluster_model.predict(features)
+        cluster_model.save(os.path.join(path, "cluster_model.npz"))
+
+    segments = np.zeros(len(rows), dtype=segment_dtype(window))
+    segments["source"], segments["start"], segments["end"] = zip(*rows)
+    np.save(os.path.join(path, "features.npy"), features)
+    np.save(os.path.join(path, "labels.npy"), labels)
+
+    sr = audio_io.analysis_rate()
+    arrays = {"features": features, "labels": labels, "segments": segments}
+    if window:
+        # Pass 2: windows, written file by file into a preallocated memory map
+        n_samples = audio_io.time_to_sample(window, sr)
+        audio = np.lib.format.open_memmap(os.path.join(path, "audio.npy"), mode="w+",
+                                          dtype=WINDOW_DTYPES[window_dtype], shape=(len(rows), n_samples))
+        with stage("dataset_windows"):
+            for source, audio_file in enumerate(audio_files):
+                file_rows = np.flatnonzero(segments["source"] == source)
+                if len(file_rows):
+                    segments["valid"][file_rows] = _write_windows(audio_file, segments[file_rows], audio, file_rows)
+        audio.flush()
+        arrays["audio"] = audio
+        del audio
+    np.save(os.path.join(path, "segments.npy"), segments)
+
+    schema = {
+        "version": SCHEMA_VERSION,
+        "n_segments": len(rows),
+        "arrays": {name: {"file": f"{name}.npy", "dtype": np.lib.format.dtype_to_descr(array.dtype),
+                          "shape": list(array.shape)} for name, array in arrays.items()},
+        "feature_names": feature_names(features.shape[1]),
+        "sample_rate": sr,
+        "window": None if not window else {"seconds": window, "samples": audio_io.time_to_sample(window, sr),
+                                           "dtype": window_dtype, "align": "start", "pad": "zeros"},
+        "cluster_model": "cluster_model.npz" if cluster_model is not None else None,
+        "n_clusters": cluster_model.n_clusters if cluster_model is not None else None,
+        "sources": sources,
+        "analysis": {name: value for name, value in analysis_options.items() if name != "n_jobs"},
+        "audio_io": audio_io.settings(),
+    }
+    _write_json_atomic(schema_path, schema)
+    logger.info(f"Wrote {len(rows)} segments from {len(sources)} files to {path}")
+    return schema
+
+
+def _write_windows(audio_file, segments, audio, rows):
+    """Copy each segment's first window of analysis audio into audio[rows]. Returns the valid sample counts."""
+    y, sr = audio_io.load_signal(audio_file)
+    n_samples = audio.shape[1]
+    valid = np.zeros(len(rows), dtype=np.int32)
+    for i, (row, segment) in enumerate(zip(rows, segments)):
+        first = audio_io.time_to_sample(segment["start"], sr)
+        last = min(audio_io.time_to_sample(segment["end"], sr), first + n_samples, len(y))
+        chunk = y[first:max(first, last)]
+        if audio.dtype == np.int16:
+            chunk = chunk if chunk.dtype == np.int16 else audio_io.to_int16(chunk)
+        else:
+            chunk = audio_io.as_float(chunk)
+        audio[row, :len(chunk)] = chunk
+        valid[i] = len(chunk)
+    count("windows", len(rows))
+    return valid
+
+
+class SegmentDataset:
+    """
+    Read side of an exported dataset. The arrays are opened as read-only memory maps, so
+    opening is instant and a batch only pages in the rows it touches:
+
+        dataset = SegmentDataset("train_set")
+        for batch in dataset.batches(256, shuffle=True, seed=0):
+            batch["features"], batch["labels"], batch["audio"], batch["segments"]
+    """
+
+    def __init__(self, path):
+        self.path = path
+        schema_path = os.path.join(path, "schema.json")
+        if not os.path.exists(schema_path):
+            raise FileNotFoundError(f"{path} has no schema.json (not a dataset, or an unfinished export)")
+        with open(schema_path) as f:
+            self.schema = json.load(f)
+        if self.schema["version"] != SCHEMA_VERSION:
+            raise ValueError(f"Dataset schema version {self.schema['version']}, expected {SCHEMA_VERSION}")
+        self.arrays = {name: np.load(os.path.join(path, spec["file"]), mmap_mode="r")
+                       for name, spec in self.schema["arrays"].items()}
+
+    def __len__(self):
+        return self.schema["n_segments"]
+
+    def __getitem__(self, name):
+        return self.arrays[name]
+
+    @property
+    def sources(self):
+        return self.schema["sources"]
+
+    def batch(self, indices):
+        """Rows `indices` of every array, as a dict of in-memory arrays."""
+        indices = np.sort(np.asarray(indices))  # ascending reads are sequential on disk
+        return {name: np.asarray(array[indices]) for name, array in self.arrays.items()}
+
+    def batches(self, batch_size, shuffle=False, seed=None, drop_last=False):
+        """Yield batch dicts covering the dataset once, in random order with shuffle=True."""
+        order = np.random.default_rng(seed).permutation(len(self)) if shuffle else np.arange(len(self))
+        stop = len(order) - len(order) % batch_size if drop_last else len(order)
+        for first in range(0, stop, batch_size):
+            yield self.batch(order[first:first + batch_size])
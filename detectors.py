@@ -0,0 +1,176 @@
+"""
+Registry of feature detectors and the intermediate representations they share.
+
+A detector declares the intermediates it needs and receives them as arguments;
+an intermediate may itself need others:
+
+    @intermediate("stft")
+    def _stft(ctx):
+        return np.abs(librosa.stft(ctx.y))
+
+    @detector("spectral_centroid", requires=["stft"])
+    def _centroid(ctx, S):
+        return librosa.feature.spectral_centroid(S=S, sr=ctx.sr)[0]
+
+run_detectors computes each intermediate at most once per signal, hands it to every
+detector that needs it, and drops it as soon as no remaining detector (or
+intermediate) does, so only the representations still in use are held.
+
+Frame-level detectors (the default) return one value, or one column, per analysis
+frame (frames on the last axis); chunked analysis computes them per chunk and
+stitches them. Event detectors (frame_level=False) pick events from whole-file
+intermediates and must only require frame-level intermediates, which chunked analysis
+stitches for them. A detector may produce several features (outputs=...), returned
+as a tuple in that order.
+
+The built-in detectors are registered by feature_detection; other modules can
+register more, and are imported by name in worker processes.
+"""
+
+import importlib
+import logging
+from instrumentation import count
+
+logger = logging.getLogger(__name__)
+
+_INTERMEDIATES = {}
+_DETECTORS = {}
+
+
+class Step:
+    def __init__(self, name, function, requires=(), outputs=None, frame_level=True):
+        self.name = name
+        self.function = function
+        self.requires = tuple(requires)
+        self.outputs = tuple(outputs or (name,))
+        self.frame_level = frame_level
+        self.module = function.__module__
+
+
+class Context:
+    """
+    What detectors see: the analysis signal (None for event detectors in chunked mode),
+    its sample rate and the run's options (e.g. beat_window, n_jobs).
+    """
+
+    def __init__(self, y, sr, **options):
+        self.y = y
+        self.sr = sr
+        self.options = options
+
+
+def intermediate(name, requires=()):
+    """Register an intermediate representation: function(ctx, *required intermediates)."""
+    def register(function):
+        if name in _INTERMEDIATES or any(name in step.outputs for step in _DETECTORS.values()):
+            raise ValueError(f"'{name}' is already registered")
+        _INTERMEDIATES[name] = Step(name, function, requires)
+        return function
+    return register
+
+
+def detector(name, requires=(), outputs=None, frame_level=True):
+    """Register a detector: function(ctx, *required intermediates) -> feature (or a tuple, one per output)."""
+    def register(function):
+        step = Step(name, function, requires, outputs, frame_level)
+        taken = set(_INTERMEDIATES) | {output for other in _DETECTORS.values() for output in other.outputs}
+        if name in _DETECTORS or taken & set(step.outputs):
+            raise ValueError(f"'{name}' is already registered")
+        unknown = [r for r in step.requires if r not in _INTERMEDIATES]
+        if unknown:
+            raise ValueError(f"Detector '{name}' requires unknown intermediates {unknown}")
+        _DETECTORS[name] = step
+        return function
+    return register
+
+
+def available():
+    """Names of the registered detectors, in registration order."""
+    return list(_DETECTORS)
+
+
+def _steps(names):
+    unknown = [name for name in names if name not in _DETECTORS]
+    if unknown:
+        raise ValueError(f"Unknown detectors {unknown}, expected some of {available()}")
+    # Registration order, so detectors sharing the big intermediates run next to each other
+    return [step for name, step in _DETECTORS.items() if name in set(names)]
+
+
+def split_detectors(names):
+    """
+    For chunked analysis: (frame-level detector names, event detector names, frame-level
+    intermediates the event detectors need).
+    """
+    steps = _steps(names)
+    frame_level = [step.name for step in steps if step.frame_level]
+    events = [step for step in steps if not step.frame_level]
+    needed = list(dict.fromkeys(r for step in events for r in step.requires))
+    return frame_level, [step.name for step in events], needed
+
+
+def frame_outputs(names):
+    """Feature names produced by the frame-level detectors among names."""
+    return [output for step in _steps(names) if step.frame_level for output in step.outputs]
+
+
+def detector_modules(names):
+    """Modules defining these detectors and their intermediates, to import in worker processes."""
+    modules = {step.module for step in _steps(names)}
+    pending = [r for step in _steps(names) for r in step.requires]
+    while pending:
+        step = _INTERMEDIATES[pending.pop()]
+        modules.add(step.module)
+        pending.extend(step.requires)
+    return sorted(modules)
+
+
+def import_modules(modules):
+    for module in modules:
+        importlib.import_module(module)
+
+
+def run_detectors(ctx, names, keep=(), provided=None):
+    """
+    Run the named detectors on ctx. keep lists intermediates to return as well;
+    provided maps intermediates that are already computed to their values.
+    Returns (features, kept intermediates).
+    """
+    steps = _steps(names)
+    cache = dict(provided or {})
+    # Pending consumers of each intermediate; it is released when this drops to zero
+    pending = {}
+    scheduled = set(cache)
+
+    def schedule(requires):
+        for r in requires:
+            pending[r] = pending.get(r, 0) + 1
+            if r not in scheduled:
+                scheduled.add(r)
+                schedule(_INTERMEDIATES[r].requires)
+
+    for step in steps:
+        schedule(step.requires)
+    schedule(keep)
+
+    def release(requires):
+        for r in requires:
+            pending[r] -= 1
+            if not pending[r]:
+                del cache[r]
+
+    def compute(name):
+        if name not in cache:
+            step = _INTERMEDIATES[name]
+            value = step.function(ctx, *[compute(r) for r in step.requires])
+            release(step.requires)
+            cache[name] = value
+            count("intermediates")
+        return cache[name]
+
+    features = {}
+    for step in steps:
+        value = step.function(ctx, *[compute(r) for r in step.requires])
+        release(step.requires)
+        features.update(zip(step.outputs, value if len(step.outputs) > 1 else (value,)))
+    return features, {name: compute(name) for name in keep}
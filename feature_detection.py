@@ -1,6 +1,38 @@
+import importlib.util
+import os
+from concurrent.futures import ProcessPoolExecutor
 import librosa
+import audio_io
 import numpy as np
-import matplotlib.pyplot as plt
+from detectors import Context, detector, intermediate, run_detectors, split_detectors, frame_outputs, \
+    detector_modules, import_modules
+from interval_index import IntervalIndex
+from instrumentation import timed, count
+
+HOP_LENGTH = 512  # librosa's default hop, shared by every frame-based feature below
+CHUNK_DURATION = 60.0  # seconds of audio each worker owns in chunk-parallel mode
+CHUNK_OVERLAP = 2.0  # extra context on each side of a chunk, discarded after analysis
+# Rough working memory of _analyze_chunk per analysed frame: complex STFT, magnitudes
+# and the mel/onset intermediates, in bytes per frequency bin
+ANALYSIS_BYTES_PER_BIN = 24
+N_FFT = 2048
+BEAT_WINDOW_OVERLAP = 15.0  # seconds shared by neighbouring windows of the windowed beat tracker
+# What detect_features computes unless told otherwise; see detectors.available() for the rest
+DEFAULT_DETECTORS = ["onsets", "beats", "transients", "spectral_centroid", "spectral_rolloff", "spectral_bandwidth"]
+# Coarse-to-fine onset envelope (coarse_onsets=True): a cheap pass at a low rate finds candidate
+# onsets, and the full-resolution envelope is only computed within FINE_MARGIN of them
+COARSE_SR = 5512
+COARSE_N_FFT = 512
+COARSE_HOP = 256  # 46 ms frames, twice the analysis hop
+COARSE_MELS = 32
+COARSE_GATE_DB = 60.0  # candidates quieter than this below the loudest coarse frame are dropped
+COARSE_DELTA = 0.02  # peak threshold of the coarse envelope; well below onset_detect's 0.07 so candidates over-cover
+FINE_MARGIN = 0.25  # seconds of full-resolution envelope on each side of a candidate
+FINE_MAX_COVERAGE = 0.75  # above this share of the frames, regions cost more than one pass over everything
+FINE_CONTEXT_FRAMES = 8  # extra frames analysed (and discarded) at region edges: STFT window and onset lag
+# Detectors that only read onset_env, which coarse_onsets replaces
+ONSET_ENV_DETECTORS = ["onsets", "transients"]
+TOP_DB = 80.0  # dynamic range of the log-mel spectrogram, as librosa.power_to_db
 
 def detect_transients(y, sr):
     onset_env = librosa.onset.onset_strength(y=y, sr=sr)
@@ -23,17 +55,161 @@ def detect_spectral_features(y, sr):
         "spectral_bandwidth": (times, spectral_bandwidth[0]),
     }
 
-def detect_features(audio_file):
-    """Detect various audio features."""
-    y, sr = librosa.load(audio_file)
-    
-    # Store audio file path in features
-    features = {
-        "audio_file": audio_file
-    }
-    
-    # Detect onsets
-    onset_env = librosa.onset.onset_strength(y=y, sr=sr)
+@timed()
+def detect_features(audio_file, n_jobs=1, chunk_duration=CHUNK_DURATION, overlap_duration=CHUNK_OVERLAP,
+                    beat_window=None, detectors=None, coarse_onsets=False, channels=False):
+    """
+    Detect various audio features.
+    detectors names the registered detectors to run (default DEFAULT_DETECTORS); each
+    intermediate they need (STFT, mel spectrogram, onset envelope) is computed once and
+    shared. Frame-level features come back as (times, values).
+    With n_jobs > 1 (or -1 for all cores), files longer than one chunk are analysed
+    chunk-parallel across a process pool (see detect_features_chunked).
+    In low-memory mode the signal is held as int16 and always analysed in chunks sized
+    to the memory budget.
+    features["tempo"] is a tempo curve (times, bpm): each bpm holds from its time until
+    the next one. It has a single point unless beat_window (seconds) is given, in which
+    case beats are tracked in overlapping windows with a local tempo each
+    (see track_beats_windowed).
+    With coarse_onsets=True, the onset envelope behind "onsets" and "transients" is only
+    computed around candidates from a cheap coarse pass (see coarse_to_fine_onset_env);
+    onsets in quiet or steady stretches the coarse pass skips are not reported.
+    With channels=True the file is decoded once with its channels kept and every
+    detector runs on all of them in the same calls (channels on the first axis):
+    frame-level values get a leading channel axis and event features become one array
+    per channel (see segmentation.channel_features); features["channels"] is the count.
+    The whole multichannel signal is held as float32, also in low-memory mode.
+    """
+    if n_jobs == -1:
+        n_jobs = os.cpu_count() or 1
+    detectors = list(DEFAULT_DETECTORS if detectors is None else detectors)
+    if channels:
+        y, sr = audio_io.load_channels(audio_file)
+        if audio_io.low_memory():
+            chunk_duration = min(chunk_duration, low_memory_chunk_duration(sr, n_jobs) / len(y))
+        if audio_io.low_memory() or (n_jobs > 1 and y.shape[-1] > chunk_duration * sr):
+            features = detect_features_chunked(y, sr, audio_file, n_jobs, chunk_duration, overlap_duration,
+                                               beat_window, detectors, coarse_onsets)
+        else:
+            ctx = Context(y, sr, n_jobs=n_jobs, beat_window=beat_window)
+            features, _ = run_detectors(ctx, detectors, provided=_coarse_provided(y, sr, detectors, coarse_onsets))
+            features = _with_times(features, sr, audio_file, detectors)
+        features["channels"] = len(y)
+        return features
+    if audio_io.low_memory():
+        y, sr = audio_io.load_signal(audio_file)
+        chunk_duration = min(chunk_duration, low_memory_chunk_duration(sr, n_jobs))
+        return detect_features_chunked(y, sr, audio_file, n_jobs, chunk_duration, overlap_duration, beat_window,
+                                       detectors, coarse_onsets)
+
+    y, sr = audio_io.load(audio_file)
+    if n_jobs > 1 and len(y) > chunk_duration * sr:
+        return detect_features_chunked(y, sr, audio_file, n_jobs, chunk_duration, overlap_duration, beat_window,
+                                       detectors, coarse_onsets)
+
+    ctx = Context(y, sr, n_jobs=n_jobs, beat_window=beat_window)
+    features, _ = run_detectors(ctx, detectors, provided=_coarse_provided(y, sr, detectors, coarse_onsets))
+    count("samples", len(y))
+    return _with_times(features, sr, audio_file, detectors)
+
+def _coarse_provided(y, sr, detectors, coarse_onsets):
+    """The coarse-to-fine onset envelope as a provided intermediate, when it is wanted and used."""
+    if coarse_onsets and set(detectors) & set(ONSET_ENV_DETECTORS):
+        if y.ndim == 2:
+            return {"onset_env": np.stack([coarse_to_fine_onset_env(channel, sr) for channel in y])}
+        return {"onset_env": coarse_to_fine_onset_env(y, sr)}
+    return None
+
+def _with_times(features, sr, audio_file, detectors):
+    """Pair frame-level features with their frame times and add the audio file path."""
+    for name in frame_outputs(detectors):
+        values = features[name]
+        features[name] = (librosa.frames_to_time(np.arange(values.shape[-1]), sr=sr, hop_length=HOP_LENGTH), values)
+    features["audio_file"] = audio_file
+    if "onsets" in features:
+        count("onsets", sum(map(len, features["onsets"])) if isinstance(features["onsets"], list)
+              else len(features["onsets"]))
+    return features
+
+# Shared intermediates. Each is computed at most once per signal (or chunk). A signal may
+# have channels on its first axis; every intermediate and frame-level detector then
+# handles them in one call, with frames on the last axis.
+
+@intermediate("stft")
+def _stft(ctx):
+    """STFT magnitude"""
+    return np.abs(librosa.stft(audio_io.as_float(ctx.y), n_fft=N_FFT, hop_length=HOP_LENGTH))
+
+@intermediate("mel", requires=["stft"])
+def _mel(ctx, S):
+    """Power mel spectrogram"""
+    return librosa.feature.melspectrogram(S=S ** 2, sr=ctx.sr)
+
+@intermediate("log_mel", requires=["mel"])
+def _log_mel(ctx, mel):
+    """librosa.power_to_db(mel), with the TOP_DB floor taken per channel"""
+    log_mel = librosa.power_to_db(mel, top_db=None)
+    return np.maximum(log_mel, log_mel.max(axis=(-2, -1), keepdims=True) - TOP_DB)
+
+@intermediate("onset_env", requires=["log_mel"])
+def _onset_env(ctx, log_mel):
+    """Same as librosa.onset.onset_strength(y=y, sr=sr)"""
+    return librosa.onset.onset_strength(S=log_mel, sr=ctx.sr)
+
+@intermediate("beat_onset_env", requires=["log_mel"])
+def _beat_onset_env(ctx, log_mel):
+    """Median-aggregated onset envelope, as librosa.beat.beat_track(y=y, sr=sr) computes it"""
+    return librosa.onset.onset_strength(S=log_mel, sr=ctx.sr, aggregate=np.median)
+
+# Built-in detectors, in the order they run: those on the STFT first, so it can be
+# released before the mel-based ones finish
+
+@detector("spectral_centroid", requires=["stft"])
+def _spectral_centroid(ctx, S):
+    return librosa.feature.spectral_centroid(S=S, sr=ctx.sr)[..., 0, :]
+
+@detector("spectral_rolloff", requires=["stft"])
+def _spectral_rolloff(ctx, S):
+    return librosa.feature.spectral_rolloff(S=S, sr=ctx.sr)[..., 0, :]
+
+@detector("spectral_bandwidth", requires=["stft"])
+def _spectral_bandwidth(ctx, S):
+    return librosa.feature.spectral_bandwidth(S=S, sr=ctx.sr)[..., 0, :]
+
+def _channelwise(function, S):
+    """function(S) on a mono spectrogram, stacked over channels for a multichannel one."""
+    return function(S) if S.ndim == 2 else np.stack([function(channel) for channel in S])
+
+# Contrast has a dB floor relative to the whole input and chroma estimates one tuning for
+# it, so both run channel by channel to give each channel the same result as on its own
+
+@detector("spectral_contrast", requires=["stft"])
+def _spectral_contrast(ctx, S):
+    return _channelwise(lambda S: librosa.feature.spectral_contrast(S=S, sr=ctx.sr), S)
+
+@detector("chroma", requires=["stft"])
+def _chroma(ctx, S):
+    return _channelwise(lambda S: librosa.feature.chroma_stft(S=S ** 2, sr=ctx.sr), S)
+
+@detector("rms", requires=["stft"])
+def _rms(ctx, S):
+    return librosa.feature.rms(S=S, frame_length=N_FFT)[..., 0, :]
+
+@detector("mfcc", requires=["log_mel"])
+def _mfcc(ctx, log_mel):
+    return librosa.feature.mfcc(S=log_mel, sr=ctx.sr)
+
+def _per_channel(function, onset_env):
+    """Run an event picker on a mono envelope, or on each row of a multichannel one (a list of results)."""
+    if onset_env.ndim == 1:
+        return function(onset_env)
+    return [function(channel) for channel in onset_env]
+
+@detector("onsets", requires=["onset_env"], frame_level=False)
+def _onsets(ctx, onset_env):
+    return _per_channel(lambda env: _pick_onsets(env, ctx.sr), onset_env)
+
+def _pick_onsets(onset_env, sr):
     onset_frames = librosa.onset.onset_detect(
         onset_envelope=onset_env,
         sr=sr,
@@ -43,32 +219,221 @@ def detect_features(audio_file):
         pre_max=3,  # number of frames for pre-maximum
         post_max=3  # number of frames for post-maximum
     )
-    features["onsets"] = librosa.frames_to_time(onset_frames, sr=sr)
-    
-    # Detect beats
-    tempo, beats = librosa.beat.beat_track(y=y, sr=sr)
-    features["beats"] = librosa.frames_to_time(beats, sr=sr)
-    features["tempo"] = tempo
-    
-    # Detect transients
-    onset_env = librosa.onset.onset_strength(y=y, sr=sr)
-    transients = librosa.onset.onset_detect(onset_envelope=onset_env, sr=sr)
-    features["transients"] = librosa.frames_to_time(transients, sr=sr)
-    
-    # Spectral features
-    times = librosa.times_like(onset_env, sr=sr)
-    spectral_centroids = librosa.feature.spectral_centroid(y=y, sr=sr)[0]
-    features["spectral_centroid"] = (times, spectral_centroids)
-    
-    spectral_rolloff = librosa.feature.spectral_rolloff(y=y, sr=sr)[0]
-    features["spectral_rolloff"] = (times, spectral_rolloff)
-    
-    spectral_bandwidth = librosa.feature.spectral_bandwidth(y=y, sr=sr)[0]
-    features["spectral_bandwidth"] = (times, spectral_bandwidth)
-    
-    return features
+    return librosa.frames_to_time(onset_frames, sr=sr)
+
+@detector("transients", requires=["onset_env"], frame_level=False)
+def _transients(ctx, onset_env):
+    return _per_channel(lambda env: librosa.frames_to_time(librosa.onset.onset_detect(onset_envelope=env, sr=ctx.sr),
+                                                           sr=ctx.sr), onset_env)
+
+@detector("beats", requires=["beat_onset_env"], outputs=["tempo", "beats"], frame_level=False)
+def _beats(ctx, onset_env):
+    if onset_env.ndim == 2:
+        tempos, beats = zip(*[_beats(ctx, channel) for channel in onset_env])
+        return list(tempos), list(beats)
+    beat_window = ctx.options.get("beat_window")
+    if beat_window:
+        tempo, beats = track_beats_windowed(onset_env, ctx.sr, beat_window, n_jobs=ctx.options.get("n_jobs", 1))
+    else:
+        bpm, beats = track_beats(onset_env, ctx.sr)
+        tempo = (np.zeros(1), np.atleast_1d(bpm))
+    return tempo, librosa.frames_to_time(beats, sr=ctx.sr)
+
+def _coarse_signal(y, sr):
+    """y resampled to COARSE_SR with the fastest soxr quality, streamed so int16 signals are never converted whole."""
+    if sr <= COARSE_SR:
+        return audio_io.as_float(y), sr
+    block = int(CHUNK_DURATION * sr)
+    if importlib.util.find_spec("soxr") is None:
+        return np.concatenate([librosa.resample(audio_io.as_float(y[first:first + block]), orig_sr=sr,
+                                                target_sr=COARSE_SR, res_type="polyphase")
+                               for first in range(0, max(len(y), 1), block)]), COARSE_SR
+    import soxr
+    stream = soxr.ResampleStream(sr, COARSE_SR, 1, dtype="float32", quality="QQ")
+    return np.concatenate([stream.resample_chunk(audio_io.as_float(y[first:first + block]).astype(np.float32),
+                                                 last=first + block >= len(y))
+                           for first in range(0, max(len(y), 1), block)]), COARSE_SR
+
+def coarse_onset_regions(y, sr):
+    """
+    Coarse pass of the coarse-to-fine onset envelope. Candidate onsets are peak-picked
+    (with a low threshold) from an onset envelope of y at COARSE_SR with COARSE_HOP frames
+    and few mel bands, and gated on the frame RMS. Returns the frame ranges (HOP_LENGTH grid
+    at sr) within FINE_MARGIN of a candidate, merged, as an (n, 2) array of [first, end);
+    a single region covering everything if they would cover more than FINE_MAX_COVERAGE.
+    """
+    y_coarse, coarse_sr = _coarse_signal(y, sr)
+    hop = max(1, int(round(COARSE_HOP * coarse_sr / COARSE_SR)))
+    S = np.abs(librosa.stft(y_coarse, n_fft=COARSE_N_FFT, hop_length=hop))
+    mel = librosa.feature.melspectrogram(S=S ** 2, sr=coarse_sr, n_mels=COARSE_MELS)
+    env = librosa.onset.onset_strength(S=librosa.power_to_db(mel), sr=coarse_sr, n_fft=COARSE_N_FFT, hop_length=hop)
+    candidates = librosa.onset.onset_detect(onset_envelope=env, sr=coarse_sr, hop_length=hop, delta=COARSE_DELTA)
+    rms_db = librosa.amplitude_to_db(librosa.feature.rms(S=S, frame_length=COARSE_N_FFT)[0])
+    candidates = candidates[rms_db[candidates] > rms_db.max() - COARSE_GATE_DB]
+    count("coarse_candidates", len(candidates))
+
+    n_frames = 1 + len(y) // HOP_LENGTH
+    centres = candidates * hop / coarse_sr * sr / HOP_LENGTH
+    margin = FINE_MARGIN * sr / HOP_LENGTH
+    starts = np.clip(np.floor(centres - margin), 0, n_frames)
+    ends = np.clip(np.ceil(centres + margin) + 1, 0, n_frames)
+    # Neighbouring regions closer than their discarded context are cheaper analysed as one
+    regions = IntervalIndex(starts, ends).merged(gap=2 * FINE_CONTEXT_FRAMES).astype(int)
+    if np.sum(regions[:, 1] - regions[:, 0]) > FINE_MAX_COVERAGE * n_frames:
+        return np.array([[0, n_frames]])
+    return regions
+
+def coarse_to_fine_onset_env(y, sr, regions=None):
+    """
+    Full-length onset envelope, as the onset_env intermediate computes it, but only
+    evaluated within regions (default: coarse_onset_regions) and zero elsewhere.
+    Each region is analysed with FINE_CONTEXT_FRAMES of extra audio on both sides, so its
+    frames equal the exhaustive envelope up to the 80 dB floor of power_to_db, which is
+    taken per region (as in chunked analysis). Onset peak picking is local apart from its
+    normalisation by the envelope maximum, which lies in a region (the strongest onset).
+    """
+    if regions is None:
+        regions = coarse_onset_regions(y, sr)
+    env = np.zeros(1 + len(y) // HOP_LENGTH, dtype=np.float32)
+    # Built once rather than by melspectrogram for every region; applied the way melspectrogram does
+    mel_basis = librosa.filters.mel(sr=sr, n_fft=N_FFT)
+    for first, end in regions:
+        read_first = max(first - FINE_CONTEXT_FRAMES, 0)
+        chunk = audio_io.as_float(y[read_first * HOP_LENGTH:(end + FINE_CONTEXT_FRAMES) * HOP_LENGTH])
+        S = np.abs(librosa.stft(chunk, n_fft=N_FFT, hop_length=HOP_LENGTH))
+        log_mel = librosa.power_to_db(np.einsum("...ft,mf->...mt", S ** 2, mel_basis, optimize=True))
+        env[first:end] = librosa.onset.onset_strength(S=log_mel, sr=sr)[first - read_first:end - read_first]
+    count("fine_frames", int(np.sum(regions[:, 1] - regions[:, 0])) if len(regions) else 0)
+    return env
+
+def low_memory_chunk_duration(sr, n_jobs=1, budget_fraction=0.25):
+    """
+    Chunk length (seconds) whose frame-level analysis, across n_jobs concurrent chunks,
+    fits in budget_fraction of the memory budget. At least 2 * CHUNK_OVERLAP.
+    """
+    bytes_per_second = sr / HOP_LENGTH * (1 + N_FFT // 2) * ANALYSIS_BYTES_PER_BIN
+    seconds = audio_io.memory_budget() * budget_fraction / (bytes_per_second * max(n_jobs, 1))
+    return max(seconds, 2 * CHUNK_OVERLAP)
+
+def track_beats(onset_env, sr, block_frames=8192, ac_size=8.0):
+    """
+    librosa.beat.beat_track on an onset envelope, with the tempo estimated from a
+    tempogram averaged block by block. Tempogram columns only depend on a window of
+    ac_size seconds around them, so this gives the same mean (and tempo) as the
+    full-length tempogram, which for an hour of audio would take several hundred MB.
+    """
+    win_length = int(librosa.time_to_frames(ac_size, sr=sr, hop_length=HOP_LENGTH))
+    half = win_length // 2
+    total = np.zeros((win_length, 1))
+    for own_start in range(0, len(onset_env), block_frames):
+        own_end = min(own_start + block_frames, len(onset_env))
+        read_start = max(own_start - half, 0)
+        block = librosa.feature.tempogram(onset_envelope=onset_env[read_start:own_end + half], sr=sr,
+                                          hop_length=HOP_LENGTH, win_length=win_length)
+        total += block[:, own_start - read_start:own_end - read_start].sum(axis=1, keepdims=True)
+    mean_tempogram = total / max(len(onset_env), 1)
+    bpm = librosa.feature.tempo(tg=mean_tempogram, sr=sr, hop_length=HOP_LENGTH, aggregate=None)
+    return librosa.beat.beat_track(onset_envelope=onset_env, sr=sr, hop_length=HOP_LENGTH, bpm=bpm)
+
+def _track_window(onset_env, sr):
+    """Local tempo and beat frames (relative to the window) of one beat-tracking window."""
+    bpm = librosa.feature.tempo(onset_envelope=onset_env, sr=sr, hop_length=HOP_LENGTH)
+    _, beats = librosa.beat.beat_track(onset_envelope=onset_env, sr=sr, hop_length=HOP_LENGTH, bpm=bpm, trim=False)
+    return float(bpm[0]), beats
+
+def track_beats_windowed(onset_env, sr, window_duration, overlap_duration=BEAT_WINDOW_OVERLAP, n_jobs=1):
+    """
+    Beat tracking for long or tempo-drifting material. The onset envelope is cut into
+    windows of window_duration seconds that overlap by overlap_duration; each window gets
+    its own tempo estimate and dynamic-programming beat track (in parallel with n_jobs > 1),
+    so cost and memory grow linearly with length and the tempo may change between windows.
+    Neighbouring beat sequences are stitched at the middle of their overlap: the earlier
+    window's beats up to the seam, the later window's after it, dropping a beat that would
+    come less than half a beat period after the last kept one.
+    Returns ((window centre times, bpm per window), beat frames).
+    """
+    window_frames = max(1, int(window_duration * sr / HOP_LENGTH))
+    overlap_frames = min(int(overlap_duration * sr / HOP_LENGTH), window_frames // 2)
+    step = window_frames - overlap_frames
+    windows = [(start, min(start + window_frames, len(onset_env)))
+               for start in range(0, max(len(onset_env) - overlap_frames, 1), step)]
+    envelopes = [onset_env[start:end] for start, end in windows]
+
+    count("beat_windows", len(windows))
+    if n_jobs > 1 and len(windows) > 1:
+        with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+            results = list(pool.map(_track_window, envelopes, [sr] * len(windows)))
+    else:
+        results = [_track_window(envelope, sr) for envelope in envelopes]
+
+    beats = np.zeros(0, dtype=int)
+    previous_end = 0
+    for (start, end), (bpm, local_beats) in zip(windows, results):
+        local_beats = local_beats + start
+        seam = (start + previous_end) // 2 if previous_end else -1
+        kept, new = beats[beats <= seam], local_beats[local_beats > seam]
+        half_period = 30.0 / bpm * sr / HOP_LENGTH
+        if len(kept) and len(new) and new[0] - kept[-1] < half_period:
+            new = new[1:]
+        beats = np.concatenate([kept, new])
+        previous_end = end
+
+    centres = librosa.frames_to_time([(start + end) / 2 for start, end in windows], sr=sr, hop_length=HOP_LENGTH)
+    return (centres, np.array([bpm for bpm, _ in results])), beats
+
+def _analyze_chunk(y_chunk, sr, detectors, keep, modules):
+    """Frame-level analysis of one chunk: the frame-level detectors plus the intermediates in keep."""
+    import_modules(modules)  # detectors registered outside this module, in a worker process
+    features, kept = run_detectors(Context(y_chunk, sr), detectors, keep=keep)
+    return {**features, **kept}
+
+@timed()
+def detect_features_chunked(y, sr, audio_file, n_jobs, chunk_duration=CHUNK_DURATION, overlap_duration=CHUNK_OVERLAP,
+                            beat_window=None, detectors=None, coarse_onsets=False):
+    """
+    Chunk-parallel version of detect_features for long signals.
+    The signal is split on the frame grid into chunks that each own a contiguous range of
+    frames and carry overlap_duration of extra context on both sides. Workers compute the
+    expensive frame-level analysis (the frame-level detectors and the intermediates such as
+    the onset envelope that event detectors need); the overlap frames are thrown away so
+    every frame comes from exactly one chunk, which also means an event near a seam can only
+    be reported once. Event detectors (peak picking, beat tracking) then run on the stitched
+    full-length intermediates, as in the single-process path.
+    y may be float32 or int16, mono or (channels, samples); with n_jobs == 1 the chunks are
+    analysed in-process.
+    """
+    detectors = list(DEFAULT_DETECTORS if detectors is None else detectors)
+    frame_level, events, keep = split_detectors(detectors)
+    provided = _coarse_provided(y, sr, detectors, coarse_onsets)
+    if provided:
+        keep = [name for name in keep if name not in provided]
+    modules = detector_modules(detectors)
+    jobs = list(audio_io.frame_blocks(y.shape[-1], sr, HOP_LENGTH, chunk_duration, overlap_duration))
+    count("chunks", len(jobs))
+
+    def trimmed(job, result):
+        lo, hi = job[0], job[1]
+        return {name: np.asarray(values[..., lo:hi], dtype=np.float32) for name, values in result.items()}
+
+    if n_jobs == 1:
+        # Trim each chunk's result as it is produced so only one chunk's STFT is alive at a time
+        parts = [trimmed(job, _analyze_chunk(y[..., job[2]:job[3]], sr, frame_level, keep, modules)) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+            n = len(jobs)
+            results = pool.map(_analyze_chunk, [y[..., job[2]:job[3]] for job in jobs], [sr] * n, [frame_level] * n,
+                               [keep] * n, [modules] * n)
+            parts = [trimmed(job, result) for job, result in zip(jobs, results)]
+
+    stitched = {name: np.concatenate([part[name] for part in parts], axis=-1) for name in parts[0]}
+    kept = {name: stitched.pop(name) for name in keep}
+    kept.update(provided or {})
+    features, _ = run_detectors(Context(None, sr, n_jobs=n_jobs, beat_window=beat_window), events, provided=kept)
+    features.update(stitched)
+    return _with_times(features, sr, audio_file, detectors)
 
 def plot_features(y, sr):
+    import matplotlib.pyplot as plt
     plt.figure(figsize=(10, 4))
     plt.plot(np.linspace(0, len(y) / sr, num=len(y)), y, alpha=0.5)
     plt.xlabel('Time (s)')
@@ -0,0 +1,181 @@
+"""
+Compact binary fingerprints for fast exact / near-exact duplicate segment detection.
+
+Every segment is summarised by a 64-bit hash: the segment is split into a few time
+slices, and for each slice the sign of the energy difference between neighbouring
+mel bands gives one bit per band pair. Sample-exact repeats produce identical or
+nearly identical hashes, which are grouped with a banded hash-table lookup in
+near-linear time, long before the heavier MFCC/chroma similarity pass runs.
+
+The hash only sees the spectral tilt across 17 bands, so different notes with the same
+envelope can share it. Hash matches are therefore only candidates: a pair counts as a
+repeat once the full-resolution magnitude spectra of its time slices agree too.
+"""
+
+import numpy as np
+import librosa
+import audio_io
+from instrumentation import timed, count
+
+N_SLICES = 4  # time slices per segment
+N_BANDS = 17  # mel bands; 16 band-pair signs per slice -> 64 bits
+HOP_LENGTH = 512
+BLOCK_SECONDS = 60.0  # block length of the low-memory spectrogram
+BLOCK_OVERLAP = 0.5
+CONFIRM_N_FFT = 2048  # spectral profiles that confirm hash matches
+CONFIRM_SIMILARITY = 0.98  # cosine similarity of the profiles of a confirmed repeat
+
+
+def _log_band_energy(y, sr, hop_length):
+    S = librosa.feature.melspectrogram(y=audio_io.as_float(y), sr=sr, n_mels=N_BANDS, hop_length=hop_length)
+    return np.log(S.T + 1e-10).astype(np.float32)  # (frames, bands)
+
+
+def fingerprint_spectrogram(y, sr, hop_length=HOP_LENGTH):
+    """
+    Shared log band-energy spectrogram used to fingerprint all segments of a signal.
+    In low-memory mode (or for an int16 signal) it is computed block by block, so the
+    full-length STFT is never materialised.
+    """
+    if not audio_io.low_memory() and y.dtype != np.int16:
+        return _log_band_energy(y, sr, hop_length)
+    blocks = audio_io.frame_blocks(len(y), sr, hop_length, BLOCK_SECONDS, BLOCK_OVERLAP)
+    return np.concatenate([_log_band_energy(y[first:last], sr, hop_length)[lo:hi] for lo, hi, first, last in blocks])
+
+
+def segment_fingerprints(band_energy, sr, segments, hop_length=HOP_LENGTH):
+    """
+    Compute a 64-bit fingerprint for each (start, end) segment from a shared
+    band-energy spectrogram, vectorised over all segments.
+    Returns an array of np.uint64.
+    """
+    if len(segments) == 0:
+        return np.zeros(0, dtype=np.uint64)
+    n_frames = len(band_energy)
+    cumulative = np.vstack([np.zeros((1, band_energy.shape[1])), np.cumsum(band_energy, axis=0)])
+
+    bounds = np.asarray(segments, dtype=float)
+    start_frames = np.clip(librosa.time_to_frames(bounds[:, 0], sr=sr, hop_length=hop_length), 0, n_frames - 1)
+    end_frames = np.clip(librosa.time_to_frames(bounds[:, 1], sr=sr, hop_length=hop_length), start_frames + 1, n_frames)
+
+    # Slice edges per segment: (n_segments, N_SLICES + 1), each slice at least one frame wide
+    fractions = np.linspace(0, 1, N_SLICES + 1)
+    edges = start_frames[:, None] + np.round(fractions * (end_frames - start_frames)[:, None]).astype(int)
+    lo, hi = edges[:, :-1], np.maximum(edges[:, 1:], edges[:, :-1] + 1)
+    hi = np.minimum(hi, n_frames)
+    lo = np.minimum(lo, hi - 1)
+    slice_means = (cumulative[hi] - cumulative[lo]) / (hi - lo)[..., None]  # (segments, slices, bands)
+
+    bits = np.diff(slice_means, axis=2) > 0  # (segments, slices, bands - 1)
+    packed = np.packbits(bits.reshape(len(segments), -1), axis=1)
+    return packed.view(">u8").astype(np.uint64).ravel()
+
+
+def compute_fingerprints(y, sr, segments, hop_length=HOP_LENGTH):
+    """Fingerprint segments of signal y, computing the spectrogram once."""
+    return segment_fingerprints(fingerprint_spectrogram(y, sr, hop_length), sr, segments, hop_length)
+
+
+def spectral_profile(y, sr, start, end, n_fft=CONFIRM_N_FFT, hop_length=HOP_LENGTH):
+    """
+    Mean magnitude spectrum of each of the N_SLICES time slices of a segment, concatenated
+    and scaled to unit length. Repeats (also at another gain) have a cosine similarity
+    close to 1; notes a semitone apart put their harmonics in different bins.
+    """
+    segment = audio_io.as_float(y[int(start * sr):int(end * sr)])
+    if len(segment) < n_fft:
+        segment = np.pad(segment, (0, n_fft - len(segment)))
+    magnitude = np.abs(librosa.stft(segment, n_fft=n_fft, hop_length=hop_length))
+    edges = np.round(np.linspace(0, magnitude.shape[1], N_SLICES + 1)).astype(int)
+    profile = np.concatenate([magnitude[:, lo:max(hi, lo + 1)].mean(axis=1) for lo, hi in zip(edges[:-1], edges[1:])])
+    norm = np.linalg.norm(profile)
+    return profile / norm if norm > 0 else profile
+
+
+def hamming_distance(a, b):
+    """Bitwise Hamming distance between arrays of uint64 fingerprints."""
+    xor = np.atleast_1d(np.bitwise_xor(a, b)).astype(np.uint64)
+    return np.unpackbits(xor.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+
+def find_duplicate_groups(fingerprints, durations=None, max_distance=3, duration_tolerance=0.05, confirm=None):
+    """
+    Group fingerprints within `max_distance` differing bits of each other.
+    The 64 bits are split into max_distance + 1 bands; two hashes within the distance
+    must agree exactly on at least one band, so only hash-table bucket mates are compared.
+    If durations are given, candidates must also have durations within `duration_tolerance`
+    (relative). If confirm is given, confirm(i, others) returns a boolean mask of the
+    candidates in others that really repeat i; the others are not grouped with it.
+    Returns a list of index lists, one per group with more than one member.
+    """
+    fingerprints = np.asarray(fingerprints, dtype=np.uint64)
+    n = len(fingerprints)
+    if durations is not None:
+        durations = np.asarray(durations, dtype=float)
+    parent = np.arange(n)
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    n_bands = max_distance + 1
+    band_edges = np.linspace(0, 64, n_bands + 1).astype(int)
+    for band_start, band_end in zip(band_edges[:-1], band_edges[1:]):
+        width = band_end - band_start
+        keys = (fingerprints >> np.uint64(64 - band_end)) & np.uint64((1 << width) - 1)
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+        bucket_starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+        bucket_ends = np.r_[bucket_starts[1:], n]
+        for lo, hi in zip(bucket_starts, bucket_ends):
+            if hi - lo < 2:
+                continue
+            members = order[lo:hi]
+            # Compare every member against the rest of its bucket
+            for j, i in enumerate(members[:-1]):
+                others = members[j + 1:]
+                close = hamming_distance(fingerprints[i], fingerprints[others]) <= max_distance
+                if durations is not None:
+                    close &= np.abs(durations[others] - durations[i]) <= duration_tolerance * np.maximum(durations[others], durations[i])
+                if confirm is not None and close.any():
+                    close[close] = confirm(i, others[close])
+                for other in others[close]:
+                    root_a, root_b = find(i), find(other)
+                    if root_a != root_b:
+                        parent[max(root_a, root_b)] = min(root_a, root_b)
+
+    groups = {}
+    for i in range(n):
+        groups.setdefault(find(i), []).append(i)
+    return [members for members in groups.values() if len(members) > 1]
+
+
+@timed()
+def remove_duplicate_segments(y, sr, segments, max_distance=3):
+    """
+    Drop exact / near-exact repeats from segments, keeping the first segment of each
+    duplicate group. Hash matches are confirmed by comparing the segments' spectral
+    profiles, which are computed only for segments that have a hash match.
+    Returns (kept_segments, duplicate_groups).
+    """
+    if len(segments) < 2:
+        return list(segments), []
+    fingerprints = compute_fingerprints(y, sr, segments)
+    durations = [end - start for start, end in segments]
+    profiles = {}
+
+    def profile(i):
+        if i not in profiles:
+            profiles[i] = spectral_profile(y, sr, *segments[i])
+        return profiles[i]
+
+    def confirm(i, others):
+        return np.array([np.dot(profile(i), profile(other)) >= CONFIRM_SIMILARITY for other in others])
+
+    groups = find_duplicate_groups(fingerprints, durations, max_distance=max_distance, confirm=confirm)
+    dropped = {i for members in groups for i in members[1:]}
+    count("segments", len(segments))
+    count("duplicates", len(dropped))
+    return [segment for i, segment in enumerate(segments) if i not in dropped], groups
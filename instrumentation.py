@@ -0,0 +1,211 @@
+"""
+Lightweight per-stage instrumentation.
+
+Wrap a unit of work in a stage and count the items it handles:
+
+    with stage("detect_features", audio_file=audio_file):
+        ...
+        count("onsets", len(onsets))
+
+When a stage ends, a record with its wall time, CPU time, memory and the counters
+is sent to every registered sink (log, JSON lines file, UI panel). Memory is
+reported three ways: rss_delta_mb, the change in resident set size from the stage's
+start to its end; stage_peak_rss_mb, the process' new high-water mark if the stage
+raised it (None if the peak was reached before the stage); and process_peak_rss_mb,
+the peak of the whole process so far, which earlier stages may have set.
+Stages nest; a record's "path" is the slash-joined chain of enclosing stages.
+With no sink registered, stage() returns a shared no-op object and count() returns
+immediately, so instrumented code costs next to nothing in normal runs.
+"""
+
+import functools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+_sinks = []
+_local = threading.local()
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB (None where unsupported)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes on Linux
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 1024
+
+
+def rss_mb():
+    """Current resident set size of this process in MB (None where unsupported, i.e. outside Linux)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError):
+        return None
+
+
+def add_sink(sink):
+    """Register a sink: any callable taking a stage record dict."""
+    _sinks.append(sink)
+    return sink
+
+
+def remove_sink(sink):
+    if sink in _sinks:
+        _sinks.remove(sink)
+
+
+def enabled():
+    return bool(_sinks)
+
+
+def _stack():
+    if not hasattr(_local, "stack"):
+        _local.stack = []
+    return _local.stack
+
+
+class _NullStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def count(self, name, n=1):
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = attrs
+        self.counts = {}
+
+    def __enter__(self):
+        stack = _stack()
+        self.path = "/".join([s.name for s in stack] + [self.name])
+        stack.append(self)
+        self._rss = rss_mb()
+        self._peak = peak_rss_mb()
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        wall = time.perf_counter() - self._wall
+        cpu = time.process_time() - self._cpu
+        _stack().pop()
+        rss, peak = rss_mb(), peak_rss_mb()
+        record = {
+            "stage": self.name,
+            "path": self.path,
+            "wall_s": round(wall, 6),
+            "cpu_s": round(cpu, 6),
+            "rss_delta_mb": None if rss is None or self._rss is None else round(rss - self._rss, 1),
+            "stage_peak_rss_mb": peak if peak is not None and peak > self._peak else None,
+            "process_peak_rss_mb": peak,
+            "counts": self.counts,
+            "ok": exc_type is None,
+        }
+        record.update(self.attrs)
+        for sink in list(_sinks):
+            try:
+                sink(record)
+            except Exception:
+                logger.exception("Instrumentation sink failed")
+        return False
+
+    def count(self, name, n=1):
+        self.counts[name] = self.counts.get(name, 0) + n
+
+
+def stage(name, **attrs):
+    """Context manager timing one stage; extra keyword arguments are added to its record."""
+    if not _sinks:
+        return _NULL_STAGE
+    return _Stage(name, attrs)
+
+
+def timed(name=None):
+    """Decorator running the whole function as a stage (named after the function by default)."""
+    def decorator(func):
+        stage_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _sinks:
+                return func(*args, **kwargs)
+            with _Stage(stage_name, {}):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count(name, n=1):
+    """Add n to a counter of the innermost running stage."""
+    if not _sinks:
+        return
+    stack = _stack()
+    if stack:
+        stack[-1].count(name, n)
+
+
+def format_record(record):
+    """One-line human readable summary of a stage record."""
+    counts = ", ".join(f"{key}={value}" for key, value in record["counts"].items())
+    text = f"{record['path']}: {record['wall_s']:.3f}s wall, {record['cpu_s']:.3f}s cpu"
+    if record["rss_delta_mb"] is not None:
+        text += f", RSS {record['rss_delta_mb']:+.0f} MB"
+    if record["stage_peak_rss_mb"] is not None:
+        text += f", new peak {record['stage_peak_rss_mb']:.0f} MB"
+    elif record["process_peak_rss_mb"] is not None:
+        text += f", process peak {record['process_peak_rss_mb']:.0f} MB"
+    if counts:
+        text += f" ({counts})"
+    return text
+
+
+class LoggingSink:
+    """Send stage records to a logger."""
+    def __init__(self, log=None, level=logging.INFO):
+        self.log = log or logging.getLogger("audio_segmentation.stages")
+        self.level = level
+
+    def __call__(self, record):
+        self.log.log(self.level, format_record(record))
+
+
+class JsonLinesSink:
+    """Append stage records as JSON lines to a file."""
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def __call__(self, record):
+        line = json.dumps(record, default=str) + "\n"
+        with self._lock, open(self.path, "a") as f:
+            f.write(line)
+
+
+class CallbackSink:
+    """Pass formatted stage summaries to a callback, e.g. a UI panel's appendPlainText."""
+    def __init__(self, callback):
+        self.callback = callback
+
+    def __call__(self, record):
+        self.callback(format_record(record))
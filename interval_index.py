@@ -0,0 +1,101 @@
+"""
+Sorted-array interval index over segments.
+
+Intervals are kept as NumPy columns sorted by start, together with the running
+maximum of their ends ("reach"). Because the reach never decreases, the intervals that
+can overlap [lo, hi] form one contiguous run: from the first interval whose reach gets
+to lo up to the last one starting at or before hi, both found by binary search.
+Point and range queries are therefore O(log n) plus the size of that run (just the
+hits for non-overlapping segment lists), and inserts and deletes are done in bulk with
+one O(n) merge instead of one list operation per segment.
+
+Every interval carries an integer id (by default its position in the segment list it
+was built from); queries return ids.
+"""
+
+import numpy as np
+
+
+class IntervalIndex:
+    def __init__(self, starts=(), ends=(), ids=None):
+        self.starts = np.zeros(0)
+        self.ends = np.zeros(0)
+        self.ids = np.zeros(0, dtype=int)
+        self.reach = np.zeros(0)
+        self.add(starts, ends, ids)
+
+    @classmethod
+    def from_segments(cls, segments):
+        """Index a list of (start, end) pairs; ids are their positions in the list."""
+        bounds = np.asarray(segments, dtype=float).reshape(-1, 2)
+        return cls(bounds[:, 0], bounds[:, 1])
+
+    def __len__(self):
+        return len(self.starts)
+
+    def _update(self, starts, ends, ids):
+        order = np.argsort(starts, kind="stable")
+        self.starts, self.ends, self.ids = starts[order], ends[order], ids[order]
+        self.reach = np.maximum.accumulate(self.ends) if len(self.ends) else self.ends
+
+    def add(self, starts, ends, ids=None):
+        """Insert intervals in bulk. ids default to consecutive ints after the largest id. Returns the ids."""
+        starts = np.atleast_1d(np.asarray(starts, dtype=float))
+        ends = np.atleast_1d(np.asarray(ends, dtype=float))
+        if starts.shape != ends.shape:
+            raise ValueError("starts and ends must have the same length")
+        if np.any(ends < starts):
+            raise ValueError("Interval ends must not come before their starts")
+        if ids is None:
+            first = int(self.ids.max()) + 1 if len(self.ids) else 0
+            ids = np.arange(first, first + len(starts))
+        ids = np.atleast_1d(np.asarray(ids, dtype=int))
+        if len(starts):
+            # Stable sort on already-sorted data plus a sorted batch: timsort merges the two runs
+            batch = np.argsort(starts, kind="stable")
+            self._update(np.concatenate([self.starts, starts[batch]]), np.concatenate([self.ends, ends[batch]]),
+                         np.concatenate([self.ids, ids[batch]]))
+        return ids
+
+    def remove(self, ids):
+        """Delete the intervals with these ids (unknown ids are ignored)."""
+        keep = ~np.isin(self.ids, np.atleast_1d(ids))
+        self.starts, self.ends, self.ids = self.starts[keep], self.ends[keep], self.ids[keep]
+        self.reach = np.maximum.accumulate(self.ends) if len(self.ends) else self.ends
+
+    def _overlap_positions(self, lo, hi):
+        first = np.searchsorted(self.reach, lo, side="left")
+        last = np.searchsorted(self.starts, hi, side="right")
+        return first + np.flatnonzero(self.ends[first:max(first, last)] >= lo)
+
+    def query(self, lo, hi):
+        """(ids, starts, ends) of the intervals overlapping [lo, hi] (touching counts), in start order."""
+        positions = self._overlap_positions(lo, hi)
+        return self.ids[positions], self.starts[positions], self.ends[positions]
+
+    def overlapping(self, lo, hi):
+        """Ids of the intervals overlapping [lo, hi], in start order."""
+        return self.ids[self._overlap_positions(lo, hi)]
+
+    def at(self, t):
+        """Ids of the intervals containing time t."""
+        return self.overlapping(t, t)
+
+    def hit(self, t):
+        """Id of the interval under time t (the shortest one if several contain it), or None."""
+        positions = self._overlap_positions(t, t)
+        if not len(positions):
+            return None
+        return int(self.ids[positions[np.argmin(self.ends[positions] - self.starts[positions])]])
+
+    def merged(self, gap=0.0):
+        """
+        Union of the intervals as an (n, 2) array of disjoint, sorted intervals; intervals
+        that overlap or are at most gap apart are merged into one.
+        """
+        if not len(self.starts):
+            return np.zeros((0, 2))
+        new_run = np.concatenate([[True], self.starts[1:] > self.reach[:-1] + gap])
+        run_starts = np.flatnonzero(new_run)
+        run_ends = np.concatenate([run_starts[1:], [len(self.starts)]]) - 1
+        return np.column_stack([self.starts[run_starts], self.reach[run_ends]])
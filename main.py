@@ -14,9 +14,11 @@ The application is ideal for audio engineers, music producers, and researchers w
 
 from PyQt5.QtWidgets import QApplication
 import sys
+import logging
 from ui import AudioSegmentationApp  # Import the UI class
 
 def main():
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
     app = QApplication(sys.argv)
     window = AudioSegmentationApp()  # Create an instance of the UI class
     window.show()  # Show the main window
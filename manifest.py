@@ -0,0 +1,209 @@
+"""
+Durable progress manifest for batch runs.
+
+One JSON file records, per input file: its content hash, the settings it was run
+with, the last pipeline stage completed ("analysed" = segmented and clustered,
+"exported"), the segments and cluster labels, the output directory and which
+segments have been written to it, per-stage timings and how many attempts have
+been made. Every state change appends the changed entry to a journal next to it
+(<path>.journal, one JSON line per change, fsynced), so a batch that dies at any
+point (including being OOM-killed) can be re-run and picks up where it stopped.
+Once the journal holds more lines than the manifest has entries, the manifest is
+rewritten atomically (write to a temp file, fsync, rename) and the journal starts
+over, so a long-running owner such as the watch daemon writes O(1) per change.
+Journal lines carry the generation of the snapshot they apply to, so lines left
+behind by a crash during a rewrite are ignored.
+
+A file's (size, mtime) signature can be recorded alongside its hash, so callers
+can skip unchanged files without reading them (see unchanged()).
+
+An attempt is recorded before a file is processed, so attempts that crash the
+whole process count too; a file that has used up max_attempts without finishing
+is quarantined and skipped until its content or settings change.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_VERSION = 1
+MIN_JOURNAL_LINES = 1000  # the journal is folded into the manifest after max(this, number of entries) lines
+HASH_BLOCK_SIZE = 1 << 20
+# Exported segments are recorded as they are written; the manifest is saved at most this often for them
+EXPORT_SAVE_SECONDS = 1.0
+
+
+def file_hash(path):
+    """SHA-256 of a file's content, read in blocks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class BatchManifest:
+    def __init__(self, path, max_attempts=3):
+        self.path = path
+        self.journal_path = path + ".journal"
+        self.max_attempts = max_attempts
+        self.files = {}
+        self.generation = 0
+        self._journal_lines = 0
+        self._saved = 0.0
+        if os.path.exists(path):
+            with open(path) as f:
+                data = json.load(f)
+            if data.get("version") != MANIFEST_VERSION:
+                raise ValueError(f"Unsupported manifest version {data.get('version')} in {path}")
+            self.files = data["files"]
+            self.generation = data.get("generation", 0)
+        if os.path.exists(self.journal_path):
+            self._replay_journal()
+        self._keys = {id(entry): key for key, entry in self.files.items()}
+
+    def _replay_journal(self):
+        with open(self.journal_path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:  # the last line, cut short by a crash
+                    break
+                if record["generation"] == self.generation:
+                    self.files[record["file"]] = record["entry"]
+                    self._journal_lines += 1
+
+    def save(self):
+        """Rewrite the whole manifest (a new generation) and start the journal over."""
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"version": MANIFEST_VERSION, "generation": self.generation + 1, "files": self.files}, f,
+                      indent=1)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self.generation += 1
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+        self._journal_lines = 0
+        self._saved = time.monotonic()
+
+    def _commit(self, entry):
+        """Durably record a change of entry: one journal line, or a rewrite once the journal is long."""
+        key = self._keys.get(id(entry))
+        if key is None or self._journal_lines >= max(MIN_JOURNAL_LINES, len(self.files)):
+            self.save()
+            return
+        with open(self.journal_path, "a") as f:
+            f.write(json.dumps({"generation": self.generation, "file": key, "entry": entry}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self._journal_lines += 1
+        self._saved = time.monotonic()
+
+    def entry(self, audio_file):
+        return self.files.get(os.path.abspath(audio_file))
+
+    def unchanged(self, audio_file, settings, signature):
+        """
+        True if the file was finished or quarantined with these settings and still has the
+        (size, mtime_ns) signature recorded then, so it need not even be hashed again.
+        """
+        entry = self.files.get(os.path.abspath(audio_file))
+        return (entry is not None and signature is not None and entry["settings"] == settings
+                and entry["status"] in ("done", "quarantined") and entry.get("signature") == list(signature))
+
+    def begin(self, audio_file, settings, content_hash=None, signature=None):
+        """
+        Start (or resume) work on a file. Returns its entry, with "stage" telling which
+        stages are already done, or None if the file is finished or quarantined.
+        An entry whose content hash or settings differ is started over. content_hash is
+        computed unless given; a (size, mtime_ns) signature is recorded for unchanged().
+        """
+        key = os.path.abspath(audio_file)
+        if content_hash is None:
+            content_hash = file_hash(audio_file)
+        entry = self.files.get(key)
+        if entry is None or entry["hash"] != content_hash or entry["settings"] != settings:
+            entry = {"hash": content_hash, "settings": settings, "stage": None, "status": "pending",
+                     "attempts": 0, "error": None, "segments": None, "labels": None, "output_dir": None,
+                     "exported": [], "timings": {}}
+            self.files[key] = entry
+            self._keys[id(entry)] = key
+        if signature is not None and entry.get("signature") != list(signature):
+            entry["signature"] = list(signature)
+            if entry["status"] in ("done", "quarantined"):
+                self._commit(entry)  # same content under a new mtime: remember it, or it is hashed every time
+
+        if entry["status"] == "done":
+            logger.info(f"Skipping {audio_file}: already done")
+            return None
+        if entry["status"] == "quarantined":
+            logger.warning(f"Skipping {audio_file}: quarantined after {entry['attempts']} failed attempts "
+                           f"({entry['error']})")
+            return None
+        if entry["attempts"] >= self.max_attempts:
+            # The previous attempts died without recording a failure (e.g. the process was killed)
+            self._quarantine(entry, entry["error"] or "process died during processing")
+            logger.warning(f"Quarantined {audio_file} after {entry['attempts']} unfinished attempts")
+            return None
+
+        entry["attempts"] += 1
+        entry["status"] = "running"
+        self._commit(entry)
+        if entry["stage"]:
+            logger.info(f"Resuming {audio_file} after stage '{entry['stage']}' (attempt {entry['attempts']})")
+        return entry
+
+    def complete_stage(self, entry, stage, seconds, **data):
+        """Record that a stage finished, with its duration and outputs."""
+        entry.update(data)
+        entry["stage"] = stage
+        entry["timings"][stage] = round(seconds, 3)
+        self._commit(entry)
+
+    def start_export(self, entry, output_dir):
+        """Record the folder a fresh export writes to, with no segments written yet."""
+        entry["output_dir"] = output_dir
+        entry["exported"] = []
+        self._commit(entry)
+
+    def record_exported(self, entry, index):
+        """
+        Record that segment `index` has been written. Saved at most every EXPORT_SAVE_SECONDS;
+        segments whose record was lost in a crash are simply written again on resume.
+        """
+        entry["exported"].append(int(index))
+        if time.monotonic() - self._saved >= EXPORT_SAVE_SECONDS:
+            self._commit(entry)
+
+    def finish(self, entry):
+        entry["status"] = "done"
+        entry["error"] = None
+        entry["finished"] = time.time()
+        self._commit(entry)
+
+    def fail(self, entry, error):
+        """Record a failed attempt; quarantines the file once it has used up its attempts."""
+        entry["error"] = error
+        if entry["attempts"] >= self.max_attempts:
+            self._quarantine(entry, error)
+        else:
+            entry["status"] = "failed"
+            self._commit(entry)
+
+    def _quarantine(self, entry, error):
+        entry["status"] = "quarantined"
+        entry["error"] = error
+        self._commit(entry)
+
+    def summary(self):
+        """Number of files per status."""
+        counts = {}
+        for entry in self.files.values():
+            counts[entry["status"]] = counts.get(entry["status"], 0) + 1
+        return counts
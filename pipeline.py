@@ -0,0 +1,181 @@
+"""
+Headless detect -> segment -> cluster -> export pipeline.
+
+This is the same sequence of steps the GUI runs when you press
+"Segment and Visualize", "Cluster Segments" and "Save Segments",
+packaged as plain functions for batch processing.
+"""
+
+import hashlib
+import logging
+import os
+import time
+import audio_io
+from feature_detection import detect_features
+from segmentation import segment_by_method, segment_channels, filter_similar_segments, METHOD_DETECTORS
+from fingerprint import remove_duplicate_segments
+from clustering import ClusterModel
+from utils import chop_audio_with_metadata, remove_exported_segments
+from instrumentation import stage
+
+logger = logging.getLogger(__name__)
+
+
+def init_worker(audio_settings=None):
+    """
+    Process pool initializer for pipeline workers: apply the parent's audio_io settings
+    (spawned processes start from the defaults) and warm up.
+    """
+    if audio_settings:
+        audio_io.configure(**audio_settings)
+    warm_up()
+
+
+def warm_up():
+    """
+    Run the pipeline once on a few seconds of clicks, so that imports, librosa's numba
+    kernels and filter banks are loaded and compiled before the first real file
+    (used to pre-warm worker processes).
+    """
+    import tempfile
+    import numpy as np
+    import soundfile as sf
+
+    sr = 22050
+    t = np.arange(sr * 4) / sr
+    y = (np.sin(2 * np.pi * 440 * t) * (t % 0.5 < 0.05)).astype(np.float32)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "warmup.wav")
+        sf.write(path, y, sr)
+        segment_file(path)
+    ClusterModel.fit(np.random.default_rng(0).standard_normal((16, 4)), 2)
+
+
+def segment_file(audio_file, method="By Onsets", min_time=0.1, max_time=30.0, similarity_threshold=0.85,
+                 min_freq=100, max_freq=5000, n_jobs=1, beat_window=None, coarse_onsets=False,
+                 channel_mode="mix"):
+    """
+    Detect features and segment one file, dropping repeats and similar segments.
+    n_jobs > 1 runs feature detection chunk-parallel and computes the segments' similarity
+    features in worker processes that share the signal; beat_window (seconds) tracks
+    beats in windows with a local tempo each; coarse_onsets computes the onset envelope
+    only around candidates from a coarse pass. A channel_mode other than "mix" analyses
+    every channel and combines their segments (see segment_channels).
+    Returns (segments, similarity feature vectors).
+    """
+    multichannel = channel_mode != "mix"
+    features = detect_features(audio_file, n_jobs=n_jobs, beat_window=beat_window, detectors=METHOD_DETECTORS.get(method),
+                               coarse_onsets=coarse_onsets, channels=multichannel)
+    if multichannel:
+        segments = segment_channels(features, method, channel_mode, min_segment_length=min_time, min_freq=min_freq,
+                                    max_freq=max_freq)
+    else:
+        segments = segment_by_method(features, method, min_segment_length=min_time, min_freq=min_freq,
+                                     max_freq=max_freq)
+    del features  # frame-level feature arrays are not needed past segmentation
+    segments = [(start, end) for start, end in segments if min_time <= (end - start) <= max_time]
+    if not segments:
+        return [], []
+
+    with stage("load_audio"):
+        y, sr = audio_io.load_signal(audio_file)
+    segments, _ = remove_duplicate_segments(y, sr, segments)
+    return filter_similar_segments(y, sr, segments, similarity_threshold, n_jobs=n_jobs)
+
+
+def analyse_file(audio_file, method="By Onsets", min_time=0.1, max_time=30.0, similarity_threshold=0.85,
+                 min_freq=100, max_freq=5000, n_clusters=None, cluster_model=None, n_jobs=1, beat_window=None,
+                 coarse_onsets=False, channel_mode="mix"):
+    """
+    Segment one file and cluster its segments when n_clusters or a frozen cluster_model
+    is given. Returns (segments, labels); labels is a list of ints or None.
+    """
+    segments, vectors = segment_file(audio_file, method, min_time, max_time, similarity_threshold, min_freq, max_freq,
+                                     n_jobs, beat_window, coarse_onsets, channel_mode)
+    labels = None
+    if not segments:
+        return [], labels
+    if cluster_model is not None:
+        labels = cluster_model.predict(vectors)
+    elif n_clusters:
+        model = ClusterModel.fit(vectors, n_clusters, feature_set="similarity", standardize=False)
+        labels = model.predict(vectors)
+    return segments, None if labels is None else [int(label) for label in labels]
+
+
+def process_file(audio_file, method="By Onsets", min_time=0.1, max_time=30.0, similarity_threshold=0.85,
+                 min_freq=100, max_freq=5000, n_clusters=None, cluster_model=None, library_index=None,
+                 output_root=None, n_jobs=1, beat_window=None, coarse_onsets=False, channel_mode="mix",
+                 output_dir=None):
+    """
+    Run the full pipeline on one file and export its segments (to output_dir if given,
+    else to <name>_segmented in output_root).
+    Segments are clustered when n_clusters or a frozen cluster_model is given.
+    Returns a summary dict with the segments, labels and output directory.
+    """
+    segments, labels = analyse_file(audio_file, method, min_time, max_time, similarity_threshold, min_freq, max_freq,
+                                    n_clusters, cluster_model, n_jobs, beat_window, coarse_onsets, channel_mode)
+    if not segments:
+        logger.info(f"No segments found in {audio_file}")
+        return {"audio_file": audio_file, "segments": [], "labels": None, "output_dir": None}
+
+    output_dir = chop_audio_with_metadata(audio_file, segments, clusters=labels, library_index=library_index,
+                                          similarity_threshold=similarity_threshold, output_root=output_root,
+                                          output_dir=output_dir)
+    return {"audio_file": audio_file, "segments": segments, "labels": labels, "output_dir": output_dir}
+
+
+def checkpoint_output_dir(audio_file, content_hash=None, output_root=None):
+    """
+    Export folder of a checkpointed run: <name>_<id>_segmented, where the id depends on
+    the file's path and content, so files that share a name never share a folder.
+    Without content_hash the id depends on the path only: one folder per file, which
+    is reused when the file changes.
+    """
+    base_name = os.path.splitext(os.path.basename(audio_file))[0]
+    key = os.path.abspath(audio_file) if content_hash is None else f"{os.path.abspath(audio_file)}\0{content_hash}"
+    key = hashlib.sha1(key.encode()).hexdigest()[:10]
+    return os.path.abspath(os.path.join(output_root or "", f"{base_name}_{key}_segmented"))
+
+
+def process_file_checkpointed(audio_file, manifest, settings, similarity_threshold=0.85, library_index=None,
+                              output_root=None, **analysis_options):
+    """
+    process_file with its progress kept in a BatchManifest. Stages already recorded for
+    this file (same content and settings) are skipped: after "analysed" the stored
+    segments and labels are exported directly. The segments are written to
+    checkpoint_output_dir and recorded in the manifest one by one; an export that an
+    earlier attempt started is resumed without rewriting the recorded segments, while a
+    fresh export first clears segment files left in the folder. Failures are recorded
+    in the manifest and re-raised.
+    Returns the summary dict, or None if the manifest says the file is done or quarantined.
+    """
+    entry = manifest.begin(audio_file, settings)
+    if entry is None:
+        return None
+    try:
+        if entry["stage"] is None:
+            start = time.perf_counter()
+            segments, labels = analyse_file(audio_file, similarity_threshold=similarity_threshold, **analysis_options)
+            manifest.complete_stage(entry, "analysed", time.perf_counter() - start,
+                                    segments=[[float(s), float(e)] for s, e in segments], labels=labels)
+
+        segments = [tuple(segment) for segment in entry["segments"]]
+        output_dir = None
+        if segments:
+            start = time.perf_counter()
+            output_dir = entry["output_dir"]
+            if output_dir is None or "exported" not in entry:  # no earlier attempt got as far as the export
+                output_dir = checkpoint_output_dir(audio_file, entry["hash"], output_root)
+                remove_exported_segments(output_dir)
+                manifest.start_export(entry, output_dir)
+            chop_audio_with_metadata(audio_file, segments, clusters=entry["labels"], library_index=library_index,
+                                     similarity_threshold=similarity_threshold, output_dir=output_dir,
+                                     done=entry["exported"],
+                                     on_exported=lambda index: manifest.record_exported(entry, index))
+            manifest.complete_stage(entry, "exported", time.perf_counter() - start)
+        manifest.finish(entry)
+    except Exception as e:
+        manifest.fail(entry, f"{type(e).__name__}: {e}")
+        raise
+    return {"audio_file": audio_file, "segments": segments, "labels": entry["labels"], "output_dir": output_dir}
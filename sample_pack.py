@@ -0,0 +1,318 @@
+"""
+Batch analysis of sample packs: many short files (one-shots, loops) at once.
+
+Running segment_similarity_features file by file repeats work for every file: three
+STFTs of the same signal, a piptrack tuning estimate, filterbank setup and Python
+dispatch, all for a second or two of audio. analyse_pack instead:
+
+    - decodes the files in bulk on a thread pool
+    - groups them into length buckets (BUCKET_HOPS frames wide), zero-pads each
+      bucket to a common length and stacks it, up to STACK_BYTES of spectrogram
+    - computes one STFT per stack and every spectral feature on the batched
+      (files, frames, bins) arrays, averaging only each file's own frames
+    - deduplicates and clusters the resulting feature matrix in one pass
+
+Zero padding after a file's end does not change its frames (librosa pads the edges
+with zeros too); the frames past its end are cleared, and dB floors and tuning are
+taken per file, so the rows equal segment_similarity_features of each file.
+"""
+
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+import librosa
+import numpy as np
+import audio_io
+from clustering import ClusterModel
+from instrumentation import timed, stage, count
+
+logger = logging.getLogger(__name__)
+
+# The librosa defaults segment_similarity_features runs with
+N_FFT = 2048
+HOP_LENGTH = 512
+N_MFCC = 20
+N_CHROMA = 12
+CONTRAST_FMIN = 200.0
+CONTRAST_BANDS = 6
+CONTRAST_QUANTILE = 0.02
+PIPTRACK_FMIN = 150.0
+PIPTRACK_FMAX = 4000.0
+PIPTRACK_THRESHOLD = 0.1
+TUNING_RESOLUTION = 0.01
+TOP_DB = 80.0
+AMIN = 1e-10
+
+BUCKET_HOPS = 16  # files whose frame counts round up to the same multiple share a stack
+STACK_BYTES = 32 * 2 ** 20  # complex64 spectrogram per stack (the float64 transform briefly takes 4x)
+DEDUP_BLOCK = 4096  # rows compared at a time when deduplicating
+
+
+def _load(audio_file):
+    try:
+        y, _ = audio_io.load(audio_file)
+    except Exception as exc:
+        logger.warning(f"{audio_file}: could not be loaded ({exc})")
+        return None
+    if not len(y):
+        logger.warning(f"{audio_file}: empty")
+        return None
+    return y
+
+
+def load_pack(audio_files, n_jobs=None):
+    """Decode the files on a thread pool. Returns a list of signals, None for unreadable or empty files."""
+    with ThreadPoolExecutor(max_workers=n_jobs or min(8, os.cpu_count() or 1)) as pool:
+        return list(pool.map(_load, audio_files))
+
+
+def n_frames(n_samples):
+    return 1 + n_samples // HOP_LENGTH
+
+
+def stacks(lengths, max_bytes=STACK_BYTES):
+    """
+    Group signal indices into stacks of similar length. Yields (indices, padded length),
+    the padded length being the bucket's frame count in samples.
+    """
+    lengths = np.asarray(lengths)
+    buckets = -(-n_frames(lengths) // BUCKET_HOPS) * BUCKET_HOPS
+    for bucket in np.unique(buckets):
+        members = np.flatnonzero(buckets == bucket)
+        n_samples = bucket * HOP_LENGTH - 1  # the longest signal with `bucket` frames
+        per_item = (1 + N_FFT // 2) * bucket * np.dtype(np.complex64).itemsize
+        size = max(1, int(max_bytes // per_item))
+        for first in range(0, len(members), size):
+            yield members[first:first + size], n_samples
+
+
+@lru_cache(maxsize=None)
+def _mel_basis(sr):
+    return librosa.filters.mel(sr=sr, n_fft=N_FFT)
+
+
+@lru_cache(maxsize=None)
+def _chroma_basis(sr, tuning):
+    return librosa.filters.chroma(sr=sr, n_fft=N_FFT, tuning=tuning, n_chroma=N_CHROMA)
+
+
+@lru_cache(maxsize=None)
+def _contrast_bands(sr):
+    """Per band: (bin slice, number of bins averaged for valley and peak), as librosa.feature.spectral_contrast."""
+    freq = librosa.fft_frequencies(sr=sr, n_fft=N_FFT)
+    octa = np.zeros(CONTRAST_BANDS + 2)
+    octa[1:] = CONTRAST_FMIN * (2.0 ** np.arange(0, CONTRAST_BANDS + 1))
+    bands = []
+    for k, (f_low, f_high) in enumerate(zip(octa[:-1], octa[1:])):
+        current_band = np.logical_and(freq >= f_low, freq <= f_high)
+        idx = np.flatnonzero(current_band)
+        if k > 0:
+            current_band[idx[0] - 1] = True
+        if k == CONTRAST_BANDS:
+            current_band[idx[-1] + 1:] = True
+        rows = np.flatnonzero(current_band)
+        if k < CONTRAST_BANDS:
+            rows = rows[:-1]
+        n = int(max(np.rint(CONTRAST_QUANTILE * np.sum(current_band)), 1))
+        bands.append((slice(rows[0], rows[-1] + 1), n))
+    return bands
+
+
+def _to_db(power):
+    """power_to_db with the top_db floor taken per stack item, like one file at a time."""
+    log = 10.0 * np.log10(np.maximum(AMIN, power))
+    return np.maximum(log, log.max(axis=(-2, -1), keepdims=True) - TOP_DB)
+
+
+def _masked_mean(values, mask):
+    """Mean over each item's valid frames: values (B, T, k), mask (B, T)."""
+    return np.einsum("btk,bt->bk", values, mask) / mask.sum(axis=1)[:, None]
+
+
+@lru_cache(maxsize=None)
+def _window():
+    return librosa.filters.get_window("hann", N_FFT, fftbins=True)
+
+
+def _spectrogram(stack):
+    """
+    Magnitude STFT of a (B, n_samples) stack as librosa.stft computes it (centred frames,
+    zero edge padding, periodic Hann window, transforms in float64 rounded to float32),
+    laid out (B, frames, bins) so that the filterbanks are single matrix products and the
+    contrast sort runs along a contiguous axis.
+    """
+    from scipy.fft import rfft
+
+    padded = np.pad(stack, ((0, 0), (N_FFT // 2, N_FFT // 2)))
+    frames = np.lib.stride_tricks.sliding_window_view(padded, N_FFT, axis=-1)[:, ::HOP_LENGTH]
+    return np.abs(rfft(frames * _window(), axis=-1).astype(np.complex64))
+
+
+def _tunings(power):
+    """
+    estimate_tuning of each item of a (B, T, F) power stack, vectorised across items:
+    piptrack's parabolic peak picking restricted to its PIPTRACK_FMIN..PIPTRACK_FMAX
+    band, then a per-item median magnitude threshold and tuning histogram.
+    """
+    sr = audio_io.analysis_rate()
+    freqs = librosa.fft_frequencies(sr=sr, n_fft=N_FFT)
+    band = np.flatnonzero((PIPTRACK_FMIN <= freqs) & (freqs < PIPTRACK_FMAX))
+    low, high = band[0], band[-1]
+    S = power[:, :, :high + 2]  # one bin of context above the band
+    thresholded = S * (S > PIPTRACK_THRESHOLD * power.max(axis=-1, keepdims=True))
+    centre = thresholded[:, :, low:high + 1]
+    peaks = (centre > thresholded[:, :, low - 1:high]) & (centre >= thresholded[:, :, low + 1:high + 2])
+    item, t, k = np.nonzero(peaks)
+    k = k + low
+
+    # Parabolic interpolation around each peak (librosa.core.pitch._pi_stencil)
+    below, at, above = S[item, t, k - 1], S[item, t, k], S[item, t, k + 1]
+    a = above + below - 2 * at
+    b = (above - below) / 2
+    shift = np.where(np.abs(b) < np.abs(a), -b / np.where(a == 0, 1, a), 0).astype(S.dtype)
+    pitch = ((k + shift) * float(sr) / N_FFT).astype(S.dtype)
+    mag = at + 0.5 * b * shift
+    pitched = pitch > 0
+    item, pitch, mag = item[pitched], pitch[pitched], mag[pitched]
+
+    # Median peak magnitude of each item, from one sort by (item, magnitude)
+    n_items = len(power)
+    counts = np.bincount(item, minlength=n_items)
+    order = np.lexsort((mag, item))
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    threshold = np.zeros(n_items, dtype=S.dtype)
+    has_pitch = counts > 0
+    if has_pitch.any():
+        first, n = starts[has_pitch], counts[has_pitch]
+        threshold[has_pitch] = (mag[order[first + (n - 1) // 2]] + mag[order[first + n // 2]]) / 2
+    keep = mag >= threshold[item]
+    item, pitch = item[keep], pitch[keep]
+
+    # Tuning histogram of each item (librosa.pitch_tuning)
+    residual = np.mod(N_CHROMA * librosa.hz_to_octs(pitch), 1.0)
+    residual[residual >= 0.5] -= 1.0
+    edges = np.linspace(-0.5, 0.5, int(np.ceil(1.0 / TUNING_RESOLUTION)) + 1)
+    n_bins = len(edges) - 1
+    bins = np.clip(np.searchsorted(edges, residual, side="right") - 1, 0, n_bins - 1)
+    histogram = np.bincount(item * n_bins + bins, minlength=n_items * n_bins).reshape(n_items, n_bins)
+    return np.where(histogram.any(axis=1), edges[np.argmax(histogram, axis=1)], 0.0)
+
+
+def _contrast(magnitude):
+    """Spectral contrast (B, T, bands + 1) of a (B, T, F) magnitude stack."""
+    shape = magnitude.shape[:2] + (CONTRAST_BANDS + 1,)
+    valley, peak = np.zeros(shape), np.zeros(shape)
+    for k, (rows, n) in enumerate(_contrast_bands(audio_io.analysis_rate())):
+        ordered = np.sort(magnitude[:, :, rows], axis=-1)
+        valley[:, :, k] = ordered[:, :, :n].mean(axis=-1)
+        peak[:, :, k] = ordered[:, :, -n:].mean(axis=-1)
+    return _to_db(peak) - _to_db(valley)
+
+
+def stack_features(signals, n_samples):
+    """
+    Similarity feature vectors (mean MFCC, chroma, spectral contrast) of a list of
+    signals, zero-padded to n_samples and analysed as one stack. Returns (B, 39).
+    """
+    from scipy.fft import dct
+
+    sr = audio_io.analysis_rate()
+    stack = np.zeros((len(signals), n_samples), dtype=np.float32)
+    for i, y in enumerate(signals):
+        stack[i, :len(y)] = y
+    frames = np.array([n_frames(len(y)) for y in signals])
+
+    magnitude = _spectrogram(stack)
+    # Frames past an item's own frame count still overlap its tail: clear them so that they count
+    # neither in the per-item maxima (dB floors, tuning) nor in the means
+    mask = (np.arange(magnitude.shape[1])[None, :] < frames[:, None]).astype(magnitude.dtype)
+    magnitude *= mask[:, :, None]
+    power = magnitude ** 2
+
+    mel_db = _to_db(power @ _mel_basis(sr).T)
+    mfcc = dct(mel_db, axis=-1, type=2, norm="ortho")[:, :, :N_MFCC]
+
+    chroma_basis = np.stack([_chroma_basis(sr, float(tuning)) for tuning in _tunings(power)])
+    chroma = librosa.util.normalize(power @ chroma_basis.transpose(0, 2, 1), norm=np.inf, axis=-1)
+
+    contrast = _contrast(magnitude)
+    return np.concatenate([_masked_mean(mfcc, mask), _masked_mean(chroma, mask), _masked_mean(contrast, mask)],
+                          axis=1)
+
+
+def duplicates(features, similarity_threshold=0.85):
+    """
+    Greedy pack deduplication: each row whose cosine similarity to an earlier kept row is
+    above the threshold is a duplicate of the first such row. Returns duplicate_of, -1
+    for kept rows.
+    """
+    vectors = np.asarray(features, dtype=np.float64)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    vectors = vectors / np.where(norms == 0, 1.0, norms)
+    duplicate_of = np.full(len(vectors), -1, dtype=np.int64)
+    kept = np.zeros(len(vectors), dtype=bool)
+    for first in range(0, len(vectors), DEDUP_BLOCK):
+        block = vectors[first:first + DEDUP_BLOCK]
+        similar = (block @ vectors[:first + len(block)].T) > similarity_threshold
+        for i in range(len(block)):
+            row = first + i
+            matches = np.flatnonzero(similar[i, :row] & kept[:row])
+            if len(matches):
+                duplicate_of[row] = matches[0]
+            else:
+                kept[row] = True
+    return duplicate_of
+
+
+@timed()
+def analyse_pack(audio_files, similarity_threshold=0.85, n_clusters=None, cluster_model=None, n_jobs=None):
+    """
+    Analyse a pack of short files in stacks. Returns a dict:
+        files         the files that could be analysed (unreadable and empty ones are skipped)
+        durations     (n,) seconds
+        features      (n, 39) float32 similarity feature vectors, as segment_similarity_features
+        duplicate_of  (n,) index of the earlier file each one repeats (similarity above the threshold), -1 if unique
+        labels        (n,) cluster labels, -1 when not clustered
+        cluster_model the ClusterModel used, or None
+    Labels come from cluster_model, or from one model with n_clusters fitted on the unique files.
+    """
+    with stage("pack_load", files=len(audio_files)):
+        signals = load_pack(audio_files, n_jobs)
+    loaded = [i for i, y in enumerate(signals) if y is not None]
+    if not loaded:
+        raise ValueError("None of the files could be loaded")
+    files = [audio_files[i] for i in loaded]
+    signals = [signals[i] for i in loaded]
+    lengths = np.array([len(y) for y in signals])
+
+    features = np.zeros((len(signals), N_MFCC + N_CHROMA + CONTRAST_BANDS + 1), dtype=np.float32)
+    with stage("pack_features", files=len(signals)):
+        for items, n_samples in stacks(lengths):
+            features[items] = stack_features([signals[i] for i in items], n_samples)
+            count("stacks")
+    count("files", len(signals))
+
+    with stage("pack_dedup"):
+        duplicate_of = duplicates(features, similarity_threshold)
+    unique = duplicate_of < 0
+    count("unique", int(unique.sum()))
+
+    labels = np.full(len(files), -1, dtype=np.int32)
+    if cluster_model is None and n_clusters:
+        cluster_model = ClusterModel.fit(features[unique], n_clusters, feature_set="similarity", standardize=False)
+    if cluster_model is not None:
+        labels[:] = cluster_model.predict(features)
+
+    logger.info(f"{len(files)} files, {int(unique.sum())} unique"
+                + (f", {cluster_model.n_clusters} clusters" if cluster_model is not None else ""))
+    return {"files": files, "durations": lengths / audio_io.analysis_rate(), "features": features,
+            "duplicate_of": duplicate_of, "labels": labels, "cluster_model": cluster_model}
+
+
+def save_pack(path, result):
+    """Write an analyse_pack result as one .npz (the cluster model, if any, next to it)."""
+    np.savez(path, files=np.array(result["files"]), durations=result["durations"], features=result["features"],
+             duplicate_of=result["duplicate_of"], labels=result["labels"])
+    if result["cluster_model"] is not None:
+        result["cluster_model"].save(os.path.splitext(path)[0] + "_model.npz")
@@ -0,0 +1,123 @@
+"""
+Table model over the current segments, for a QTableView.
+
+Segments are kept as NumPy columns (start, end, duration, cluster, similarity) instead of one
+list item per segment: the view only asks for the rows it draws, so 10^5 segments
+cost a few arrays, and sorting is a single argsort over one column that permutes
+the row order in place.
+"""
+
+import numpy as np
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex
+
+COLUMNS = ["#", "Cluster", "Start (s)", "End (s)", "Duration (s)", "Similarity"]
+NUMBER, CLUSTER, START, END, DURATION, SIMILARITY = range(len(COLUMNS))
+
+
+class SegmentTableModel(QAbstractTableModel):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._set_columns(np.zeros(0), np.zeros(0), None, None)
+
+    def _set_columns(self, starts, ends, clusters, similarity):
+        n = len(starts)
+        self.starts = np.asarray(starts, dtype=float)
+        self.ends = np.asarray(ends, dtype=float)
+        self.durations = self.ends - self.starts
+        self.clusters = np.full(n, -1) if clusters is None else np.asarray(clusters, dtype=int)
+        self.similarity = np.full(n, np.nan) if similarity is None else np.asarray(similarity, dtype=float)
+        self.order = np.arange(n)  # view row -> segment index
+
+    def set_segments(self, segments, clusters=None, similarity=None):
+        """Replace all rows. clusters (-1 = none) and similarity (NaN = none) are optional per-segment arrays."""
+        bounds = np.asarray(segments, dtype=float).reshape(-1, 2)
+        self.beginResetModel()
+        self._set_columns(bounds[:, 0], bounds[:, 1], clusters, similarity)
+        self.endResetModel()
+
+    def append_segment(self, start, end):
+        """Add one segment as the last row."""
+        row = len(self.order)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self.starts = np.append(self.starts, start)
+        self.ends = np.append(self.ends, end)
+        self.durations = np.append(self.durations, end - start)
+        self.clusters = np.append(self.clusters, -1)
+        self.similarity = np.append(self.similarity, np.nan)
+        self.order = np.append(self.order, row)
+        self.endInsertRows()
+
+    def clear(self):
+        self.set_segments([])
+
+    def segment_index(self, row):
+        """Index into the segment list of the segment shown at a view row."""
+        return int(self.order[row])
+
+    def row_of(self, segment):
+        """View row currently showing a segment index."""
+        return int(np.flatnonzero(self.order == segment)[0])
+
+    def column_values(self, column):
+        """Per-segment values of a column (in segment order), as used for sorting."""
+        if column == CLUSTER:
+            return self.clusters
+        if column == START:
+            return self.starts
+        if column == END:
+            return self.ends
+        if column == DURATION:
+            return self.durations
+        if column == SIMILARITY:
+            return np.nan_to_num(self.similarity, nan=-np.inf)
+        return np.arange(len(self.starts))
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.order)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(COLUMNS)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        i = self.order[index.row()]
+        column = index.column()
+        if role == Qt.TextAlignmentRole:
+            return int(Qt.AlignRight | Qt.AlignVCenter)
+        if role != Qt.DisplayRole:
+            return None
+        if column == NUMBER:
+            return str(i + 1)
+        if column == CLUSTER:
+            return "" if self.clusters[i] < 0 else str(self.clusters[i] + 1)
+        if column == SIMILARITY:
+            return "" if np.isnan(self.similarity[i]) else f"{self.similarity[i]:.2f}"
+        if column == START:
+            return f"{self.starts[i]:.2f}"
+        if column == END:
+            return f"{self.ends[i]:.2f}"
+        return f"{self.durations[i]:.2f}"
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return COLUMNS[section]
+        return None
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        """Reorder rows by one column with a stable argsort; selections follow their segments."""
+        self.layoutAboutToBeChanged.emit()
+        old_persistent = self.persistentIndexList()
+        persistent_segments = [self.order[index.row()] for index in old_persistent]
+
+        self.order = np.argsort(self.column_values(column), kind="stable")
+        if order == Qt.DescendingOrder:
+            self.order = self.order[::-1].copy()
+
+        rows = np.empty(len(self.order), dtype=int)
+        rows[self.order] = np.arange(len(self.order))
+        self.changePersistentIndexList(
+            old_persistent,
+            [self.index(int(rows[i]), index.column()) for i, index in zip(persistent_segments, old_persistent)],
+        )
+        self.layoutChanged.emit()
@@ -1,29 +1,48 @@
+import logging
 import numpy as np
-from sklearn.cluster import KMeans
-from utils import is_silent_segment
+import audio_io
+from interval_index import IntervalIndex
+from shared_arrays import map_segments
+from utils import is_silent_segment, segment_similarity_features
+from instrumentation import timed, count
+
+logger = logging.getLogger(__name__)
+
+SEGMENTATION_METHODS = ["By Beats", "By Transients", "By Frequency Range", "By Onsets"]
+# The detect_features detectors each method reads (beats fall back to transients)
+METHOD_DETECTORS = {
+    "By Beats": ["beats", "transients"],
+    "By Transients": ["transients"],
+    "By Frequency Range": ["spectral_centroid"],
+    "By Onsets": ["onsets"],
+}
+# How segments of multichannel analysis are combined (see segment_channels); "mix" analyses a mono mixdown
+CHANNEL_MODES = ["mix", "union", "intersection", "per-channel"]
+BOUNDARY_TOLERANCE = 0.03  # seconds (just over one analysis frame) within which channel boundaries are the same
 
 def segment_audio(features, threshold=0.1):
     """Segment audio based on all features."""
-    print("\nStarting audio segmentation process...")
+    logger.info("Starting audio segmentation process...")
     
     # Combine all events
-    print("Combining feature events...")
+    logger.info("Combining feature events...")
     all_events = np.concatenate([
         features["transients"],
         features["beats"],
         features["spectral_centroid"][0][np.where(np.diff(features["spectral_centroid"][1]) > threshold)]
     ])
     all_events = np.sort(np.unique(all_events))
-    print(f"Found {len(all_events)} potential segment boundaries")
+    logger.info(f"Found {len(all_events)} potential segment boundaries")
     
     # Create segments
-    print("\nGenerating segments...")
+    logger.info("Generating segments...")
     segments = [(all_events[i], all_events[i+1]) for i in range(len(all_events) - 1)]
-    print(f"Created {len(segments)} initial segments")
+    logger.info(f"Created {len(segments)} initial segments")
     
     return segments
 
 def cluster_segments(segment_files, n_clusters):
+    from sklearn.cluster import KMeans
     features = [extract_features(f) for f in segment_files]
     kmeans = KMeans(n_clusters=n_clusters, random_state=0).fit(features)
     unique_segments = []
@@ -37,18 +56,19 @@ def cluster_segments(segment_files, n_clusters):
 
     return unique_segments
 
+@timed()
 def segment_by_beats(features, min_segment_length=0.1):
     """Segment audio by detected beats with adaptive segment merging"""
-    print("\nStarting beat-based segmentation...")
+    logger.info("Starting beat-based segmentation...")
     segments = []
     beats = features["beats"]
     
     if len(beats) < 2:
-        print("Not enough beats detected for segmentation")
-        print("Falling back to transient-based segmentation...")
+        logger.info("Not enough beats detected for segmentation")
+        logger.info("Falling back to transient-based segmentation...")
         return segment_by_transients(features, min_segment_length)
     
-    print(f"Processing {len(beats)} detected beats...")
+    logger.info(f"Processing {len(beats)} detected beats...")
     
     # Initialize temporary segment
     current_start = beats[0]
@@ -62,36 +82,36 @@ def segment_by_beats(features, min_segment_length=0.1):
             segments.append((current_start, beats[i]))
             current_start = beats[i]
             current_duration = 0
-            
-        if (i + 1) % 10 == 0:
-            print(f"Processed {i + 1}/{len(beats)} beats...")
     
     # Add the last segment if it meets the minimum length
     if len(beats) > 1 and beats[-1] - current_start >= min_segment_length:
         segments.append((current_start, beats[-1]))
     
-    print(f"\nBeat segmentation complete:")
-    print(f"- Total beats processed: {len(beats)}")
-    print(f"- Segments created: {len(segments)}")
+    count("beats", len(beats))
+    count("segments", len(segments))
+    logger.info("Beat segmentation complete:")
+    logger.info(f"- Total beats processed: {len(beats)}")
+    logger.info(f"- Segments created: {len(segments)}")
     
     if not segments:
-        print("\nNo valid segments found using beats")
-        print("Falling back to transient-based segmentation...")
+        logger.info("No valid segments found using beats")
+        logger.info("Falling back to transient-based segmentation...")
         return segment_by_transients(features, min_segment_length)
     
     return segments
 
+@timed()
 def segment_by_transients(features, min_segment_length=0.1):
     """Segment audio by detected transients with adaptive segment merging"""
-    print("\nStarting transient-based segmentation...")
+    logger.info("Starting transient-based segmentation...")
     segments = []
     transients = features["transients"]
     
     if len(transients) < 2:
-        print("Not enough transients detected for segmentation")
+        logger.info("Not enough transients detected for segmentation")
         return []
     
-    print(f"Processing {len(transients)} detected transients...")
+    logger.info(f"Processing {len(transients)} detected transients...")
     
     # Initialize temporary segment
     current_start = transients[0]
@@ -105,67 +125,74 @@ def segment_by_transients(features, min_segment_length=0.1):
             segments.append((current_start, transients[i]))
             current_start = transients[i]
             current_duration = 0
-            
-        if (i + 1) % 20 == 0:
-            print(f"Processed {i + 1}/{len(transients)} transients...")
     
     # Add the last segment if it meets the minimum length
     if len(transients) > 1 and transients[-1] - current_start >= min_segment_length:
         segments.append((current_start, transients[-1]))
     
-    print(f"\nTransient segmentation complete:")
-    print(f"- Total transients processed: {len(transients)}")
-    print(f"- Segments created: {len(segments)}")
+    count("transients", len(transients))
+    count("segments", len(segments))
+    logger.info("Transient segmentation complete:")
+    logger.info(f"- Total transients processed: {len(transients)}")
+    logger.info(f"- Segments created: {len(segments)}")
     
     return segments
 
-def segment_by_frequency(features, min_freq=100, max_freq=2000, min_segment_length=0.1):
-    """Segment audio by frequency content with adaptive segment merging"""
-    print("\nStarting frequency-based segmentation...")
+@timed()
+def segment_by_frequency_bands(features, bands, min_segment_length=0.1):
+    """
+    Segment audio against several (min_freq, max_freq) bands in one vectorised pass.
+    A segment is a run of frames whose spectral centroid lies inside the band; it ends
+    at the first frame outside the band (or at the last frame) and is kept if it lasts
+    at least min_segment_length. Returns one (n_segments, 2) array of start/end times
+    per band, in the order of bands.
+    """
     times, spectral_centroid = features["spectral_centroid"]
-    
-    print("Analyzing frequency content...")
-    print(f"Frequency range: {min_freq}Hz - {max_freq}Hz")
-    
-    segments = []
-    start_time = None
-    current_start = None
-    
-    for i, (time, freq) in enumerate(zip(times, spectral_centroid)):
-        if min_freq <= freq <= max_freq:
-            if current_start is None:
-                current_start = time
-        else:
-            if current_start is not None:
-                segment_duration = time - current_start
-                if segment_duration >= min_segment_length:
-                    segments.append((current_start, time))
-                current_start = None
-                
-        if (i + 1) % (len(times) // 10) == 0:
-            print(f"Processed {i + 1}/{len(times)} time points...")
-    
-    # Add the final segment if it meets the minimum length
-    if current_start is not None and times[-1] - current_start >= min_segment_length:
-        segments.append((current_start, times[-1]))
-    
-    print(f"\nFrequency segmentation complete:")
-    print(f"- Total time points analyzed: {len(times)}")
-    print(f"- Segments created: {len(segments)}")
-    
-    return segments
+    times = np.asarray(times)
+    bands = np.asarray(bands, dtype=float).reshape(-1, 2)
+    if len(times) == 0:
+        return [np.empty((0, 2)) for _ in bands]
 
+    centroid = np.asarray(spectral_centroid)[None, :]
+    inside = (centroid >= bands[:, :1]) & (centroid <= bands[:, 1:])  # (bands, frames)
+
+    # Run-length encode every band at once: +1 where a run starts, -1 one past where it ends.
+    # nonzero() walks rows in order, so the k-th start and k-th end belong to the same run.
+    edges = np.diff(np.pad(inside.astype(np.int8), ((0, 0), (1, 1))), axis=1)
+    band_index, start_frames = np.nonzero(edges == 1)
+    _, end_frames = np.nonzero(edges == -1)
+
+    starts = times[start_frames]
+    ends = times[np.minimum(end_frames, len(times) - 1)]
+    keep = ends - starts >= min_segment_length
+    band_index, segments = band_index[keep], np.column_stack([starts[keep], ends[keep]])
+
+    per_band = np.split(segments, np.searchsorted(band_index, np.arange(1, len(bands))))
+    count("frames", len(times))
+    count("bands", len(bands))
+    count("segments", len(segments))
+    return per_band
+
+@timed()
+def segment_by_frequency(features, min_freq=100, max_freq=2000, min_segment_length=0.1):
+    """Segment audio by frequency content: runs of frames whose spectral centroid is in the band"""
+    logger.info(f"Frequency segmentation, range: {min_freq}Hz - {max_freq}Hz")
+    segments = segment_by_frequency_bands(features, [(min_freq, max_freq)], min_segment_length)[0]
+    logger.info(f"- Time points analyzed: {len(features['spectral_centroid'][0])}, segments created: {len(segments)}")
+    return [(start, end) for start, end in segments]
+
+@timed()
 def segment_by_onsets(features, min_segment_length=0.1):
     """Segment audio by onset detection with adaptive segment merging"""
-    print("\nStarting onset-based segmentation...")
+    logger.info("Starting onset-based segmentation...")
     segments = []
     onsets = features["onsets"]
     
     if len(onsets) < 2:
-        print("Not enough onsets detected for segmentation")
+        logger.info("Not enough onsets detected for segmentation")
         return []
     
-    print(f"Processing {len(onsets)} detected onsets...")
+    logger.info(f"Processing {len(onsets)} detected onsets...")
     
     # Initialize temporary segment
     current_start = onsets[0]
@@ -180,17 +207,134 @@ def segment_by_onsets(features, min_segment_length=0.1):
                 segments.append((current_start, onsets[i]))
             current_start = onsets[i]
             current_duration = 0
-            
-        if (i + 1) % 20 == 0:
-            print(f"Processed {i + 1}/{len(onsets)} onsets...")
     
     # Add the last segment if it meets the minimum length
     if len(onsets) > 1 and onsets[-1] - current_start >= min_segment_length:
         if not is_silent_segment(features["audio_file"], current_start, onsets[-1]):
             segments.append((current_start, onsets[-1]))
     
-    print(f"\nOnset segmentation complete:")
-    print(f"- Total onsets processed: {len(onsets)}")
-    print(f"- Segments created: {len(segments)}")
+    count("onsets", len(onsets))
+    count("segments", len(segments))
+    logger.info("Onset segmentation complete:")
+    logger.info(f"- Total onsets processed: {len(onsets)}")
+    logger.info(f"- Segments created: {len(segments)}")
     
-    return segments
\ No newline at end of file
+    return segments
+
+def segment_by_method(features, method, min_segment_length=0.1, min_freq=100, max_freq=5000):
+    """Run one of the SEGMENTATION_METHODS by name."""
+    if method == "By Beats":
+        return segment_by_beats(features, min_segment_length=min_segment_length)
+    elif method == "By Transients":
+        return segment_by_transients(features, min_segment_length=min_segment_length)
+    elif method == "By Frequency Range":
+        return segment_by_frequency(features, min_freq=min_freq, max_freq=max_freq, min_segment_length=min_segment_length)
+    elif method == "By Onsets":
+        return segment_by_onsets(features, min_segment_length=min_segment_length)
+    raise ValueError(f"Unknown segmentation method: {method}")
+
+def segment_feature_vectors(y, sr, segments):
+    """segment_similarity_features of each segment of y (None for empty segments)."""
+    vectors = []
+    for start, end in segments:
+        segment = audio_io.as_float(y[int(start * sr):int(end * sr)])
+        vectors.append(segment_similarity_features(segment, sr) if len(segment) > 0 else None)
+    return vectors
+
+@timed()
+def filter_similar_segments(y, sr, segments, similarity_threshold=0.85, n_jobs=1):
+    """
+    Keep only segments whose similarity features are not too close to an already kept one.
+    When two segments are similar, the one with more distinct features (higher variance) wins.
+    With n_jobs > 1 the feature vectors are computed in worker processes that read y from
+    shared memory (see shared_arrays.map_segments).
+    Returns the unique segments and their feature vectors.
+    """
+    unique_segments = []
+    segment_features = []
+
+    for (start, end), current_features in zip(segments, map_segments(segment_feature_vectors, y, sr, segments,
+                                                                     n_jobs)):
+        if current_features is not None:
+            # Check similarity with already selected segments
+            is_unique = True
+            for idx, existing_features in enumerate(segment_features):
+                similarity = np.dot(current_features, existing_features) / \
+                           (np.linalg.norm(current_features) * np.linalg.norm(existing_features))
+
+                if similarity > similarity_threshold:
+                    is_unique = False
+                    # If this segment has more distinct features, replace the existing one
+                    feature_variance = np.var(current_features)
+                    existing_variance = np.var(existing_features)
+                    if feature_variance > existing_variance:
+                        unique_segments[idx] = (start, end)
+                        segment_features[idx] = current_features
+                        logger.debug("Replaced similar segment with more unique variant")
+                    break
+
+            if is_unique:
+                unique_segments.append((start, end))
+                segment_features.append(current_features)
+
+    count("segments", len(segments))
+    count("unique", len(unique_segments))
+    return unique_segments, segment_features
+
+def channel_features(features, channel):
+    """The features of one channel, from detect_features(..., channels=True)."""
+    view = {}
+    for name, value in features.items():
+        if name in ("audio_file", "channels"):
+            view[name] = value
+        elif isinstance(value, tuple):  # frame-level (times, values), channels on the first axis
+            view[name] = (value[0], value[1][channel])
+        else:  # events: a list with one entry per channel
+            view[name] = value[channel]
+    return view
+
+def _distinct(times, tolerance):
+    """Sorted times with each run of values closer than tolerance reduced to its first."""
+    times = np.sort(times)
+    return times[np.concatenate([[True], np.diff(times) > tolerance])] if len(times) else times
+
+@timed()
+def segment_channels(features, method, mode="union", min_segment_length=0.1, min_freq=100, max_freq=5000,
+                     tolerance=BOUNDARY_TOLERANCE):
+    """
+    Segment multichannel features (detect_features(..., channels=True)) channel by channel
+    with segment_by_method, then combine:
+      union         cut at every boundary found in any channel; keep the pieces some channel covers
+      intersection  cut only at boundaries every channel has (within tolerance); keep the pieces
+                    all channels cover
+      per-channel   every channel's own segments, possibly overlapping; a segment found in several
+                    channels is kept once
+    Pieces shorter than min_segment_length are dropped. Returns a sorted list of (start, end).
+    """
+    if mode not in CHANNEL_MODES[1:]:
+        raise ValueError(f"Unknown channel mode '{mode}', expected one of {CHANNEL_MODES[1:]}")
+    per_channel = [segment_by_method(channel_features(features, channel), method, min_segment_length, min_freq,
+                                     max_freq) for channel in range(features["channels"])]
+    count("channel_segments", sum(map(len, per_channel)))
+
+    if mode == "per-channel":
+        segments = []
+        for start, end in sorted(segment for segments in per_channel for segment in segments):
+            if not (segments and abs(start - segments[-1][0]) <= tolerance and abs(end - segments[-1][1]) <= tolerance):
+                segments.append((start, end))
+        logger.info(f"Per-channel segmentation: {len(segments)} segments from {len(per_channel)} channels")
+        return segments
+
+    indexes = [IntervalIndex.from_segments(segments) for segments in per_channel]
+    boundaries = [_distinct(np.ravel(segments), tolerance) for segments in per_channel]
+    cuts = _distinct(np.concatenate(boundaries), tolerance)
+    if mode == "intersection":
+        cuts = [t for t in cuts if all(len(b) and np.min(np.abs(b - t)) <= tolerance for b in boundaries)]
+        covered = all
+    else:
+        covered = any
+    segments = [(float(start), float(end)) for start, end in zip(cuts[:-1], cuts[1:])
+                if end - start >= min_segment_length and covered(len(index.at((start + end) / 2)) for index in indexes)]
+    logger.info(f"{mode.capitalize()} of {len(per_channel)} channels: {len(segments)} segments "
+                f"(per channel: {[len(s) for s in per_channel]})")
+    return segments
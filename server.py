@@ -0,0 +1,270 @@
+"""
+Local HTTP job server for the segmentation pipeline.
+
+    python batch.py serve --port 8765 --workers 4 --max-queue 32
+
+Endpoints (JSON in and out):
+
+    POST /jobs              {"audio_file": "/path/a.wav", "method": "onsets", "clusters": 8, ...}
+                            -> 202 {"id": ...}; 503 when the queue is full
+    GET  /jobs/<id>         -> status: queued | running | done | failed, plus timings
+    GET  /jobs/<id>/result  -> the process_file summary (409 until the job is done)
+    GET  /health            -> worker and queue counts
+
+Jobs run process_file in a process pool whose workers import librosa and sklearn
+and run a short warm-up analysis when they start (pipeline.init_worker), so the
+first real job does not pay for imports and numba compilation. Each job's result
+carries its queue wait, run time and the per-stage instrumentation records from
+the worker.
+Finished jobs are kept for FINISHED_JOB_SECONDS, and at most MAX_FINISHED_JOBS of
+them, after which their status and result are gone (404). If a worker dies (e.g. out
+of memory) the pool breaks and its running jobs fail; the next submission starts a
+new warmed pool.
+Files are read from and written to the server's filesystem, so it is meant to be
+bound to localhost.
+"""
+
+import json
+import logging
+import multiprocessing
+import re
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import audio_io
+from pipeline import init_worker
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# Request fields -> process_file keyword arguments
+JOB_OPTIONS = {
+    "min_time": "min_time",
+    "max_time": "max_time",
+    "similarity": "similarity_threshold",
+    "min_freq": "min_freq",
+    "max_freq": "max_freq",
+    "clusters": "n_clusters",
+    "output_dir": "output_root",
+    "beat_window": "beat_window",
+    "coarse_onsets": "coarse_onsets",
+    "channels": "channel_mode",
+}
+JOB_PATH = re.compile(r"^/jobs/([0-9a-f]{32})(/result)?$")
+FINISHED_JOB_SECONDS = 3600.0  # how long a finished job's status and result stay available
+MAX_FINISHED_JOBS = 1000
+
+
+def _ready():
+    return True
+
+
+def _run_job(audio_file, options, model_path):
+    """Worker side of a job: run the pipeline and collect its stage records."""
+    from clustering import ClusterModel
+    from instrumentation import add_sink, remove_sink, stage
+    from pipeline import process_file
+
+    records = []
+    sink = add_sink(records.append)
+    start = time.perf_counter()
+    try:
+        cluster_model = ClusterModel.load(model_path) if model_path else None
+        with stage("job", audio_file=audio_file):
+            result = process_file(audio_file, cluster_model=cluster_model, **options)
+    finally:
+        remove_sink(sink)
+    result["segments"] = [[float(start_time), float(end_time)] for start_time, end_time in result["segments"]]
+    return result, records, time.perf_counter() - start
+
+
+class Job:
+    def __init__(self, audio_file, options, model_path):
+        self.id = uuid.uuid4().hex
+        self.audio_file = audio_file
+        self.options = options
+        self.model_path = model_path
+        self.status = "queued"  # until finished; "running" is derived from the pool future
+        self.future = None
+        self.error = None
+        self.result = None
+        self.stages = []
+        self.submitted = time.time()
+        self.finished = None
+        self.run_s = None
+
+    def state(self):
+        if self.status == "queued" and self.future is not None and self.future.running():
+            return "running"
+        return self.status
+
+    def summary(self):
+        return {
+            "id": self.id,
+            "audio_file": self.audio_file,
+            "status": self.state(),
+            "error": self.error,
+            "submitted": self.submitted,
+            "finished": self.finished,
+            "run_s": self.run_s,
+            "queue_s": None if self.run_s is None else round(self.finished - self.submitted - self.run_s, 6),
+        }
+
+
+class JobServer(ThreadingHTTPServer):
+    """HTTP server owning the job table and the warmed process pool."""
+    daemon_threads = True
+
+    def __init__(self, address, workers=2, max_queue=16, finished_ttl=FINISHED_JOB_SECONDS,
+                 max_finished=MAX_FINISHED_JOBS):
+        from batch import METHODS
+
+        self.methods = METHODS
+        self.workers = workers
+        self.max_queue = max_queue
+        self.finished_ttl = finished_ttl
+        self.max_finished = max_finished
+        self.jobs = {}
+        self.finished_jobs = deque()  # ids of finished jobs, oldest first
+        self.n_pending = 0
+        self.lock = threading.Lock()
+        self.pool = self._start_pool()
+        super().__init__(address, JobHandler)
+
+    def _start_pool(self):
+        pool = ProcessPoolExecutor(max_workers=self.workers, initializer=init_worker, initargs=(audio_io.settings(),),
+                                   mp_context=multiprocessing.get_context("spawn"))
+        # The pool starts a new process whenever no worker is idle, so this starts and warms all of them
+        for future in [pool.submit(_ready) for _ in range(self.workers)]:
+            future.result()
+        return pool
+
+    def pending(self):
+        return self.n_pending
+
+    def _evict(self):
+        """Forget finished jobs beyond the cap or older than the TTL (call with the lock held)."""
+        expired = time.time() - self.finished_ttl
+        while self.finished_jobs and (len(self.finished_jobs) > self.max_finished
+                                      or self.jobs[self.finished_jobs[0]].finished < expired):
+            del self.jobs[self.finished_jobs.popleft()]
+
+    def submit(self, request):
+        """
+        Validate a job request and queue it. Returns the Job, or raises ValueError /
+        OverflowError, or BrokenProcessPool if a restarted pool fails too.
+        """
+        audio_file = request.get("audio_file")
+        if not isinstance(audio_file, str) or not audio_file:
+            raise ValueError("'audio_file' is required")
+        method = request.get("method", "onsets")
+        if method not in self.methods:
+            raise ValueError(f"Unknown method '{method}', expected one of {sorted(self.methods)}")
+        unknown = set(request) - set(JOB_OPTIONS) - {"audio_file", "method", "model"}
+        if unknown:
+            raise ValueError(f"Unknown fields: {sorted(unknown)}")
+        options = {JOB_OPTIONS[key]: value for key, value in request.items() if key in JOB_OPTIONS}
+        options["method"] = self.methods[method]
+
+        job = Job(audio_file, options, request.get("model"))
+        with self.lock:
+            self._evict()
+            if self.n_pending >= self.max_queue:
+                raise OverflowError("Job queue is full")
+            try:
+                job.future = self.pool.submit(_run_job, job.audio_file, job.options, job.model_path)
+            except BrokenProcessPool:
+                # A worker died (e.g. out of memory) and took the pool down: start a new warmed one
+                logger.warning("Worker pool is broken; restarting it")
+                self.pool.shutdown(wait=False, cancel_futures=True)
+                self.pool = self._start_pool()
+                job.future = self.pool.submit(_run_job, job.audio_file, job.options, job.model_path)
+            self.jobs[job.id] = job
+            self.n_pending += 1
+        # Outside the lock: the callback runs right away if the job has already finished
+        job.future.add_done_callback(lambda done: self._finish(job, done))
+        return job
+
+    def _finish(self, job, future):
+        job.finished = time.time()
+        try:
+            job.result, job.stages, job.run_s = future.result()
+            job.status = "done"
+        except Exception as e:
+            job.run_s = 0.0
+            job.status, job.error = "failed", f"{type(e).__name__}: {e}"
+            logger.error(f"Job {job.id} ({job.audio_file}) failed: {job.error}")
+        with self.lock:
+            self.n_pending -= 1
+            self.finished_jobs.append(job.id)
+            self._evict()
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown(cancel_futures=True)
+
+
+class JobHandler(BaseHTTPRequestHandler):
+    def _send(self, status, payload, headers=None):
+        body = json.dumps(payload, default=str).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        if self.path != "/jobs":
+            return self._send(404, {"error": "Not found"})
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            if not isinstance(request, dict):
+                raise ValueError("Expected a JSON object")
+            job = self.server.submit(request)
+        except OverflowError as e:
+            return self._send(503, {"error": str(e)}, {"Retry-After": "5"})
+        except BrokenProcessPool as e:
+            logger.error(f"Could not restart the worker pool: {e}")
+            return self._send(503, {"error": "Worker pool is unavailable"}, {"Retry-After": "5"})
+        except ValueError as e:  # includes malformed JSON
+            return self._send(400, {"error": str(e)})
+        self._send(202, {"id": job.id, "status": job.state()}, {"Location": f"/jobs/{job.id}"})
+
+    def do_GET(self):
+        if self.path == "/health":
+            with self.server.lock:
+                pending = self.server.pending()
+            return self._send(200, {"workers": self.server.workers, "pending": pending,
+                                    "max_queue": self.server.max_queue, "jobs": len(self.server.jobs)})
+        match = JOB_PATH.match(self.path)
+        job = self.server.jobs.get(match.group(1)) if match else None
+        if job is None:
+            return self._send(404, {"error": "Unknown job"})
+        if not match.group(2):
+            return self._send(200, job.summary())
+        if job.status == "failed":
+            return self._send(500, job.summary())
+        if job.status != "done":
+            return self._send(409, job.summary())
+        self._send(200, dict(job.summary(), result=job.result, stages=job.stages))
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} {format % args}")
+
+
+def serve(host="127.0.0.1", port=8765, workers=2, max_queue=16):
+    """Run the job server until interrupted."""
+    server = JobServer((host, port), workers=workers, max_queue=max_queue)
+    logger.info(f"Serving segmentation jobs on http://{host}:{server.server_address[1]} with {workers} workers")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
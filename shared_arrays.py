@@ -0,0 +1,246 @@
+"""
+Arrays shared with process-pool workers through named shared memory.
+
+Passing a decoded signal or a feature matrix to pool workers as an argument pickles
+a full copy into every task. A SharedArrayStore instead copies each array once into
+a multiprocessing.shared_memory segment and hands out a small picklable ArrayHandle
+(segment name, shape, dtype). Workers attach() the handle and get a read-only numpy
+view of the same pages: no copy, and one resident copy however many workers read it.
+
+    with SharedArrayStore() as store:
+        handle = store.put(y)
+        results = pool.map(work, [handle] * n, ...)   # in the worker: y = attach(handle)
+
+Segments are unlinked when the store is closed, also when a worker or the pool fails.
+If the owning process dies without closing the store, multiprocessing's resource
+tracker unlinks them when the process exits; segments left behind when even that did
+not run (e.g. the whole process group was killed) are swept by the next store that
+is created, by owner pid, on systems that list shared memory under /dev/shm.
+
+map_segments builds on this to run a per-segment function over a signal in a pool.
+Its workers are started by a fork server (spawned where there is none), never forked
+from the caller, which may be a multithreaded GUI: a fork copies locks other threads
+hold, and the child can deadlock on them. As such workers start without the caller's
+imports and compiled numba code, the pool is kept between calls.
+"""
+
+import logging
+import multiprocessing
+import os
+import secrets
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+import numpy as np
+import audio_io
+from instrumentation import count
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_PREFIX = "audioseg_"  # shared memory names: audioseg_<owner pid>_<random>
+SHM_DIRECTORY = "/dev/shm"
+ATTACHED_SEGMENTS = 16  # segments a worker keeps mapped between tasks
+MIN_PARALLEL_SEGMENTS = 32  # below this many segments a pool costs more than it saves
+BATCHES_PER_JOB = 4  # map_segments splits the segments into this many batches per worker
+
+# Modules the fork server imports once, so that workers forked from it start with them loaded
+WORKER_PRELOAD = ["numpy", "librosa", "segmentation", "clustering"]
+
+# Python 3.13+ can attach without registering the segment with the resource tracker
+_ATTACH_OPTIONS = {"track": False} if sys.version_info >= (3, 13) else {}
+
+
+class ArrayHandle:
+    """Picklable reference to an array in a shared memory segment."""
+
+    __slots__ = ("name", "shape", "dtype")
+
+    def __init__(self, name, shape, dtype):
+        self.name = name
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype).str
+
+    def __getstate__(self):
+        return self.name, self.shape, self.dtype
+
+    def __setstate__(self, state):
+        self.name, self.shape, self.dtype = state
+
+    @property
+    def nbytes(self):
+        return int(np.prod(self.shape)) * np.dtype(self.dtype).itemsize
+
+    def __repr__(self):
+        return f"ArrayHandle({self.name!r}, {self.shape}, {self.dtype!r})"
+
+
+def _owner_pid(name):
+    try:
+        return int(name[len(SEGMENT_PREFIX):].split("_", 1)[0])
+    except ValueError:
+        return None
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def remove_stale_segments():
+    """Unlink shared memory segments of this module whose owner process no longer exists. Returns their names."""
+    if not os.path.isdir(SHM_DIRECTORY):
+        return []
+    removed = []
+    for name in os.listdir(SHM_DIRECTORY):
+        pid = _owner_pid(name) if name.startswith(SEGMENT_PREFIX) else None
+        if pid is None or _pid_alive(pid):
+            continue
+        try:
+            os.unlink(os.path.join(SHM_DIRECTORY, name))
+            removed.append(name)
+        except OSError:
+            pass
+    if removed:
+        logger.info(f"Removed {len(removed)} shared memory segments left by processes that exited")
+    return removed
+
+
+class SharedArrayStore:
+    """Owner side: copies arrays into shared memory and unlinks them all on close()."""
+
+    def __init__(self):
+        remove_stale_segments()
+        self._segments = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def put(self, array):
+        """Copy array into a new shared memory segment. Returns its ArrayHandle."""
+        array = np.ascontiguousarray(array)
+        name = f"{SEGMENT_PREFIX}{os.getpid()}_{secrets.token_hex(6)}"
+        segment = shared_memory.SharedMemory(name=name, create=True, size=max(array.nbytes, 1))
+        self._segments.append(segment)
+        np.ndarray(array.shape, dtype=array.dtype, buffer=segment.buf)[...] = array
+        count("shared_bytes", array.nbytes)
+        return ArrayHandle(name, array.shape, array.dtype)
+
+    def put_all(self, arrays):
+        """put() every numpy array value of a dict; other values are passed through as they are."""
+        return {key: self.put(value) if isinstance(value, np.ndarray) else value for key, value in arrays.items()}
+
+    def close(self):
+        """Unmap and unlink every segment of the store (workers that still have one mapped keep their pages)."""
+        while self._segments:
+            segment = self._segments.pop()
+            try:
+                segment.close()
+            except BufferError:  # a view handed out in this process is still alive; the unlink still frees the name
+                pass
+            try:
+                segment.unlink()
+            except FileNotFoundError:
+                pass
+
+
+_attached = OrderedDict()  # name -> SharedMemory mapped in this (worker) process
+
+
+def attach(handle):
+    """
+    Read-only numpy view of a shared array (zero-copy). The segment stays mapped in this
+    process for later tasks; the least recently used ones beyond ATTACHED_SEGMENTS are unmapped.
+    """
+    segment = _attached.pop(handle.name, None)
+    if segment is None:
+        segment = shared_memory.SharedMemory(name=handle.name, **_ATTACH_OPTIONS)
+    _attached[handle.name] = segment
+    while len(_attached) > ATTACHED_SEGMENTS:
+        _, old = _attached.popitem(last=False)
+        try:
+            old.close()
+        except BufferError:  # still referenced by a live view: leave it mapped
+            pass
+    view = np.ndarray(handle.shape, dtype=handle.dtype, buffer=segment.buf)
+    view.flags.writeable = False
+    return view
+
+
+def attach_all(values):
+    """attach() every ArrayHandle value of a dict (the inverse of put_all)."""
+    return {key: attach(value) if isinstance(value, ArrayHandle) else value for key, value in values.items()}
+
+
+def _worker_context():
+    if "forkserver" not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("spawn")
+    context = multiprocessing.get_context("forkserver")
+    context.set_forkserver_preload(WORKER_PRELOAD)
+    return context
+
+
+_pool = None  # (n_jobs, ProcessPoolExecutor) of map_segments, kept warm between calls
+_pool_lock = threading.Lock()
+
+
+def _worker_pool(n_jobs):
+    global _pool
+    with _pool_lock:
+        if _pool is not None and _pool[0] != n_jobs:
+            _pool[1].shutdown(wait=False)
+            _pool = None
+        if _pool is None:
+            _pool = (n_jobs, ProcessPoolExecutor(max_workers=n_jobs, mp_context=_worker_context()))
+        return _pool[1]
+
+
+def _discard_pool(pool):
+    global _pool
+    with _pool_lock:
+        if _pool is not None and _pool[1] is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _run_segments(function, handle, sr, segments):
+    return function(attach(handle), sr, segments)
+
+
+def map_segments(function, y, sr, segments, n_jobs=1):
+    """
+    function(y, sr, segments) -> one result per segment, run over batches of segments in
+    n_jobs worker processes that read y from shared memory. function must be picklable
+    (a module-level function or a functools.partial of one). Runs in this process with
+    n_jobs == 1, for few segments, and in low-memory mode (where y may be a memory map
+    that a shared copy would pull into RAM). The worker pool is kept for later calls
+    with the same n_jobs. Returns the results in segment order.
+    """
+    if n_jobs == -1:
+        n_jobs = os.cpu_count() or 1
+    segments = list(segments)
+    if n_jobs <= 1 or len(segments) < MIN_PARALLEL_SEGMENTS or audio_io.low_memory():
+        return list(function(y, sr, segments))
+
+    size = -(-len(segments) // (n_jobs * BATCHES_PER_JOB))
+    batches = [segments[first:first + size] for first in range(0, len(segments), size)]
+    with SharedArrayStore() as store:
+        handle = store.put(y)
+        pool = _worker_pool(n_jobs)
+        try:
+            results = pool.map(_run_segments, [function] * len(batches), [handle] * len(batches),
+                               [sr] * len(batches), batches)
+            return [result for batch in results for result in batch]
+        except BrokenProcessPool:
+            _discard_pool(pool)  # a worker died; the next call starts a new pool
+            raise
@@ -0,0 +1,395 @@
+"""
+Persistent on-disk similarity index for cross-file segment deduplication.
+
+The index lives in a directory and stores one L2-normalised float32 feature
+vector per exported segment, together with the source file and segment times
+it came from. Vectors are appended to a raw matrix that is memory-mapped for
+queries, so the library never has to fit in RAM. Cosine similarity is a plain
+dot product on the normalised vectors. Records are read on demand through an
+offset table and rows are mapped to their source through a per-row id file, so
+opening the index and streaming it (iter_batches, cluster_corpus) takes memory
+independent of the number of segments; only the source names are held.
+
+Layout of an index directory:
+    meta.json        dimension and (optional) approximate-search settings
+    vectors.f32      row-major float32 matrix, one row per segment
+    records.jsonl    one JSON record per row: source file, start, end (the commit point of an insert)
+    records.idx      int64 byte offset of each row's record in records.jsonl
+    sources.jsonl    one source file name per line; its line number is its source id
+    source_ids.i32   source id of each row
+    active.u8        1 for live rows, 0 for rows replaced by a re-index
+    ivf_centroids.npy / ivf_lists.i32   coarse quantiser for approximate mode
+"""
+
+import json
+import os
+import numpy as np
+
+# Above this many vectors queries switch to the approximate (IVF) mode when it has been built
+# (build_approximate can record another threshold for an index)
+APPROXIMATE_THRESHOLD = 1_000_000
+N_PROBE = 8  # IVF lists scanned per approximate query, unless the index records another value
+READ_BLOCK = 1 << 20  # bytes read at a time when scanning records.jsonl
+
+
+def normalize_vectors(vectors):
+    """Return float32 copies of the vectors scaled to unit length."""
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _write_json_atomic(path, data):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+class SimilarityIndex:
+    def __init__(self, path, dim=None):
+        """
+        Open (or create) the index stored in directory `path`.
+        `dim` is only required when creating a new index; it is inferred from the
+        first batch of vectors otherwise.
+        """
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._meta_path = os.path.join(path, "meta.json")
+        self._vectors_path = os.path.join(path, "vectors.f32")
+        self._records_path = os.path.join(path, "records.jsonl")
+        self._active_path = os.path.join(path, "active.u8")
+        self._offsets_path = os.path.join(path, "records.idx")
+        self._source_names_path = os.path.join(path, "sources.jsonl")
+        self._source_ids_path = os.path.join(path, "source_ids.i32")
+        self._centroids_path = os.path.join(path, "ivf_centroids.npy")
+        self._lists_path = os.path.join(path, "ivf_lists.i32")
+
+        if os.path.exists(self._meta_path):
+            with open(self._meta_path) as f:
+                self.meta = json.load(f)
+        else:
+            self.meta = {"dim": dim, "ivf_lists": 0}
+            _write_json_atomic(self._meta_path, self.meta)
+        if dim is not None and self.meta["dim"] not in (None, dim):
+            raise ValueError(f"Index at {path} has dimension {self.meta['dim']}, not {dim}")
+
+        self._n = self._count_records()
+        self._recover()
+        self._load_sources()
+
+        self._centroids = None
+        self._ivf_order = None
+        if self.meta.get("ivf_lists") and os.path.exists(self._centroids_path):
+            self._centroids = np.load(self._centroids_path)
+
+    @property
+    def dim(self):
+        return self.meta["dim"]
+
+    def __len__(self):
+        return self._n
+
+    def _count_records(self):
+        """Number of complete lines in records.jsonl; a line cut short by a crash is truncated."""
+        if not os.path.exists(self._records_path):
+            return 0
+        n = complete = position = 0
+        with open(self._records_path, "rb") as f:
+            for block in iter(lambda: f.read(READ_BLOCK), b""):
+                n += block.count(b"\n")
+                if b"\n" in block:
+                    complete = position + block.rindex(b"\n") + 1
+                position += len(block)
+        if complete < position:
+            with open(self._records_path, "r+b") as f:
+                f.truncate(complete)
+        return n
+
+    def _scan_records(self, first_row=0, start=0):
+        """Yield (row, byte offset, record line) from records.jsonl, from `start` (the offset of first_row)."""
+        with open(self._records_path, "rb") as f:
+            f.seek(start)
+            row, offset = first_row, start
+            for line in f:
+                yield row, offset, line
+                row, offset = row + 1, offset + len(line)
+
+    def _recover(self):
+        """
+        Trim data files to the record count, undoing any insert interrupted midway, and
+        complete the offset table (missing for indexes written before it existed).
+        """
+        n = self._n
+        row_files = ((self._vectors_path, (self.dim or 0) * 4), (self._active_path, 1), (self._lists_path, 4),
+                     (self._source_ids_path, 4), (self._offsets_path, 8))
+        for path, row_bytes in row_files:
+            if os.path.exists(path) and os.path.getsize(path) > n * row_bytes:
+                with open(path, "r+b") as f:
+                    f.truncate(n * row_bytes)
+        indexed = os.path.getsize(self._offsets_path) // 8 if os.path.exists(self._offsets_path) else 0
+        if indexed < n:
+            start = int(np.memmap(self._offsets_path, dtype=np.int64, mode="r")[-1]) if indexed else 0
+            if indexed:  # the offset of the next row: skip the last indexed record
+                with open(self._records_path, "rb") as f:
+                    f.seek(start)
+                    start += len(f.readline())
+            with open(self._offsets_path, "ab") as f:
+                block = []
+                for _, offset, _ in self._scan_records(indexed, start):
+                    block.append(offset)
+                    if len(block) == 65536:
+                        f.write(np.asarray(block, dtype=np.int64).tobytes())
+                        block = []
+                f.write(np.asarray(block, dtype=np.int64).tobytes())
+
+    def _load_sources(self):
+        """Read the source names; build the source table from the records if the index predates it."""
+        self._source_names = []
+        if os.path.exists(self._source_names_path):
+            with open(self._source_names_path, "r+b") as f:
+                lines = f.read().split(b"\n")
+                if lines[-1]:  # a name cut short by a crash; no row refers to it yet
+                    f.truncate(f.tell() - len(lines[-1]))
+            self._source_names = [json.loads(line) for line in lines[:-1]]
+        self._source_ids = {name: i for i, name in enumerate(self._source_names)}
+        have = os.path.getsize(self._source_ids_path) // 4 if os.path.exists(self._source_ids_path) else 0
+        if have == self._n:
+            return
+        # Rows without a source id (old index layout): assign them from their records
+        first_offset = int(np.memmap(self._offsets_path, dtype=np.int64, mode="r")[have]) if self._n else 0
+        ids = []
+        for _, _, line in self._scan_records(have, first_offset):
+            ids.append(self._source_id(json.loads(line)["source"]))
+        with open(self._source_ids_path, "ab") as f:
+            f.write(np.asarray(ids, dtype=np.int32).tobytes())
+
+    def _source_id(self, source, create=True):
+        """Id of a source name, appended to the source table if new (None if not there and create is False)."""
+        if source not in self._source_ids and create:
+            with open(self._source_names_path, "a") as f:
+                f.write(json.dumps(source) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self._source_ids[source] = len(self._source_names)
+            self._source_names.append(source)
+        return self._source_ids.get(source)
+
+    def record(self, row):
+        """The record (source, start, end) of a row, read from disk."""
+        offset = int(np.memmap(self._offsets_path, dtype=np.int64, mode="r", shape=(self._n,))[row])
+        with open(self._records_path, "rb") as f:
+            f.seek(offset)
+            return json.loads(f.readline())
+
+    def source_rows(self, source, block_size=1 << 20):
+        """Rows indexed for `source` (live or replaced), found by scanning the source id file."""
+        source_id = self._source_id(source, create=False)
+        if source_id is None or self._n == 0:
+            return np.zeros(0, dtype=np.int64)
+        ids = np.memmap(self._source_ids_path, dtype=np.int32, mode="r", shape=(self._n,))
+        return np.concatenate([block_start + np.flatnonzero(ids[block_start:block_start + block_size] == source_id)
+                               for block_start in range(0, self._n, block_size)])
+
+    def _vectors(self):
+        if not self._n:
+            return np.zeros((0, self.dim or 0), dtype=np.float32)
+        return np.memmap(self._vectors_path, dtype=np.float32, mode="r", shape=(self._n, self.dim))
+
+    def _active(self):
+        if not self._n:
+            return np.zeros(0, dtype=bool)
+        return np.fromfile(self._active_path, dtype=np.uint8).astype(bool)
+
+    def iter_batches(self, batch_size=10000):
+        """
+        Stream the live vectors in row order as (rows, vectors) batches read from the
+        memory-mapped matrix, so whole-library passes run in constant memory.
+        """
+        if not self._n:
+            return
+        vectors = self._vectors()
+        active = np.memmap(self._active_path, dtype=np.uint8, mode="r", shape=(self._n,))
+        for block_start in range(0, self._n, batch_size):
+            block_end = min(block_start + batch_size, self._n)
+            rows = block_start + np.flatnonzero(active[block_start:block_end])
+            if len(rows) > 0:
+                yield rows, np.asarray(vectors[rows[0]:rows[-1] + 1])[rows - rows[0]]
+
+    def remove_source(self, source):
+        """Deactivate every row belonging to `source`. Returns the number of rows that were live."""
+        rows = self.source_rows(source)
+        if not len(rows):
+            return 0
+        active = np.memmap(self._active_path, dtype=np.uint8, mode="r+", shape=(self._n,))
+        live = int(np.count_nonzero(active[rows]))
+        active[rows] = 0
+        active.flush()
+        del active
+        return live
+
+    def add(self, source, segments, vectors):
+        """
+        Batch insert the feature vectors of `segments` (list of (start, end)) from `source`.
+        Any rows previously indexed for the same source are replaced.
+        """
+        if len(segments) == 0:
+            self.remove_source(source)
+            return
+        vectors = normalize_vectors(vectors)
+        if len(vectors) != len(segments):
+            raise ValueError("Need one feature vector per segment")
+        if self.meta["dim"] is None:
+            self.meta["dim"] = int(vectors.shape[1])
+            _write_json_atomic(self._meta_path, self.meta)
+        elif vectors.shape[1] != self.dim:
+            raise ValueError(f"Expected {self.dim}-dimensional vectors, got {vectors.shape[1]}")
+
+        self.remove_source(source)
+        source_id = self._source_id(source)
+        new_records = [{"source": source, "start": float(start), "end": float(end)} for start, end in segments]
+
+        # Vector data is written before the records, so a crash leaves rows that _recover() trims
+        with open(self._vectors_path, "ab") as f:
+            f.write(vectors.tobytes())
+        with open(self._active_path, "ab") as f:
+            f.write(b"\x01" * len(vectors))
+        if self._centroids is not None:
+            with open(self._lists_path, "ab") as f:
+                f.write(self._assign_lists(vectors).astype(np.int32).tobytes())
+            self._ivf_order = None
+        with open(self._source_ids_path, "ab") as f:
+            f.write(np.full(len(vectors), source_id, dtype=np.int32).tobytes())
+        lines = [(json.dumps(record) + "\n").encode() for record in new_records]
+        with open(self._records_path, "ab") as f:
+            start = f.tell()
+            f.write(b"".join(lines))
+            f.flush()
+            os.fsync(f.fileno())
+        with open(self._offsets_path, "ab") as f:
+            f.write((start + np.cumsum([0] + [len(line) for line in lines[:-1]])).astype(np.int64).tobytes())
+        self._n += len(new_records)
+
+    def build_approximate(self, n_lists=None, above=APPROXIMATE_THRESHOLD, n_probe=N_PROBE, sample_size=100000,
+                          block_size=65536):
+        """
+        Train the coarse quantiser used by approximate queries (IVF: inverted lists
+        over k-means cells). Rows added later are assigned to lists on insert.
+        Queries use it from then on whenever the index holds more than `above` rows,
+        scanning `n_probe` lists each; both are saved with the index.
+        """
+        from sklearn.cluster import MiniBatchKMeans
+
+        n = self._n
+        if n == 0:
+            return
+        if n_lists is None:
+            n_lists = max(1, int(np.sqrt(n)))
+        vectors = self._vectors()
+        rng = np.random.default_rng(42)
+        sample = np.sort(rng.choice(n, size=min(sample_size, n), replace=False))
+        kmeans = MiniBatchKMeans(n_clusters=min(n_lists, len(sample)), random_state=42, n_init=3)
+        kmeans.fit(np.asarray(vectors[sample]))
+        self._centroids = normalize_vectors(kmeans.cluster_centers_)
+        np.save(self._centroids_path, self._centroids)
+
+        with open(self._lists_path, "wb") as f:
+            for block_start in range(0, n, block_size):
+                block = np.asarray(vectors[block_start:block_start + block_size])
+                f.write(self._assign_lists(block).astype(np.int32).tobytes())
+        self._ivf_order = None
+        self.meta.update(ivf_lists=len(self._centroids), approximate_above=int(above), n_probe=int(n_probe))
+        _write_json_atomic(self._meta_path, self.meta)
+
+    def _assign_lists(self, vectors):
+        return np.argmax(vectors @ self._centroids.T, axis=1)
+
+    def _inverted_lists(self):
+        if self._ivf_order is None:
+            lists = np.fromfile(self._lists_path, dtype=np.int32)
+            self._ivf_order = np.argsort(lists, kind="stable")
+            self._ivf_offsets = np.searchsorted(lists[self._ivf_order], np.arange(len(self._centroids) + 1))
+        return self._ivf_order, self._ivf_offsets
+
+    def _row_mask(self, exclude_source=None):
+        mask = self._active()
+        if exclude_source is not None:
+            mask[self.source_rows(exclude_source)] = False
+        return mask
+
+    def search(self, vectors, k=1, exclude_source=None, approximate=None, n_probe=None, block_size=16384):
+        """
+        Find the k most similar indexed segments for each query vector.
+        Returns (similarities, rows), both shaped (n_queries, k); missing entries have row -1.
+        Exact search scans the memory-mapped matrix block by block. Approximate search only
+        scans the `n_probe` closest IVF lists and is used automatically once build_approximate
+        has run and the index holds more rows than the threshold it recorded.
+        """
+        queries = normalize_vectors(vectors)
+        n_queries = len(queries)
+        best_sims = np.full((n_queries, k), -np.inf, dtype=np.float32)
+        best_rows = np.full((n_queries, k), -1, dtype=np.int64)
+        if not self._n or n_queries == 0:
+            return best_sims, best_rows
+
+        if approximate is None:
+            approximate = (self._centroids is not None
+                           and self._n > self.meta.get("approximate_above", APPROXIMATE_THRESHOLD))
+        if approximate and self._centroids is None:
+            raise ValueError("Approximate search needs build_approximate() to be run first")
+
+        vectors = self._vectors()
+        mask = self._row_mask(exclude_source)
+
+        def merge(query_ids, sims, rows):
+            if sims.shape[1] > k:
+                top = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+                sims, rows = np.take_along_axis(sims, top, axis=1), rows[top]
+            else:
+                rows = np.broadcast_to(rows, sims.shape)
+            all_sims = np.concatenate([best_sims[query_ids], sims], axis=1)
+            all_rows = np.concatenate([best_rows[query_ids], rows], axis=1)
+            top = np.argsort(-all_sims, axis=1)[:, :k]
+            best_sims[query_ids] = np.take_along_axis(all_sims, top, axis=1)
+            best_rows[query_ids] = np.take_along_axis(all_rows, top, axis=1)
+
+        if not approximate:
+            all_queries = np.arange(n_queries)
+            for block_start in range(0, self._n, block_size):
+                rows = np.arange(block_start, min(block_start + block_size, self._n))
+                rows = rows[mask[rows]]
+                if len(rows) == 0:
+                    continue
+                block = np.asarray(vectors[rows[0]:rows[-1] + 1])[rows - rows[0]]
+                merge(all_queries, queries @ block.T, rows)
+        else:
+            order, offsets = self._inverted_lists()
+            if n_probe is None:
+                n_probe = self.meta.get("n_probe", N_PROBE)
+            probes = np.argsort(-(queries @ self._centroids.T), axis=1)[:, :n_probe]
+            for q in range(n_queries):
+                rows = np.sort(np.concatenate([order[offsets[cell]:offsets[cell + 1]] for cell in probes[q]]))
+                rows = rows[mask[rows]]
+                if len(rows) > 0:
+                    merge(np.array([q]), queries[q:q + 1] @ np.asarray(vectors[rows]).T, rows)
+
+        best_rows[~np.isfinite(best_sims)] = -1
+        return best_sims, best_rows
+
+    def query_threshold(self, vectors, threshold, exclude_source=None, **search_kwargs):
+        """
+        Return, per query, the list of (record, similarity) pairs above `threshold`
+        (at most `k` per query, default 10).
+        """
+        search_kwargs.setdefault("k", 10)
+        sims, rows = self.search(vectors, exclude_source=exclude_source, **search_kwargs)
+        return [
+            [(self.record(row), float(sim)) for sim, row in zip(query_sims, query_rows) if row >= 0 and sim > threshold]
+            for query_sims, query_rows in zip(sims, rows)
+        ]
+
+    def contains_similar(self, vectors, threshold, exclude_source=None, **search_kwargs):
+        """Boolean array: True where a query already has a match above `threshold` in the library."""
+        sims, rows = self.search(vectors, k=1, exclude_source=exclude_source, **search_kwargs)
+        return (rows[:, 0] >= 0) & (sims[:, 0] > threshold)
@@ -1,19 +1,30 @@
 from PyQt5.QtWidgets import (
-    QApplication, QMainWindow, QVBoxLayout, QPushButton, QSlider, QLabel, QFileDialog, QWidget, QListWidget, QComboBox, QLineEdit, QHBoxLayout
+    QApplication, QMainWindow, QVBoxLayout, QPushButton, QSlider, QLabel, QFileDialog, QWidget, QComboBox, QLineEdit, QHBoxLayout,
+    QCheckBox, QPlainTextEdit, QTableView, QAbstractItemView, QHeaderView
 )
 from PyQt5.QtCore import Qt, QTimer
 import sys
+import os
+import logging
 from feature_detection import detect_features
-from segmentation import segment_audio, segment_by_beats, segment_by_transients, segment_by_frequency, segment_by_onsets
-from visualization import plot_features, simplified_waveform_with_segments, WaveformVisualizer
+from segmentation import (
+    segment_by_method, filter_similar_segments, segment_feature_vectors, SEGMENTATION_METHODS, METHOD_DETECTORS
+)
+from shared_arrays import map_segments
 from utils import chop_audio_with_metadata
-from clustering import cluster_segments, cluster_segments_kmeans
-import matplotlib.pyplot as plt
+from similarity_index import SimilarityIndex
+from fingerprint import remove_duplicate_segments
+from instrumentation import add_sink, remove_sink, CallbackSink, timed, stage
+from clustering import ClusterModel
 import numpy as np
-import librosa
-from pydub import AudioSegment
-from pydub.playback import play
+import audio_io
 from audio_player import AudioPlayer
+from segment_model import SegmentTableModel, NUMBER, CLUSTER
+
+# Library-wide index of exported segments, used to skip cross-file duplicates on save
+LIBRARY_INDEX_PATH = os.path.join(os.path.expanduser("~"), ".audio_segmentation", "library_index")
+
+logger = logging.getLogger(__name__)
 
 
 class AudioSegmentationApp(QMainWindow):
@@ -54,10 +65,34 @@ class AudioSegmentationApp(QMainWindow):
         self.auto_segments = []  # For automatic segmentation
         self.manual_segments = []  # For manual segmentation
         self.segments = []  # Current active segments
-        self.visualizer = WaveformVisualizer()  # Create visualizer instance
+        self.cluster_model = None  # Loaded model; clusters are assigned instead of fitted
+        self.fitted_cluster_model = None  # Model from the last clustering run, for saving
+        # Worker processes for the per-segment feature loops (they read the signal from shared memory)
+        self.n_jobs = max(1, (os.cpu_count() or 1) - 1)
+        # The matplotlib waveform view is built right after the window first shows (see init_visualizer)
+        self.visualizer = None
         self.audio_player = AudioPlayer()
         
         self.initUI()
+        QTimer.singleShot(0, self.init_visualizer)
+
+    def init_visualizer(self):
+        """Create the waveform/spectrogram view; importing matplotlib is the slow part of startup"""
+        if self.visualizer is not None:
+            return
+        from visualization import WaveformVisualizer
+        self.visualizer = WaveformVisualizer()
+        self.viz_controls_layout.addWidget(self.visualizer.toolbar)
+        self.viz_layout.addWidget(self.visualizer.canvas)
+        self.visualizer.canvas.mpl_connect('button_press_event', self.select_clicked_segment)
+
+    def select_clicked_segment(self, event):
+        """Right click on the waveform or spectrogram selects the segment under the cursor"""
+        if event.button != 3 or event.inaxes not in [self.visualizer.ax_wave, self.visualizer.ax_spec]:
+            return
+        segment_index = self.visualizer.segment_at(event.xdata)
+        if segment_index is not None and segment_index < len(self.segments):
+            self.segment_view.selectRow(self.segment_model.row_of(segment_index))
 
     def initUI(self):
         # Create main widget and layout
@@ -113,12 +148,7 @@ class AudioSegmentationApp(QMainWindow):
         self.method_label = QLabel("Select segmentation method")
         controls_layout.addWidget(self.method_label)
         self.method_combo = QComboBox()
-        self.method_combo.addItems([
-            "By Beats", 
-            "By Transients", 
-            "By Frequency Range",
-            "By Onsets"
-        ])
+        self.method_combo.addItems(SEGMENTATION_METHODS)
         controls_layout.addWidget(self.method_combo)
 
         # 3. Segmentation Parameters
@@ -232,14 +262,48 @@ class AudioSegmentationApp(QMainWindow):
         self.save_button.setStyleSheet(black_button_style)
         self.clear_button.setStyleSheet(black_button_style)
         
+        # Cross-file deduplication against previously exported segments
+        self.library_checkbox = QCheckBox("Skip segments already in library")
+        controls_layout.addWidget(self.library_checkbox)
+
         controls_layout.addWidget(self.segment_button)
         controls_layout.addWidget(self.cluster_button)
         controls_layout.addWidget(self.save_button)
         controls_layout.addWidget(self.clear_button)
 
-        # 5. Segment List
-        self.cluster_list = QListWidget()
-        controls_layout.addWidget(self.cluster_list)
+        # Cluster model persistence
+        model_layout = QHBoxLayout()
+        self.save_model_button = QPushButton("Save cluster model")
+        self.load_model_button = QPushButton("Load cluster model")
+        self.save_model_button.setStyleSheet(black_button_style)
+        self.load_model_button.setStyleSheet(black_button_style)
+        model_layout.addWidget(self.save_model_button)
+        model_layout.addWidget(self.load_model_button)
+        controls_layout.addLayout(model_layout)
+
+        # 5. Segment List: a table view over the segment arrays that only draws visible rows
+        self.segment_model = SegmentTableModel(self)
+        self.segment_view = QTableView()
+        self.segment_view.setModel(self.segment_model)
+        self.segment_view.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.segment_view.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.segment_view.setSortingEnabled(True)
+        self.segment_view.verticalHeader().hide()
+        # Fixed row heights keep the view from measuring every row
+        self.segment_view.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.segment_view.verticalHeader().setDefaultSectionSize(self.segment_view.fontMetrics().height() + 6)
+        self.segment_view.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        controls_layout.addWidget(self.segment_view)
+
+        # Stage timings panel, only collected while enabled
+        self.timings_checkbox = QCheckBox("Show stage timings")
+        self.timings_panel = QPlainTextEdit()
+        self.timings_panel.setReadOnly(True)
+        self.timings_panel.setMaximumHeight(120)
+        self.timings_panel.setVisible(False)
+        self.timings_sink = CallbackSink(self.timings_panel.appendPlainText)
+        controls_layout.addWidget(self.timings_checkbox)
+        controls_layout.addWidget(self.timings_panel)
 
         # 6. Play Button (at the bottom)
         self.play_button = QPushButton("Play Selected Segment")
@@ -284,12 +348,12 @@ class AudioSegmentationApp(QMainWindow):
         viz_controls_layout.addWidget(reset_zoom_button)
         viz_controls_layout.addStretch()
         
-        # Add visualization toolbar
-        viz_controls_layout.addWidget(self.visualizer.toolbar)
+        # Visualization toolbar and canvas are added by init_visualizer
+        self.viz_controls_layout = viz_controls_layout
+        self.viz_layout = viz_layout
         
-        # Add controls and canvas to viz container
+        # Add controls to viz container
         viz_layout.addLayout(viz_controls_layout)
-        viz_layout.addWidget(self.visualizer.canvas)
         
         viz_container.setLayout(viz_layout)
         
@@ -311,6 +375,9 @@ class AudioSegmentationApp(QMainWindow):
         self.cluster_button.clicked.connect(self.cluster_segments)
         self.save_button.clicked.connect(self.save_segments)
         self.clear_button.clicked.connect(self.clear_segments)
+        self.save_model_button.clicked.connect(self.save_cluster_model)
+        self.load_model_button.clicked.connect(self.load_cluster_model)
+        self.timings_checkbox.toggled.connect(self.toggle_timings)
         
         # Connect zoom buttons
         zoom_in_button.clicked.connect(self.zoom_in)
@@ -320,8 +387,9 @@ class AudioSegmentationApp(QMainWindow):
     def load_audio(self):
         self.audio_file, _ = QFileDialog.getOpenFileName(self, "Open Audio File", "", "Audio Files (*.wav)")
         if self.audio_file:
-            print(f"Loaded audio file: {self.audio_file}")
+            logger.info(f"Loaded audio file: {self.audio_file}")
             self.segments = []
+            self.init_visualizer()
             self.visualizer.plot_waveform(self.audio_file)  # Initial visualization
 
     def update_threshold(self):
@@ -357,122 +425,98 @@ class AudioSegmentationApp(QMainWindow):
         value = self.similarity_slider.value() / 100
         self.similarity_label.setText(f"Similarity Threshold: {value:.2f}")
 
+    def toggle_timings(self, checked):
+        """Collect per-stage timings into the panel while the checkbox is on"""
+        self.timings_panel.setVisible(checked)
+        if checked:
+            add_sink(self.timings_sink)
+        else:
+            remove_sink(self.timings_sink)
+
+    @timed("segment_audio")
     def segment_audio(self):
         if not hasattr(self, "audio_file"):
-            print("\n[ERROR] No audio file loaded!")
+            logger.error("No audio file loaded!")
             return
 
-        print("\n" + "="*50)
-        print("STARTING AUDIO SEGMENTATION PROCESS")
-        print("="*50)
+        logger.info("="*50)
+        logger.info("STARTING AUDIO SEGMENTATION PROCESS")
+        logger.info("="*50)
 
-        print("\n[1/4] Detecting audio features...")
-        self.features = detect_features(self.audio_file)
-        print(f"✓ Features extracted successfully")
+        selected_method = self.method_combo.currentText()
+        logger.info("[1/4] Detecting audio features...")
+        # Only what the selected method reads
+        self.features = detect_features(self.audio_file, detectors=METHOD_DETECTORS.get(selected_method))
+        logger.info(f"✓ Features extracted successfully")
 
         # Get time constraints
         try:
             min_time = float(self.min_time_input.text() or "0.1")
             max_time = float(self.max_time_input.text() or "30.0")
             if min_time < 0 or max_time < 0 or min_time >= max_time:
-                print("\n[WARNING] Invalid time constraints, using defaults")
+                logger.warning("Invalid time constraints, using defaults")
                 min_time = 0.1
                 max_time = 30.0
         except ValueError:
-            print("\n[WARNING] Invalid time constraints, using defaults")
+            logger.warning("Invalid time constraints, using defaults")
             min_time = 0.1
             max_time = 30.0
 
         manual_segment_count = self.manual_segments_input.text()
-        selected_method = self.method_combo.currentText()
         similarity_threshold = self.similarity_slider.value() / 100
-        print(f"\n[2/4] Using segmentation method: {selected_method}")
-        print(f"Time constraints: {min_time:.2f}s - {max_time:.2f}s")
-        print(f"Similarity threshold: {similarity_threshold:.2f}")
+        logger.info(f"[2/4] Using segmentation method: {selected_method}")
+        logger.info(f"Time constraints: {min_time:.2f}s - {max_time:.2f}s")
+        logger.info(f"Similarity threshold: {similarity_threshold:.2f}")
 
         # Generate all possible segments based on method
-        if selected_method == "By Beats":
-            all_segments = segment_by_beats(self.features, min_segment_length=min_time)
-        elif selected_method == "By Transients":
-            all_segments = segment_by_transients(self.features, min_segment_length=min_time)
-        elif selected_method == "By Frequency Range":
-            min_freq = self.min_freq_slider.value()
-            max_freq = self.max_freq_slider.value()
-            print(f"└── Frequency range: {min_freq}Hz - {max_freq}Hz")
-            all_segments = segment_by_frequency(self.features, min_freq=min_freq, max_freq=max_freq, min_segment_length=min_time)
+        if selected_method == "By Frequency Range":
+            logger.info(f"└── Frequency range: {self.min_freq_slider.value()}Hz - {self.max_freq_slider.value()}Hz")
         elif selected_method == "By Onsets":
-            print("└── Using onset detection...")
-            all_segments = segment_by_onsets(self.features, min_segment_length=min_time)
-        else:
-            print("\n[ERROR] Unknown segmentation method")
+            logger.info("└── Using onset detection...")
+        try:
+            all_segments = segment_by_method(self.features, selected_method, min_segment_length=min_time,
+                                             min_freq=self.min_freq_slider.value(),
+                                             max_freq=self.max_freq_slider.value())
+        except ValueError:
+            logger.error("Unknown segmentation method")
             return
 
         # Filter segments by time constraints
         all_segments = [(start, end) for start, end in all_segments if min_time <= (end - start) <= max_time]
 
         if not all_segments:
-            print("\n[ERROR] No segments found within time constraints!")
+            logger.error("No segments found within time constraints!")
             return
 
-        print(f"\n[3/4] Found {len(all_segments)} segments within time constraints")
-        print("Filtering similar segments...")
+        logger.info(f"[3/4] Found {len(all_segments)} segments within time constraints")
+        logger.info("Removing exact repeats by fingerprint...")
+        with stage("load_audio"):
+            y_full, sr_full = audio_io.load_signal(self.audio_file)
+        all_segments, duplicate_groups = remove_duplicate_segments(y_full, sr_full, all_segments)
+        logger.info(f"└── {len(duplicate_groups)} duplicate groups, {len(all_segments)} segments left")
+        logger.info("Filtering similar segments...")
 
         # Filter out similar segments
-        unique_segments = []
-        segment_features = []
-
-        for start, end in all_segments:
-            # Extract features for the current segment
-            y, sr = librosa.load(self.audio_file, offset=start, duration=end-start)
-            if len(y) > 0:
-                # Extract multiple features for better similarity comparison
-                mfcc = librosa.feature.mfcc(y=y, sr=sr).mean(axis=1)
-                chroma = librosa.feature.chroma_stft(y=y, sr=sr).mean(axis=1)
-                spectral = librosa.feature.spectral_contrast(y=y, sr=sr).mean(axis=1)
-                current_features = np.concatenate([mfcc, chroma, spectral])
-
-                # Check similarity with already selected segments
-                is_unique = True
-                for idx, existing_features in enumerate(segment_features):
-                    similarity = np.dot(current_features, existing_features) / \
-                               (np.linalg.norm(current_features) * np.linalg.norm(existing_features))
-                    
-                    if similarity > similarity_threshold:
-                        is_unique = False
-                        # If this segment has more distinct features, replace the existing one
-                        feature_variance = np.var(current_features)
-                        existing_variance = np.var(existing_features)
-                        if feature_variance > existing_variance:
-                            unique_segments[idx] = (start, end)
-                            segment_features[idx] = current_features
-                            print(f"└── Replaced similar segment with more unique variant")
-                        break
-
-                if is_unique:
-                    unique_segments.append((start, end))
-                    segment_features.append(current_features)
+        unique_segments, _ = filter_similar_segments(y_full, sr_full, all_segments, similarity_threshold,
+                                                     n_jobs=self.n_jobs)
 
         # Update segments and visualization
-        print("\n[4/4] Finalizing:")
-        print(f"└── Filtered from {len(all_segments)} to {len(unique_segments)} unique segments")
+        logger.info("[4/4] Finalizing:")
+        logger.info(f"└── Filtered from {len(all_segments)} to {len(unique_segments)} unique segments")
         self.segments = unique_segments
         # Clear any previous clustering
         self.cluster_labels = None
         
-        self.visualizer.plot_waveform(self.audio_file, self.segments)
-        self.cluster_list.clear()
-        for i, segment in enumerate(self.segments):
-            duration = segment[1] - segment[0]
-            self.cluster_list.addItem(
-                f"Segment {i + 1}: {segment[0]:.2f}s - {segment[1]:.2f}s (duration: {duration:.2f}s)"
-            )
-        print("\n✓ Segmentation process completed successfully!")
-        print("="*50)
+        with stage("update_view"):
+            self.visualizer.set_segments(self.segments)
+            self.show_segments()
+        logger.info("✓ Segmentation process completed successfully!")
+        logger.info("="*50)
 
     def toggle_manual_mode(self):
         """Toggle manual segmentation mode"""
         if not hasattr(self, "audio_file"):
-            print("No audio file loaded!")
+            logger.info("No audio file loaded!")
             self.manual_button.setChecked(False)
             return
         
@@ -480,12 +524,12 @@ class AudioSegmentationApp(QMainWindow):
             # Enable manual mode
             self.manual_button.setStyleSheet("background-color: #FF4444; color: white;")
             self.visualizer.enable_manual_mode(self.manual_segment_click)
-            print("Manual segmentation mode enabled. Click to add segment boundaries.")
+            logger.info("Manual segmentation mode enabled. Click to add segment boundaries.")
         else:
             # Disable manual mode
             self.manual_button.setStyleSheet("")
             self.visualizer.disable_manual_mode()
-            print("Manual segmentation mode disabled.")
+            logger.info("Manual segmentation mode disabled.")
 
     def manual_segment_click(self, event):
         """Handle clicks during manual segmentation"""
@@ -495,12 +539,14 @@ class AudioSegmentationApp(QMainWindow):
         if event.inaxes in [self.visualizer.ax_wave, self.visualizer.ax_spec]:
             time_clicked = event.xdata
             
+            if event.button == 3:  # Right click selects a segment (select_clicked_segment)
+                return
             if event.key == 'c':  # Clear last boundary
-                if self.visualizer.temp_boundaries:
-                    self.visualizer.ax_wave.lines.pop()
-                    self.visualizer.ax_spec.lines.pop()
-                    self.visualizer.temp_boundaries.pop()
-                    self.visualizer.canvas.draw()
+                if self.visualizer.remove_last_boundary() and self.manual_segments:
+                    self.manual_segments.pop()
+                    self.visualizer.remove_segment(len(self.manual_segments))
+                    if self.segments is self.manual_segments:
+                        self.show_segments()
             else:
                 # Add new boundary
                 segment_complete = self.visualizer.add_boundary(time_clicked)
@@ -510,26 +556,41 @@ class AudioSegmentationApp(QMainWindow):
                     start = self.visualizer.temp_boundaries[-2]
                     end = self.visualizer.temp_boundaries[-1]
                     self.manual_segments.append((start, end))
+                    showing_manual = self.segments is self.manual_segments
                     self.segments = self.manual_segments
                     
-                    # Update segment list
-                    self.cluster_list.addItem(
-                        f"Manual Segment {len(self.manual_segments)}: ({start:.2f}s - {end:.2f}s)"
-                    )
+                    # Update segment list and markers
+                    if showing_manual:
+                        self.segment_model.append_segment(start, end)
+                        self.visualizer.add_segment(start, end, len(self.manual_segments) - 1)
+                    else:
+                        self.show_segments()
+                        self.visualizer.set_segments(self.segments)
+
+    def show_segments(self, clusters=None, similarity=None, sort_column=NUMBER):
+        """Show self.segments in the segment table, sorted by sort_column"""
+        self.segment_model.set_segments(self.segments, clusters, similarity)
+        self.segment_view.horizontalHeader().setSortIndicator(sort_column, Qt.AscendingOrder)
+
+    def selected_segment_index(self):
+        """Index into self.segments of the selected table row, or None"""
+        rows = self.segment_view.selectionModel().selectedRows()
+        if not rows:
+            return None
+        return self.segment_model.segment_index(rows[0].row())
 
     def play_segment(self):
         """Play selected segment"""
         if not hasattr(self, "audio_file") or not self.segments:
-            print("No segments available to play!")
+            logger.info("No segments available to play!")
             return
 
-        selected_items = self.cluster_list.selectedItems()
-        if not selected_items:
-            print("No segment selected!")
+        selected_index = self.selected_segment_index()
+        if selected_index is None:
+            logger.info("No segment selected!")
             return
 
         # Get selected segment
-        selected_index = self.cluster_list.row(selected_items[0])
         start, end = self.segments[selected_index]
 
         # Update button text/style while playing
@@ -554,71 +615,92 @@ class AudioSegmentationApp(QMainWindow):
     def cluster_segments(self):
         """Group segments by similarity without removing any"""
         if not hasattr(self, "segments") or not self.segments:
-            print("No segments to cluster!")
+            logger.info("No segments to cluster!")
             return
         
         # Use the user-specified number of clusters
         n_clusters = min(self.cluster_slider.value(), len(self.segments))
         similarity_threshold = self.similarity_slider.value() / 100
         
-        print(f"\nClustering segments:")
-        print(f"└── Number of clusters: {n_clusters}")
-        print(f"└── Similarity threshold: {similarity_threshold:.2f}")
-        
-        # Extract features for all segments
-        segment_features = []
-        for start, end in self.segments:
-            y, sr = librosa.load(self.audio_file, offset=start, duration=end-start)
-            if len(y) > 0:
-                mfcc = librosa.feature.mfcc(y=y, sr=sr).mean(axis=1)
-                chroma = librosa.feature.chroma_stft(y=y, sr=sr).mean(axis=1)
-                spectral = librosa.feature.spectral_contrast(y=y, sr=sr).mean(axis=1)
-                current_features = np.concatenate([mfcc, chroma, spectral])
-                segment_features.append(current_features)
-            else:
-                segment_features.append(np.zeros_like(segment_features[0]) if segment_features else np.zeros(32))
+        logger.info(f"Clustering segments:")
+        logger.info(f"└── Number of clusters: {n_clusters}")
+        logger.info(f"└── Similarity threshold: {similarity_threshold:.2f}")
+        
+        # Extract features for all segments, from one decode of the file
+        with stage("load_audio"):
+            y, sr = audio_io.load_signal(self.audio_file)
+        segment_features = map_segments(segment_feature_vectors, y, sr, self.segments, self.n_jobs)
+        del y
+        dim = next((len(vector) for vector in segment_features if vector is not None), 0)
+        segment_features = [np.zeros(dim) if vector is None else vector for vector in segment_features]
 
         # Convert to numpy array for clustering
         features_array = np.array(segment_features)
         
-        # Perform clustering
-        from sklearn.cluster import KMeans
-        kmeans = KMeans(n_clusters=n_clusters, random_state=42)
-        self.cluster_labels = kmeans.fit_predict(features_array)
-        
-        # Update the display with cluster information
-        self.cluster_list.clear()
-        for i, segment in enumerate(self.segments):
-            duration = segment[1] - segment[0]
-            # Calculate similarity to cluster center
-            similarity = 1 - np.linalg.norm(features_array[i] - kmeans.cluster_centers_[self.cluster_labels[i]])
-            self.cluster_list.addItem(
-                f"Cluster {self.cluster_labels[i] + 1}: {segment[0]:.2f}s - {segment[1]:.2f}s "
-                f"(duration: {duration:.2f}s, similarity: {similarity:.2f})"
-            )
-        
-        print(f"✓ Successfully organized into {n_clusters} groups")
-        print(f"└── All {len(self.segments)} segments preserved")
-        
-        # Sort the list by cluster number
-        self.cluster_list.sortItems()
+        # Perform clustering, or assign to a loaded model's existing clusters
+        if self.cluster_model is not None:
+            if self.cluster_model.feature_set != "similarity":
+                logger.error(f"Loaded cluster model uses '{self.cluster_model.feature_set}' features")
+                return
+            n_clusters = self.cluster_model.n_clusters
+            logger.info(f"└── Assigning to {n_clusters} clusters of the loaded model")
+            model = self.cluster_model
+        else:
+            model = ClusterModel.fit(features_array, n_clusters, feature_set="similarity", standardize=False)
+            self.fitted_cluster_model = model
+        features_array = model.transform(features_array)
+        self.cluster_labels = model.predict(features_array, scaled=True)
+        
+        # Update the display with cluster information and similarity to each cluster center
+        similarity = 1 - np.linalg.norm(features_array - model.centroids[self.cluster_labels], axis=1)
+        self.show_segments(self.cluster_labels, similarity, sort_column=CLUSTER)
+        
+        logger.info(f"✓ Successfully organized into {n_clusters} groups")
+        logger.info(f"└── All {len(self.segments)} segments preserved")
+
+    def save_cluster_model(self):
+        """Save the current cluster model so other files can be assigned to the same clusters"""
+        model = self.cluster_model or self.fitted_cluster_model
+        if model is None:
+            logger.info("No cluster model to save! Cluster segments first.")
+            return
+        path, _ = QFileDialog.getSaveFileName(self, "Save Cluster Model", "", "Cluster Models (*.npz)")
+        if path:
+            model.save(path)
+            logger.info(f"Saved cluster model with {model.n_clusters} clusters to {path}")
+
+    def load_cluster_model(self):
+        """Load a saved cluster model; clustering then only assigns segments to its clusters"""
+        path, _ = QFileDialog.getOpenFileName(self, "Load Cluster Model", "", "Cluster Models (*.npz)")
+        if path:
+            self.cluster_model = ClusterModel.load(path)
+            self.load_model_button.setText("Model loaded")
+            logger.info(f"Loaded cluster model with {self.cluster_model.n_clusters} clusters from {path}")
 
     def save_segments(self):
         """Save segments with or without clustering structure"""
         if not hasattr(self, "segments") or not self.segments:
-            print("No segments to save!")
+            logger.info("No segments to save!")
             return
 
+        library_index = None
+        if self.library_checkbox.isChecked():
+            library_index = SimilarityIndex(LIBRARY_INDEX_PATH)
+            logger.info(f"Checking segments against library ({len(library_index)} indexed segments)")
+        similarity_threshold = self.similarity_slider.value() / 100
+
         # Check if clustering has been performed
         if hasattr(self, "cluster_labels") and self.cluster_labels is not None:
-            print("\nSaving segments with cluster organization...")
-            print(f"└── Found {len(set(self.cluster_labels))} clusters")
-            chop_audio_with_metadata(self.audio_file, self.segments, clusters=self.cluster_labels)
-            print("✓ Segments saved in cluster folders with metadata!")
+            logger.info("Saving segments with cluster organization...")
+            logger.info(f"└── Found {len(set(self.cluster_labels))} clusters")
+            chop_audio_with_metadata(self.audio_file, self.segments, clusters=self.cluster_labels,
+                                     library_index=library_index, similarity_threshold=similarity_threshold)
+            logger.info("✓ Segments saved in cluster folders with metadata!")
         else:
-            print("\nSaving all segments in single folder...")
-            chop_audio_with_metadata(self.audio_file, self.segments)
-            print("✓ Segments saved with metadata!")
+            logger.info("Saving all segments in single folder...")
+            chop_audio_with_metadata(self.audio_file, self.segments,
+                                     library_index=library_index, similarity_threshold=similarity_threshold)
+            logger.info("✓ Segments saved with metadata!")
 
     def clear_segments(self):
         """Clear all segments and reset the visualization"""
@@ -626,7 +708,7 @@ class AudioSegmentationApp(QMainWindow):
         self.manual_segments = []
         self.segments = []
         self.cluster_labels = None  # Clear clustering information
-        self.cluster_list.clear()
+        self.segment_model.clear()
         
         # Disable manual mode if active
         if self.manual_button.isChecked():
@@ -635,18 +717,20 @@ class AudioSegmentationApp(QMainWindow):
             self.visualizer.disable_manual_mode()
         
         if hasattr(self, "audio_file"):
-            self.visualizer.plot_waveform(self.audio_file)
-            print("All segments cleared!")
+            self.visualizer.set_segments([])
+            logger.info("All segments cleared!")
         else:
-            print("No audio file loaded!")
+            logger.info("No audio file loaded!")
 
     def zoom_in(self):
         """Zoom in on both visualizations"""
-        self.visualizer.zoom(0.8)  # Zoom in by 20%
+        if self.visualizer is not None:
+            self.visualizer.zoom(0.8)  # Zoom in by 20%
 
     def zoom_out(self):
         """Zoom out on both visualizations"""
-        self.visualizer.zoom(1.25)  # Zoom out by 25%
+        if self.visualizer is not None:
+            self.visualizer.zoom(1.25)  # Zoom out by 25%
 
     def reset_zoom(self):
         """Reset zoom to show full waveform"""
@@ -1,7 +1,15 @@
-from pydub import AudioSegment
 import os
+import re
+import logging
 import librosa
 import numpy as np
+import soundfile as sf
+import audio_io
+from instrumentation import timed, count
+
+logger = logging.getLogger(__name__)
+
+EXPORTED_SEGMENT = re.compile(r"^seg(\d+)_.*\.wav$")
 
 def frequency_to_note(frequency):
     """
@@ -15,22 +23,77 @@ def frequency_to_note(frequency):
     note_index = int(round(semitones)) % 12
     return note_names[note_index]
 
-def chop_audio_with_metadata(audio_file, segments, clusters=None):
+def segment_similarity_features(y, sr):
+    """
+    Feature vector used to compare segments for similarity:
+    mean MFCC, chroma and spectral contrast of the segment.
+    """
+    mfcc = librosa.feature.mfcc(y=y, sr=sr).mean(axis=1)
+    chroma = librosa.feature.chroma_stft(y=y, sr=sr).mean(axis=1)
+    spectral = librosa.feature.spectral_contrast(y=y, sr=sr).mean(axis=1)
+    return np.concatenate([mfcc, chroma, spectral])
+
+def remove_exported_segments(output_dir):
+    """
+    Delete the segment files (and unfinished .part files) written anywhere under output_dir,
+    and the cluster folders that are left empty.
+    """
+    for folder, _, filenames in os.walk(output_dir, topdown=False):
+        for filename in filenames:
+            if EXPORTED_SEGMENT.match(filename.removesuffix(".part")):
+                os.remove(os.path.join(folder, filename))
+        if folder != output_dir and os.path.basename(folder).startswith("cluster_") and not os.listdir(folder):
+            os.rmdir(folder)
+
+@timed()
+def chop_audio_with_metadata(audio_file, segments, clusters=None, library_index=None, similarity_threshold=0.85,
+                             output_root=None, output_dir=None, done=(), on_exported=None):
     """
     Chop the audio file into segments and save them with metadata.
     If clusters is provided, organize in cluster folders, otherwise save in a single folder.
+    If library_index (a SimilarityIndex) is provided, segments that already have a match above
+    similarity_threshold anywhere in the library are skipped, and the exported ones are added to it.
+    The <name>_segmented folder is created in output_root (default: current directory),
+    or the segments go to output_dir when it is given.
+    Each file is written under a temporary name and renamed when complete, after which
+    on_exported(index) is called; segment indices in done are not written again.
+    Segments are cut through one AudioSource, so the file is never loaded whole and
+    neighbouring segments share decoded blocks.
+    Returns the output directory.
     """
-    audio = AudioSegment.from_wav(audio_file)
-    base_name = os.path.splitext(os.path.basename(audio_file))[0]
-    output_dir = f"{base_name}_segmented"
+    with audio_io.AudioSource(audio_file) as source:
+        return _export_segments(source, audio_file, segments, clusters, library_index, similarity_threshold,
+                                output_root, output_dir, set(done), on_exported)
+
+def _export_segments(source, audio_file, segments, clusters, library_index, similarity_threshold, output_root,
+                     output_dir, done, on_exported):
+    subtype = source.subtype if sf.check_format("WAV", source.subtype) else None
+    if output_dir is None:
+        base_name = os.path.splitext(os.path.basename(audio_file))[0]
+        output_dir = os.path.join(output_root or "", f"{base_name}_segmented")
     os.makedirs(output_dir, exist_ok=True)
 
+    skip = set()
+    if library_index is not None and segments:
+        y_full, sr_full = audio_io.load_signal(audio_file)
+        vectors = [segment_similarity_features(audio_io.as_float(y_full[int(start * sr_full):int(end * sr_full)]), sr_full)
+                   for start, end in segments]
+        del y_full
+        duplicates = library_index.contains_similar(vectors, similarity_threshold, exclude_source=audio_file)
+        skip = set(np.flatnonzero(duplicates))
+        if skip:
+            logger.info(f"Skipping {len(skip)} segments already present in the library")
+    if done:
+        logger.info(f"Resuming export: {len(done)} segments already written")
+
     for i, (start, end) in enumerate(segments):
-        segment = audio[start * 1000:end * 1000]
+        if i in skip or i in done:
+            continue
+        # Cut the segment sample-accurately from the native-rate, all-channel signal
+        segment, native_sr = source.read_time(start, end)
         
         # Compute frequency and note metadata
-        y, sr = librosa.load(audio_file, offset=start, duration=(end - start))
-        spectral_centroid = librosa.feature.spectral_centroid(y=y, sr=sr).mean()
+        spectral_centroid = librosa.feature.spectral_centroid(y=audio_io.to_mono(segment), sr=native_sr).mean()
         note = frequency_to_note(spectral_centroid)
         
         # Determine save location based on clustering
@@ -45,23 +108,33 @@ def chop_audio_with_metadata(audio_file, segments, clusters=None):
 
         # Create filename with metadata
         filename = f"seg{i+1}_freq{int(spectral_centroid)}_note{note}.wav"
-        segment.export(os.path.join(save_path, filename), format="wav")
+        path = os.path.join(save_path, filename)
+        sf.write(path + ".part", segment, native_sr, subtype=subtype, format="WAV")
+        os.replace(path + ".part", path)
+        if on_exported is not None:
+            on_exported(i)
         
-        # Print progress
         if clusters is not None:
-            print(f"Saved segment {i+1} in cluster {clusters[i]}")
+            logger.debug(f"Saved segment {i+1} in cluster {clusters[i]}")
         else:
-            print(f"Saved segment {i+1}")
+            logger.debug(f"Saved segment {i+1}")
+        count("exported")
+
+    if library_index is not None and segments:
+        kept = [i for i in range(len(segments)) if i not in skip]
+        library_index.add(audio_file, [segments[i] for i in kept], [vectors[i] for i in kept])
+        logger.info(f"Library index now holds {len(library_index)} segments")
 
-    total_segments = len(segments)
-    print(f"\nSuccessfully saved {total_segments} segments")
+    total_segments = len(segments) - len(skip)
+    logger.info(f"Successfully saved {total_segments} segments")
     if clusters is not None:
         num_clusters = len(set(clusters))
-        print(f"Organized into {num_clusters} clusters")
-    print(f"Output directory: {output_dir}")
+        logger.info(f"Organized into {num_clusters} clusters")
+    logger.info(f"Output directory: {output_dir}")
+    return output_dir
 
 def extract_features(segment_file):
-    y, sr = librosa.load(segment_file)
+    y, sr = audio_io.load(segment_file)
     mfccs = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=13)
     return np.mean(mfccs, axis=1)
 
@@ -76,12 +149,8 @@ def is_silent_segment(audio_file, start, end, threshold_db=-60):
     Returns:
         bool: True if segment is silent
     """
-    y, sr = librosa.load(audio_file)
-    
-    # Get segment samples
-    start_sample = int(start * sr)
-    end_sample = int(end * sr)
-    segment = y[start_sample:end_sample]
+    # Only decode the segment itself rather than the whole file
+    segment, sr = audio_io.load(audio_file, offset=start, duration=end - start)
     
     if len(segment) == 0:
         return True
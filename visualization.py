@@ -1,12 +1,55 @@
-import librosa.display
-import matplotlib.pyplot as plt
 import numpy as np
 import librosa
+import audio_io
+from interval_index import IntervalIndex
 from matplotlib.figure import Figure
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 
+OVERVIEW_SECONDS = 300  # longer files (and all files in low-memory mode) are drawn from a streamed overview
+OVERVIEW_POINTS = 4000  # columns of the overview waveform envelope and spectrogram
+OVERVIEW_HOP = 512
+MAX_SEGMENT_LABELS = 200  # segment numbers are only drawn when at most this many segments are in view
+
+def use_overview(audio_file):
+    """Whether plot_waveform should draw a streamed overview instead of loading the whole file."""
+    try:
+        info = audio_io.native_info(audio_file)
+    except RuntimeError:  # not readable by soundfile: only the full load works
+        return False
+    return audio_io.low_memory() or info.frames > OVERVIEW_SECONDS * info.samplerate
+
+def waveform_overview(audio_file, n_points=OVERVIEW_POINTS, n_mels=128, fmax=8000):
+    """
+    Min/max waveform envelope and a column-averaged mel spectrogram of a whole file at
+    n_points columns, computed block by block through an AudioSource so memory does not
+    grow with the file. Returns (times, lower, upper, S_db, sr); times are column starts.
+    """
+    lower, upper, columns = [], [], []
+    with audio_io.AudioSource(audio_file) as source:
+        sr = source.samplerate
+        bucket = max(1, -(-source.frames // n_points))  # samples per column
+        chunk = bucket * max(1, source.block_frames // bucket)
+        for first in range(0, source.frames, chunk):
+            mono = audio_io.to_mono(source.read(first, first + chunk))
+            if not len(mono):
+                break
+            buckets = np.pad(mono, (0, -len(mono) % bucket), mode="edge").reshape(-1, bucket)
+            lower.append(buckets.min(axis=1))
+            upper.append(buckets.max(axis=1))
+            S = librosa.feature.melspectrogram(y=mono, sr=sr, n_mels=n_mels, fmax=fmax, hop_length=OVERVIEW_HOP)
+            column = np.minimum(np.arange(S.shape[1]) * OVERVIEW_HOP // bucket, len(buckets) - 1)
+            sums = np.zeros((len(buckets), n_mels))
+            np.add.at(sums, column, S.T)
+            columns.append(sums / np.maximum(np.bincount(column, minlength=len(buckets)), 1)[:, None])
+    S_db = librosa.power_to_db(np.concatenate(columns).T, ref=np.max)
+    lower, upper = np.concatenate(lower), np.concatenate(upper)
+    return np.arange(len(lower)) * bucket / sr, lower, upper, S_db, sr
+
 def plot_features(audio_file, features):
-    y, sr = librosa.load(audio_file)
+    import librosa.display
+    import matplotlib.pyplot as plt
+
+    y, sr = audio_io.load(audio_file)
     plt.figure(figsize=(15, 6))
     librosa.display.waveshow(y, sr=sr, alpha=0.5)
     plt.title("Waveform with Features")
@@ -25,7 +68,9 @@ def plot_features(audio_file, features):
     plt.show()
 
 def simplified_waveform_with_segments(audio_file, segments):
-    y, sr = librosa.load(audio_file)
+    import matplotlib.pyplot as plt
+
+    y, sr = audio_io.load(audio_file)
     times = np.linspace(0, len(y) / sr, num=len(y))
     
     plt.figure(figsize=(12, 2))
@@ -76,6 +121,12 @@ class WaveformVisualizer:
         
         # Store colorbar reference
         self.colorbar = None
+
+        # Segments shown on the waveform; only the markers inside the current view are drawn
+        self.segment_index = IntervalIndex()
+        self.segment_artists = []
+        self.pending_artists = []  # start line of a manual segment still waiting for its end
+        self.click_connection = None
         
     def on_scroll(self, event):
         """Handle mouse wheel scrolling for zooming"""
@@ -105,34 +156,101 @@ class WaveformVisualizer:
         """Enable manual segmentation mode"""
         self.manual_mode = True
         self.temp_boundaries = []
-        self.canvas.mpl_connect('button_press_event', callback)
+        if self.click_connection is None:
+            self.click_connection = self.canvas.mpl_connect('button_press_event', callback)
         
     def disable_manual_mode(self):
         """Disable manual segmentation mode"""
         self.manual_mode = False
         self.temp_boundaries = []
+        self._remove_pending()
+        if self.click_connection is not None:
+            self.canvas.mpl_disconnect(self.click_connection)
+            self.click_connection = None
+
+    def _remove_pending(self):
+        for artist in self.pending_artists:
+            artist.remove()
+        self.pending_artists = []
         
     def add_boundary(self, time_clicked):
-        """Add a boundary line in manual mode"""
+        """
+        Add a boundary in manual mode. A start boundary is drawn as a pending line; an end
+        boundary completes the segment, which the caller then adds with add_segment.
+        """
         if len(self.temp_boundaries) % 2 == 0:
             # Start boundary (red)
-            self.ax_wave.axvline(x=time_clicked, color="red", linestyle="--", linewidth=0.7)
+            self.pending_artists.append(self.ax_wave.axvline(x=time_clicked, color="red", linestyle="--", linewidth=0.7))
         else:
-            # End boundary (blue)
-            self.ax_wave.axvline(x=time_clicked, color="blue", linestyle="-", linewidth=0.7)
-            # Add segment number
-            segment_num = len(self.temp_boundaries) // 2 + 1
-            segment_center = (self.temp_boundaries[-1] + time_clicked) / 2
-            self.ax_wave.text(segment_center, 0.8, f"{segment_num}", 
-                             color="black", fontsize=8, ha="center")
+            self._remove_pending()
         
         self.temp_boundaries.append(time_clicked)
         self.canvas.draw()
         
         return len(self.temp_boundaries) % 2 == 0  # Return True if segment is complete
 
+    def remove_last_boundary(self):
+        """
+        Undo the last manual boundary. Returns True if it was the end of a completed segment,
+        which the caller should then drop (remove_segment); its start becomes pending again.
+        """
+        if not self.temp_boundaries:
+            return False
+        completed = len(self.temp_boundaries) % 2 == 0
+        self.temp_boundaries.pop()
+        if completed:
+            start = self.temp_boundaries[-1]
+            self.pending_artists.append(self.ax_wave.axvline(x=start, color="red", linestyle="--", linewidth=0.7))
+        else:
+            self._remove_pending()
+        self.canvas.draw()
+        return completed
+
+    def set_segments(self, segments):
+        """Show these segments (numbered by position) on the waveform"""
+        self.segment_index = IntervalIndex.from_segments(segments)
+        self.draw_segment_markers()
+
+    def add_segment(self, start, end, segment_id):
+        self.segment_index.add([start], [end], [segment_id])
+        self.draw_segment_markers()
+
+    def remove_segment(self, segment_id):
+        self.segment_index.remove([segment_id])
+        self.draw_segment_markers()
+
+    def segment_at(self, time):
+        """Id (position in the shown list) of the segment under a time, or None"""
+        return self.segment_index.hit(time)
+
+    def draw_segment_markers(self, *_):
+        """Redraw the start/end markers (and numbers) of the segments inside the current x range"""
+        for artist in self.segment_artists:
+            artist.remove()
+        self.segment_artists = []
+        x_min, x_max = self.ax_wave.get_xlim()
+        ids, starts, ends = self.segment_index.query(x_min, x_max)
+        if len(ids):
+            # One collection per marker style instead of one line per boundary. They are added
+            # without updating the data limits, so drawing them cannot change the x range again.
+            from matplotlib.collections import LineCollection
+            transform = self.ax_wave.get_xaxis_transform()
+            for times, color, style in ((starts, "red", "--"), (ends, "blue", "-")):
+                lines = np.stack([np.column_stack([times, np.zeros(len(times))]),
+                                  np.column_stack([times, np.ones(len(times))])], axis=1)
+                markers = LineCollection(lines, colors=color, linestyles=style, linewidths=0.7, transform=transform)
+                self.segment_artists.append(self.ax_wave.add_collection(markers, autolim=False))
+        if len(ids) <= MAX_SEGMENT_LABELS:
+            for segment_id, start, end in zip(ids, starts, ends):
+                # Add segment number in the middle of the segment
+                self.segment_artists.append(self.ax_wave.text((start + end) / 2, 0.8, f"{segment_id + 1}",
+                                                              color="black", fontsize=8, ha="center"))
+        self.canvas.draw_idle()
+
     def plot_waveform(self, audio_file, segments=None):
         """Plot or update both waveform and spectrogram"""
+        import librosa.display
+
         # Remove existing colorbar if it exists
         if self.colorbar is not None:
             self.colorbar.remove()
@@ -142,27 +260,36 @@ class WaveformVisualizer:
         self.ax_wave.clear()
         self.ax_spec.clear()
         
-        # Load audio
-        y, sr = librosa.load(audio_file)
-        times = np.linspace(0, len(y) / sr, num=len(y))
-        self.time_range = [0, len(y) / sr]
+        if use_overview(audio_file):
+            # Long file: envelope and averaged spectrogram streamed from disk
+            times, lower, upper, S_db, sr = waveform_overview(audio_file)
+            self.time_range = [0, audio_io.native_info(audio_file).duration]
+            self.ax_wave.fill_between(times, lower, upper, color="orange", linewidth=0.8)
+            spec_options = dict(x_coords=times)
+        else:
+            # Load audio
+            y, sr = audio_io.load(audio_file)
+            times = np.linspace(0, len(y) / sr, num=len(y))
+            self.time_range = [0, len(y) / sr]
+            self.ax_wave.plot(times, y, color="orange", linewidth=0.8)
+            S = librosa.feature.melspectrogram(y=y, sr=sr, n_mels=128, fmax=8000)
+            S_db = librosa.power_to_db(S, ref=np.max)
+            spec_options = {}
         
         # Plot waveform
-        self.ax_wave.plot(times, y, color="orange", linewidth=0.8)
         self.ax_wave.set_title("Audio Waveform with Segments")
         self.ax_wave.set_xlabel("")
         self.ax_wave.set_ylabel("Amplitude")
         self.ax_wave.set_ylim([-1, 1])
         
-        # Create and plot spectrogram
-        S = librosa.feature.melspectrogram(y=y, sr=sr, n_mels=128, fmax=8000)
-        S_db = librosa.power_to_db(S, ref=np.max)
+        # Plot spectrogram
         img = librosa.display.specshow(S_db, 
                                      y_axis='mel', 
                                      x_axis='time',
                                      sr=sr,
                                      fmax=8000,
-                                     ax=self.ax_spec)
+                                     ax=self.ax_spec,
+                                     **spec_options)
         
         # Create new colorbar
         self.colorbar = self.fig.colorbar(img, ax=self.ax_spec, format='%+2.0f dB')
@@ -171,16 +298,11 @@ class WaveformVisualizer:
         self.ax_spec.set_xlabel("Time (s)")
         self.ax_spec.set_ylabel("Frequency (Hz)")
         
-        # Plot segments only on waveform if provided
-        if segments:
-            for i, (start, end) in enumerate(segments):
-                # Add lines and labels to waveform only
-                self.ax_wave.axvline(x=start, color="red", linestyle="--", linewidth=0.7)
-                self.ax_wave.axvline(x=end, color="blue", linestyle="-", linewidth=0.7)
-                # Add segment number in the middle of the segment
-                segment_center = (start + end) / 2
-                self.ax_wave.text(segment_center, 0.8, f"{i+1}", 
-                                color="black", fontsize=8, ha="center")
+        # Segment markers on the waveform only, redrawn for the visible range on every zoom/pan
+        self.segment_artists = []
+        self.pending_artists = []
+        self.ax_wave.callbacks.connect('xlim_changed', self.draw_segment_markers)
+        self.set_segments(segments or [])
         
         self.fig.tight_layout()
         self.canvas.draw()
@@ -189,6 +311,9 @@ class WaveformVisualizer:
         """Clear both visualizations"""
         self.ax_wave.clear()
         self.ax_spec.clear()
+        self.segment_index = IntervalIndex()
+        self.segment_artists = []
+        self.pending_artists = []
         
         self.ax_wave.set_title("Audio Waveform")
         self.ax_wave.set_xlabel("")
@@ -0,0 +1,225 @@
+"""
+Watch-folder ingestion daemon.
+
+    python batch.py watch /recordings/incoming --workers 4 --clusters 8 --stats watch_stats.json
+
+Polls one or more directories (os.scandir + stat), waits until a new or changed
+audio file's size and mtime have stayed the same for --settle seconds (so files
+still being copied are left alone), and runs it through the pipeline in a
+bounded, pre-warmed process pool. Progress is kept in a BatchManifest owned by the
+daemon process: files whose size and mtime, or else content hash, are unchanged
+since they were processed are skipped, and files that keep failing are quarantined.
+Hashes are computed on a background thread, so a large file does not hold up
+polling and collecting results. The manifest is appended to rather than rewritten
+(see manifest.py), and a file's segments and labels are kept out of it: the worker
+writes them to segments.json in the file's export folder and the manifest records
+only their number.
+
+Memory stays bounded during bursts: waiting files are only paths, and at most
+2 * workers jobs are handed to the pool at a time. Throughput, queue depth and
+counts are logged every --stats-interval seconds and optionally written to a JSON
+stats file.
+"""
+
+import json
+import logging
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import audio_io
+from manifest import file_hash
+from pipeline import init_worker
+
+logger = logging.getLogger(__name__)
+
+AUDIO_EXTENSIONS = (".wav", ".flac", ".aif", ".aiff")
+
+
+def _process(audio_file, options, model_path):
+    """
+    Worker side: run the full pipeline on one file. It exports to the file's own folder
+    (checkpoint_output_dir keyed by its path), from which earlier exports are cleared first.
+    """
+    from clustering import ClusterModel
+    from pipeline import checkpoint_output_dir, process_file
+    from utils import remove_exported_segments
+
+    start = time.perf_counter()
+    cluster_model = ClusterModel.load(model_path) if model_path else None
+    output_dir = checkpoint_output_dir(audio_file, output_root=options.get("output_root"))
+    remove_exported_segments(output_dir)
+    result = process_file(audio_file, cluster_model=cluster_model, output_dir=output_dir, **options)
+    result["segments"] = [[float(start_time), float(end_time)] for start_time, end_time in result["segments"]]
+    if result["output_dir"] is not None:
+        with open(os.path.join(output_dir, "segments.json"), "w") as f:
+            json.dump({"audio_file": audio_file, "segments": result["segments"], "labels": result["labels"]}, f)
+    return result, time.perf_counter() - start
+
+
+class FolderWatcher:
+    def __init__(self, directories, manifest, settings, options, model_path=None, workers=2, settle=2.0,
+                 poll_interval=1.0, recursive=False, stats_path=None, stats_interval=30.0):
+        self.directories = directories
+        self.manifest = manifest
+        self.settings = settings
+        self.options = options
+        self.model_path = model_path
+        self.workers = workers
+        self.settle = settle
+        self.poll_interval = poll_interval
+        self.recursive = recursive
+        self.stats_path = stats_path
+        self.stats_interval = stats_interval
+
+        self.seen = {}  # path -> (size, mtime_ns) when it was last handed on
+        self.changing = {}  # path -> ((size, mtime_ns), time that signature was first seen)
+        self.waiting = deque()  # settled paths waiting for a free worker
+        self.hashing = {}  # future of the content hash -> path
+        self.running = {}  # future -> (path, manifest entry, time queued)
+        self.counts = {"processed": 0, "failed": 0, "skipped": 0}
+        self.started = time.time()
+        self.latencies = deque(maxlen=100)
+        self.pool = None
+        self.hasher = ThreadPoolExecutor(max_workers=1)
+
+    def _files(self, directory):
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.name.startswith("."):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    if self.recursive:
+                        yield from self._files(entry.path)
+                elif entry.name.lower().endswith(AUDIO_EXTENSIONS):
+                    yield entry
+
+    def scan(self, now=None):
+        """Poll the directories once; settled new/changed files are appended to the waiting queue."""
+        now = time.time() if now is None else now
+        queued = set(self.waiting) | set(self.hashing.values()) | {path for path, _, _ in self.running.values()}
+        for directory in self.directories:
+            for entry in self._files(directory):
+                path = os.path.abspath(entry.path)
+                stat = entry.stat()
+                signature = (stat.st_size, stat.st_mtime_ns)
+                if self.seen.get(path) == signature or path in queued:
+                    continue
+                previous = self.changing.get(path)
+                if previous is None or previous[0] != signature:
+                    self.changing[path] = (signature, now)
+                elif now - previous[1] >= self.settle:
+                    del self.changing[path]
+                    self.seen[path] = signature
+                    self.waiting.append(path)
+
+    def _submit_waiting(self):
+        while self.waiting and len(self.running) + len(self.hashing) < 2 * self.workers:
+            path = self.waiting.popleft()
+            if not os.path.exists(path):
+                continue
+            if self.manifest.unchanged(path, self.settings, self.seen.get(path)):
+                self.counts["skipped"] += 1
+                continue
+            self.hashing[self.hasher.submit(file_hash, path)] = path
+
+    def _start(self, path, content_hash):
+        entry = self.manifest.begin(path, self.settings, content_hash=content_hash, signature=self.seen.get(path))
+        if entry is None:
+            self.counts["skipped"] += 1
+            return
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=init_worker,
+                                            initargs=(audio_io.settings(),),
+                                            mp_context=multiprocessing.get_context("spawn"))
+        future = self.pool.submit(_process, path, self.options, self.model_path)
+        self.running[future] = (path, entry, time.time())
+
+    def _collect(self, timeout):
+        if not (self.running or self.hashing):
+            time.sleep(timeout)
+            return
+        done, _ = wait(list(self.running) + list(self.hashing), timeout=timeout, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future in self.hashing:
+                path = self.hashing.pop(future)
+                try:
+                    content_hash = future.result()
+                except OSError as e:  # removed or unreadable since it settled
+                    logger.warning(f"Could not read {path}: {e}")
+                    self.seen.pop(path, None)
+                    continue
+                self._start(path, content_hash)
+                continue
+            path, entry, queued = self.running.pop(future)
+            try:
+                result, run_s = future.result()
+            except Exception as e:
+                if isinstance(e, BrokenProcessPool) and self.pool is not None:
+                    # A worker died (e.g. out of memory); the pool is unusable and is restarted on demand
+                    self.pool.shutdown(wait=False, cancel_futures=True)
+                    self.pool = None
+                self.manifest.fail(entry, f"{type(e).__name__}: {e}")
+                self.seen.pop(path, None)  # retried on a later poll until the manifest quarantines it
+                self.counts["failed"] += 1
+                logger.error(f"Failed to process {path}: {type(e).__name__}: {e}")
+                continue
+            output_dir = result["output_dir"] and os.path.abspath(result["output_dir"])
+            self.manifest.complete_stage(entry, "exported", run_s, n_segments=len(result["segments"]),
+                                         output_dir=output_dir)
+            self.manifest.finish(entry)
+            self.counts["processed"] += 1
+            self.latencies.append(time.time() - queued)
+            logger.info(f"Processed {path}: {len(result['segments'])} segments in {run_s:.1f}s")
+
+    def stats(self):
+        """Throughput, queue depth and counters."""
+        elapsed = max(time.time() - self.started, 1e-9)
+        return dict(
+            self.counts,
+            waiting=len(self.waiting),
+            hashing=len(self.hashing),
+            running=len(self.running),
+            settling=len(self.changing),
+            files_per_minute=round(60 * self.counts["processed"] / elapsed, 3),
+            mean_latency_s=round(sum(self.latencies) / len(self.latencies), 3) if self.latencies else None,
+            uptime_s=round(elapsed, 1),
+        )
+
+    def _report(self):
+        stats = self.stats()
+        logger.info(", ".join(f"{key}={value}" for key, value in stats.items()))
+        if self.stats_path:
+            tmp_path = self.stats_path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(stats, f)
+            os.replace(tmp_path, self.stats_path)
+
+    def run(self, until_idle=False):
+        """
+        Watch until interrupted. With until_idle, return once nothing is settling,
+        waiting or running (handy for one-shot ingestion and tests).
+        """
+        logger.info(f"Watching {', '.join(self.directories)} with {self.workers} workers")
+        last_report = time.time()
+        try:
+            while True:
+                self.scan()
+                self._submit_waiting()
+                self._collect(self.poll_interval)
+                if time.time() - last_report >= self.stats_interval:
+                    self._report()
+                    last_report = time.time()
+                if until_idle and not (self.changing or self.waiting or self.hashing or self.running):
+                    break
+        except KeyboardInterrupt:
+            logger.info("Stopping watcher")
+        finally:
+            self._report()
+            self.manifest.save()  # fold the journal into the manifest file
+            self.hasher.shutdown(cancel_futures=True)
+            if self.pool is not None:
+                self.pool.shutdown(cancel_futures=True)
@@ -0,0 +1,381 @@
+"""
+Shared-filesystem work queue for running the batch pipeline on several hosts.
+
+    python batch.py queue-init /shared/nightly /archive/*.wav --clusters 8
+    python batch.py queue-work /shared/nightly --workers 4      # on every host
+    python batch.py queue-merge /shared/nightly --out nightly_manifest.json
+
+Layout of a queue directory:
+    queue.json               pipeline settings, model, lease length, max attempts (fixed at init)
+    tasks/<id>.json          one per input file: its path and the number of claims so far
+    leases/<id>.lease        present while a worker holds the task: worker, host, pid, expiry
+    done/<id>.json           written once the task is finished or quarantined
+    manifests/<worker>.json  a BatchManifest per worker (shard): stages, segments, timings
+    output/<id>/             default export folder, one per task
+
+A worker claims a task by creating its lease file with O_CREAT | O_EXCL, which only one
+worker can win (also over NFSv3 and later). While it runs the pipeline a heartbeat
+thread pushes the expiry forward; if the worker dies, the lease runs out after
+lease_seconds and another worker takes the task over by renaming the stale lease away
+(again only one rename wins) and claiming it afresh. Expiry times are wall-clock, so
+the hosts' clocks must be synchronised (NTP). Claims are counted per task, so crashed
+attempts count too, and a task claimed more than max_attempts times is quarantined.
+
+A lease is only renewed or released while at least RENEW_MARGIN of it is left: a
+worker whose lease is closer to expiry than that treats it as lost, because another
+worker may be taking it over, and rewriting or removing the file could hit the new
+owner's lease.
+
+Delivery is at-least-once: a worker that stalls for longer than its lease can lose
+the task to another one while still finishing it. Every task exports into its own
+folder (<output_root>/<id>/), so only attempts at the same task share one, and a
+segment's file name depends only on the file and the settings: the stalled attempt
+can only replace segment files with identical ones, so the duplicate work is harmless.
+
+Each worker only writes its own manifest; merge_manifests combines them into one.
+"""
+
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import random
+import socket
+import threading
+import time
+
+import audio_io
+from manifest import BatchManifest
+
+logger = logging.getLogger(__name__)
+
+QUEUE_VERSION = 1
+DEFAULT_LEASE_SECONDS = 300.0
+RENEW_MARGIN = 0.25  # fraction of the lease that must be left to renew or release it
+# Queue-wide settings that make every host analyse the same way; the memory budget stays per host
+SHARED_AUDIO_SETTINGS = ["analysis_sr", "resampler"]
+
+
+def task_id(audio_file):
+    """Stable task name for a file: a hash of its absolute path."""
+    return hashlib.sha1(os.path.abspath(audio_file).encode()).hexdigest()[:20]
+
+
+def _read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):  # gone, or a lease still being written by its claimer
+        return None
+
+
+def _write_json_atomic(path, data):
+    # Unique temporary name: several hosts may write into the same directory
+    tmp_path = f"{path}.{socket.gethostname()}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=1)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def init_queue(path, audio_files, settings, options, model_path=None, lease_seconds=DEFAULT_LEASE_SECONDS,
+               max_attempts=3):
+    """
+    Create the queue directory (or add files to an existing one with the same settings).
+    settings are recorded in every shard manifest; options are the process_file keyword
+    arguments (without n_jobs and cluster_model). Returns the number of tasks added.
+    """
+    for name in ("tasks", "leases", "done", "manifests"):
+        os.makedirs(os.path.join(path, name), exist_ok=True)
+    if options.get("output_root") is None:
+        options = dict(options, output_root=os.path.join(path, "output"))
+    options = dict(options, output_root=os.path.abspath(options["output_root"]))
+    config = {
+        "version": QUEUE_VERSION,
+        "settings": settings,
+        "options": options,
+        "model": os.path.abspath(model_path) if model_path else None,
+        "audio_io": {name: audio_io.settings()[name] for name in SHARED_AUDIO_SETTINGS},
+        "lease_seconds": lease_seconds,
+        "max_attempts": max_attempts,
+    }
+    config_path = os.path.join(path, "queue.json")
+    existing = _read_json(config_path)
+    if existing is None:
+        _write_json_atomic(config_path, config)
+    elif any(existing[name] != config[name] for name in ("settings", "options", "model")):
+        raise ValueError(f"Queue {path} was created with different settings")
+
+    added = 0
+    for audio_file in audio_files:
+        task_path = os.path.join(path, "tasks", task_id(audio_file) + ".json")
+        if not os.path.exists(task_path):
+            _write_json_atomic(task_path, {"audio_file": os.path.abspath(audio_file), "claims": 0})
+            added += 1
+    return added
+
+
+class WorkQueue:
+    def __init__(self, path):
+        self.path = path
+        self.config = _read_json(os.path.join(path, "queue.json"))
+        if self.config is None:
+            raise FileNotFoundError(f"{path} is not a work queue (no queue.json)")
+        if self.config.get("version") != QUEUE_VERSION:
+            raise ValueError(f"Unsupported queue version {self.config.get('version')} in {path}")
+        self.lease_seconds = self.config["lease_seconds"]
+
+    def _path(self, kind, task, suffix):
+        return os.path.join(self.path, kind, task + suffix)
+
+    def tasks(self):
+        return sorted(name[:-5] for name in os.listdir(os.path.join(self.path, "tasks")) if name.endswith(".json"))
+
+    def task(self, task):
+        return _read_json(self._path("tasks", task, ".json"))
+
+    def is_done(self, task):
+        return os.path.exists(self._path("done", task, ".json"))
+
+    def lease(self, task):
+        return _read_json(self._path("leases", task, ".lease"))
+
+    def _lease_record(self, worker):
+        return {"worker": worker, "host": socket.gethostname(), "pid": os.getpid(),
+                "expires": time.time() + self.lease_seconds}
+
+    def claim(self, task, worker):
+        """Try to take the lease on a task. True if this worker now holds it."""
+        lease_path = self._path("leases", task, ".lease")
+        lease = _read_json(lease_path)
+        if lease is not None:
+            if lease["expires"] > time.time():
+                return False
+            # Expired: move it aside. Only one worker's rename succeeds; if the lease was
+            # renewed or replaced in the meantime, put it back.
+            stale_path = f"{lease_path}.{worker}.stale"
+            try:
+                os.rename(lease_path, stale_path)
+            except FileNotFoundError:
+                return False
+            stale = _read_json(stale_path)
+            if stale is not None and stale["expires"] > time.time():
+                try:
+                    os.link(stale_path, lease_path)
+                except FileExistsError:
+                    pass
+                os.remove(stale_path)
+                return False
+            os.remove(stale_path)
+            logger.info(f"Taking over task {task} from {lease['worker']} on {lease['host']} (lease expired)")
+        try:
+            fd = os.open(lease_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, "w") as f:
+            json.dump(self._lease_record(worker), f)
+        return True
+
+    def _holds(self, lease, worker):
+        """True if lease is worker's own and far enough from expiry that nobody can be taking it over."""
+        return (lease is not None and lease["worker"] == worker
+                and lease["expires"] - time.time() >= RENEW_MARGIN * self.lease_seconds)
+
+    def renew(self, task, worker):
+        """
+        Extend a held lease. False if the lease has been lost to another worker, or is
+        about to expire (then it may be being taken over, and counts as lost).
+        """
+        lease_path = self._path("leases", task, ".lease")
+        if not self._holds(_read_json(lease_path), worker):
+            return False
+        _write_json_atomic(lease_path, self._lease_record(worker))
+        return True
+
+    def release(self, task, worker):
+        """Remove a held lease; a lost or nearly expired one is left for the next claimer to move aside."""
+        lease_path = self._path("leases", task, ".lease")
+        if self._holds(_read_json(lease_path), worker):
+            os.remove(lease_path)
+
+    def count_claim(self, task):
+        """Record a claim (call while holding the lease). Returns the claims so far, this one included."""
+        record = self.task(task)
+        record["claims"] += 1
+        _write_json_atomic(self._path("tasks", task, ".json"), record)
+        return record["claims"]
+
+    def complete(self, task, worker, status, **data):
+        """Mark a task finished ("done") or given up on ("quarantined") and release its lease."""
+        _write_json_atomic(self._path("done", task, ".json"),
+                           dict(data, status=status, worker=worker, finished=time.time()))
+        self.release(task, worker)
+
+    def status(self):
+        """Number of tasks per state: done, quarantined, running (live lease) and pending."""
+        counts = {"done": 0, "quarantined": 0, "running": 0, "pending": 0}
+        now = time.time()
+        for task in self.tasks():
+            done = _read_json(self._path("done", task, ".json"))
+            if done is not None:
+                counts[done["status"]] += 1
+                continue
+            lease = self.lease(task)
+            counts["running" if lease is not None and lease["expires"] > now else "pending"] += 1
+        return counts
+
+
+class QueueWorker:
+    """One shard: claims tasks one at a time and runs the checkpointed pipeline on them."""
+
+    def __init__(self, queue, worker_id=None, n_jobs=1):
+        self.queue = queue
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.manifest = BatchManifest(os.path.join(queue.path, "manifests", self.worker_id + ".json"),
+                                      max_attempts=queue.config["max_attempts"])
+        self.options = dict(queue.config["options"], n_jobs=n_jobs)
+        self.output_root = self.options.pop("output_root")
+        self.cluster_model = None
+        if queue.config["model"]:
+            from clustering import ClusterModel
+            self.cluster_model = ClusterModel.load(queue.config["model"])
+        self.counts = {"processed": 0, "failed": 0, "quarantined": 0}
+
+    def _heartbeat(self, task, stop):
+        while not stop.wait(self.queue.lease_seconds / 3):
+            if not self.queue.renew(task, self.worker_id):
+                logger.warning(f"Lost the lease on task {task}; another worker may be processing it too")
+                return
+
+    def run_task(self, task):
+        """Process a claimed task and record the outcome in the queue."""
+        from pipeline import process_file_checkpointed
+
+        if self.queue.is_done(task):  # finished by someone else between listing and claiming
+            self.queue.release(task, self.worker_id)
+            return
+        audio_file = self.queue.task(task)["audio_file"]
+        claims = self.queue.count_claim(task)
+        if claims > self.queue.config["max_attempts"]:
+            logger.warning(f"Quarantining {audio_file} after {claims - 1} unfinished attempts")
+            self.queue.complete(task, self.worker_id, "quarantined", audio_file=audio_file,
+                                error="attempts exhausted (workers died while processing)")
+            self.counts["quarantined"] += 1
+            return
+
+        stop = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(task, stop), daemon=True)
+        heartbeat.start()
+        try:
+            logger.info(f"[{self.worker_id}] {audio_file} (attempt {claims})")
+            process_file_checkpointed(audio_file, self.manifest, self.queue.config["settings"],
+                                      output_root=os.path.join(self.output_root, task),
+                                      cluster_model=self.cluster_model, **self.options)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            logger.error(f"Failed to process {audio_file}: {error}")
+            self.counts["failed"] += 1
+            if claims >= self.queue.config["max_attempts"]:
+                self.queue.complete(task, self.worker_id, "quarantined", audio_file=audio_file, error=error)
+                self.counts["quarantined"] += 1
+            else:
+                self.queue.release(task, self.worker_id)  # left for any worker to retry
+            return
+        finally:
+            stop.set()
+            heartbeat.join()
+
+        # Also reached when this shard's manifest already had the file finished or quarantined
+        entry = self.manifest.entry(audio_file)
+        status = "quarantined" if entry["status"] == "quarantined" else "done"
+        self.queue.complete(task, self.worker_id, status, audio_file=audio_file, error=entry["error"],
+                            segments=len(entry["segments"] or []), output_dir=entry["output_dir"])
+        self.counts["processed"] += 1
+
+    def run(self, poll_interval=5.0):
+        """Work until every task is done or quarantined; waits on tasks other workers hold."""
+        logger.info(f"Worker {self.worker_id} on queue {self.queue.path}")
+        while True:
+            pending = [task for task in self.queue.tasks() if not self.queue.is_done(task)]
+            if not pending:
+                break
+            random.shuffle(pending)  # workers that start together fan out over the queue
+            claimed = False
+            for task in pending:
+                if self.queue.claim(task, self.worker_id):
+                    claimed = True
+                    self.run_task(task)
+            if not claimed:
+                time.sleep(poll_interval)
+        self.manifest.save()  # fold the journal into the shard manifest
+        logger.info(f"Worker {self.worker_id} finished: "
+                    + ", ".join(f"{count} {name}" for name, count in self.counts.items()))
+        return self.counts
+
+
+def _worker_main(path, worker_id, n_jobs, audio_settings, poll_interval, log_level):
+    from pipeline import init_worker
+
+    logging.basicConfig(level=log_level, format="%(message)s")
+    queue = WorkQueue(path)
+    init_worker(dict(audio_settings, **queue.config["audio_io"]))
+    QueueWorker(queue, worker_id, n_jobs).run(poll_interval)
+
+
+def run_workers(path, workers=1, worker_id=None, n_jobs=1, poll_interval=5.0):
+    """
+    Run `workers` queue workers on this host, each in its own process and with its own
+    shard manifest (ids <worker_id or host-pid>-<n>). Returns when the queue is drained.
+    """
+    prefix = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    context = multiprocessing.get_context("spawn")
+    processes = [context.Process(target=_worker_main,
+                                 args=(path, f"{prefix}-{n}", n_jobs, audio_io.settings(), poll_interval,
+                                       logging.getLogger().level))
+                 for n in range(workers)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    return [process.exitcode for process in processes]
+
+
+def _rank(entry):
+    return entry["status"] == "done", entry.get("finished", 0), entry["attempts"]
+
+
+def merge_manifests(path, output):
+    """
+    Combine the shard manifests of a queue into one BatchManifest at `output`. A file
+    handled by several workers (after a lease takeover) keeps its finished entry, or
+    the most advanced one, tagged with the shard it came from. Quarantines recorded in
+    the queue are applied. Returns the merged manifest.
+    """
+    queue = WorkQueue(path)
+    merged = BatchManifest(output)
+    merged.files = {}
+    manifests = os.path.join(path, "manifests")
+    # A shard whose worker died may only have its journal so far
+    shards = {name.removesuffix(".journal") for name in os.listdir(manifests)
+              if name.endswith((".json", ".json.journal"))}
+    for name in sorted(shards):
+        shard = BatchManifest(os.path.join(manifests, name))
+        for key, entry in shard.files.items():
+            entry = dict(entry, shard=name[:-5])
+            current = merged.files.get(key)
+            if current is None or _rank(entry) > _rank(current):
+                merged.files[key] = entry
+
+    for task in queue.tasks():
+        done = _read_json(os.path.join(path, "done", task + ".json"))
+        if done is None or done["status"] != "quarantined":
+            continue
+        entry = merged.files.setdefault(done["audio_file"], {
+            "hash": None, "settings": queue.config["settings"], "stage": None, "attempts": 0, "segments": None,
+            "labels": None, "output_dir": None, "exported": [], "timings": {}, "shard": done["worker"]})
+        if entry.get("status") != "done":
+            entry.update(status="quarantined", error=done["error"])
+    merged.save()
+    return merged